@@ -0,0 +1,281 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+
+class AdmissionTimeout(Exception):
+    """No capacity for a model call became free within the allowed wait."""
+
+
+class AdmissionController:
+    """Admission control for model calls, shared by every worker process on the host.
+
+    State lives in a small SQLite file so all processes see the same limits:
+
+    - at most ``max_concurrency`` calls in flight (0 for no limit)
+    - token buckets for ``requests_per_minute`` and ``tokens_per_minute``
+    - a global pause after the provider answers 429, for its retry-after
+
+    Callers wait in a queue that is fair between users: the next call admitted
+    is the oldest waiting call of the user with the fewest calls in flight,
+    then of the user served least recently, so one user's burst cannot starve
+    everyone else. A slot held by a process that
+    died is released once its pid is gone or its lease expires.
+    """
+
+    def __init__(self, path, max_concurrency=8, requests_per_minute=50, tokens_per_minute=40000,
+                 max_wait=30.0, poll_interval=0.1, lease_seconds=600):
+        self.path = path
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.host = socket.gethostname()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._released = threading.Condition()
+        self.counters = {'admitted': 0, 'timeouts': 0, 'rate_limited': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+        with self._transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS admission_state ('
+                         'id INTEGER PRIMARY KEY CHECK (id = 1), request_tokens REAL NOT NULL, '
+                         'token_tokens REAL NOT NULL, refilled_at REAL NOT NULL, blocked_until REAL NOT NULL)')
+            conn.execute('INSERT OR IGNORE INTO admission_state VALUES (1, ?, ?, ?, 0)',
+                         (requests_per_minute, tokens_per_minute, time.time()))
+            conn.execute('CREATE TABLE IF NOT EXISTS admission_queue ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, owner TEXT NOT NULL, '
+                         'tokens INTEGER NOT NULL, seen_at REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS admission_lease ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, owner TEXT NOT NULL, '
+                         'tokens INTEGER NOT NULL, expires_at REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS admission_served (user_id INTEGER, served_at REAL NOT NULL)')
+
+    @property
+    def enabled(self):
+        return bool(self.max_concurrency or self.requests_per_minute or self.tokens_per_minute)
+
+    @contextmanager
+    def slot(self, user_id, tokens, wait=None):
+        """Hold one model call slot for ``user_id``, waiting up to ``wait`` seconds for it.
+
+        ``tokens`` is the estimated prompt plus completion size, taken from the
+        tokens-per-minute bucket up front; ``Slot.settle`` returns the difference
+        once the real usage is known.
+        """
+        if not self.enabled:
+            yield Slot(self, None, tokens)
+            return
+        tokens = self._clamp(tokens)
+        ticket, deadline, started = self._enqueue(user_id, tokens, wait)
+        try:
+            while True:
+                lease = self._try_admit(ticket, user_id, tokens)
+                if lease is not None:
+                    break
+                self._wait_for_capacity(ticket, deadline)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        self._record_wait(time.monotonic() - started)
+        try:
+            yield Slot(self, lease, tokens)
+        finally:
+            self._release(lease)
+
+    @asynccontextmanager
+    async def async_slot(self, user_id, tokens, wait=None):
+        """``slot`` for coroutines; waiting does not block the event loop."""
+        if not self.enabled:
+            yield Slot(self, None, tokens)
+            return
+        tokens = self._clamp(tokens)
+        ticket, deadline, started = await asyncio.to_thread(self._enqueue, user_id, tokens, wait)
+        try:
+            while True:
+                lease = await asyncio.to_thread(self._try_admit, ticket, user_id, tokens)
+                if lease is not None:
+                    break
+                if time.monotonic() >= deadline:
+                    self._timed_out(ticket)
+                await asyncio.sleep(self.poll_interval)
+        except BaseException:
+            await asyncio.to_thread(self._dequeue, ticket)
+            raise
+        self._record_wait(time.monotonic() - started)
+        try:
+            yield Slot(self, lease, tokens)
+        finally:
+            await asyncio.to_thread(self._release, lease)
+
+    def pause(self, seconds):
+        """Stop admitting calls in every worker for ``seconds`` (after a provider 429)."""
+        with self._transaction() as conn:
+            conn.execute('UPDATE admission_state SET blocked_until = MAX(blocked_until, ?) WHERE id = 1',
+                         (time.time() + seconds,))
+        with self._lock:
+            self.counters['rate_limited'] += 1
+
+    def stats(self):
+        with self._transaction() as conn:
+            self._cleanup(conn, time.time())
+            queued = conn.execute('SELECT COUNT(*), COUNT(DISTINCT user_id) FROM admission_queue').fetchone()
+            in_flight = conn.execute('SELECT COUNT(*) FROM admission_lease').fetchone()[0]
+            blocked_until = conn.execute('SELECT blocked_until FROM admission_state WHERE id = 1').fetchone()[0]
+        with self._lock:
+            stats = dict(self.counters)
+        stats.update(queue_depth=queued[0], queued_users=queued[1], in_flight=in_flight,
+                     paused_for=max(0.0, blocked_until - time.time()),
+                     max_concurrency=self.max_concurrency, requests_per_minute=self.requests_per_minute,
+                     tokens_per_minute=self.tokens_per_minute)
+        stats['average_wait_seconds'] = stats['wait_seconds'] / stats['admitted'] if stats['admitted'] else 0.0
+        return stats
+
+    def _clamp(self, tokens):
+        # A call bigger than the whole bucket could never be admitted
+        return min(tokens, self.tokens_per_minute) if self.tokens_per_minute else tokens
+
+    def _enqueue(self, user_id, tokens, wait):
+        with self._transaction() as conn:
+            ticket = conn.execute('INSERT INTO admission_queue (user_id, owner, tokens, seen_at) VALUES (?, ?, ?, ?)',
+                                  (user_id, self._owner(), tokens, time.time())).lastrowid
+        started = time.monotonic()
+        return ticket, started + (self.max_wait if wait is None else wait), started
+
+    def _dequeue(self, ticket):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM admission_queue WHERE id = ?', (ticket,))
+
+    def _try_admit(self, ticket, user_id, tokens):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute('UPDATE admission_queue SET seen_at = ? WHERE id = ?', (now, ticket))
+            self._cleanup(conn, now)
+            request_tokens, token_tokens, blocked_until = self._refill(conn, now)
+            if blocked_until > now:
+                return None
+            if self.max_concurrency and \
+                    conn.execute('SELECT COUNT(*) FROM admission_lease').fetchone()[0] >= self.max_concurrency:
+                return None
+            # The head of each user's queue competes: fewest calls in flight first,
+            # then the user served longest ago, then the oldest call
+            next_ticket = conn.execute(
+                'SELECT q.id, q.tokens FROM admission_queue q '
+                'WHERE q.id = (SELECT MIN(id) FROM admission_queue WHERE user_id IS q.user_id) '
+                'ORDER BY (SELECT COUNT(*) FROM admission_lease l WHERE l.user_id IS q.user_id), '
+                'COALESCE((SELECT served_at FROM admission_served s WHERE s.user_id IS q.user_id), 0), q.id '
+                'LIMIT 1').fetchone()
+            if next_ticket is None or next_ticket[0] != ticket:
+                return None
+            tokens = next_ticket[1]
+            if (self.requests_per_minute and request_tokens < 1) or \
+                    (self.tokens_per_minute and token_tokens < tokens):
+                return None
+            conn.execute('UPDATE admission_state SET request_tokens = request_tokens - ?, '
+                         'token_tokens = token_tokens - ? WHERE id = 1',
+                         (1 if self.requests_per_minute else 0, tokens if self.tokens_per_minute else 0))
+            conn.execute('DELETE FROM admission_queue WHERE id = ?', (ticket,))
+            conn.execute('DELETE FROM admission_served WHERE user_id IS ?', (user_id,))
+            conn.execute('INSERT INTO admission_served VALUES (?, ?)', (user_id, now))
+            lease = conn.execute('INSERT INTO admission_lease (user_id, owner, tokens, expires_at) VALUES (?, ?, ?, ?)',
+                                 (user_id, self._owner(), tokens, now + self.lease_seconds)).lastrowid
+        with self._lock:
+            self.counters['admitted'] += 1
+        return lease
+
+    def _refill(self, conn, now):
+        request_tokens, token_tokens, refilled_at, blocked_until = conn.execute(
+            'SELECT request_tokens, token_tokens, refilled_at, blocked_until FROM admission_state WHERE id = 1'
+        ).fetchone()
+        elapsed = max(0.0, now - refilled_at)
+        request_tokens = min(self.requests_per_minute, request_tokens + elapsed * self.requests_per_minute / 60)
+        token_tokens = min(self.tokens_per_minute, token_tokens + elapsed * self.tokens_per_minute / 60)
+        conn.execute('UPDATE admission_state SET request_tokens = ?, token_tokens = ?, refilled_at = ? WHERE id = 1',
+                     (request_tokens, token_tokens, now))
+        return request_tokens, token_tokens, blocked_until
+
+    def _cleanup(self, conn, now):
+        # Waiters poll every poll_interval; one that stopped polling is gone
+        conn.execute('DELETE FROM admission_queue WHERE seen_at < ?', (now - max(10.0, self.poll_interval * 50),))
+        conn.execute('DELETE FROM admission_lease WHERE expires_at < ?', (now,))
+        conn.execute('DELETE FROM admission_served WHERE served_at < ?', (now - self.lease_seconds,))
+        for lease_id, owner in conn.execute('SELECT id, owner FROM admission_lease').fetchall():
+            host, pid = owner.rsplit(':', 1)
+            if host == self.host and not _pid_alive(int(pid)):
+                conn.execute('DELETE FROM admission_lease WHERE id = ?', (lease_id,))
+
+    def _wait_for_capacity(self, ticket, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._timed_out(ticket)
+        # Slots released in this process wake us at once; other processes are seen on the next poll
+        with self._released:
+            self._released.wait(min(remaining, self.poll_interval))
+
+    def _timed_out(self, ticket):
+        with self._lock:
+            self.counters['timeouts'] += 1
+        raise AdmissionTimeout(f"No model call capacity became free for queued call {ticket}")
+
+    def _release(self, lease):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM admission_lease WHERE id = ?', (lease,))
+        with self._released:
+            self._released.notify_all()
+
+    def _refund(self, tokens):
+        if not self.tokens_per_minute or not tokens:
+            return
+        with self._transaction() as conn:
+            conn.execute('UPDATE admission_state SET token_tokens = MIN(?, token_tokens + ?) WHERE id = 1',
+                         (self.tokens_per_minute, tokens))
+
+    def _record_wait(self, waited):
+        with self._lock:
+            self.counters['wait_seconds'] += waited
+            self.counters['max_wait_seconds'] = max(self.counters['max_wait_seconds'], waited)
+
+    def _owner(self):
+        return f"{self.host}:{os.getpid()}"
+
+    @contextmanager
+    def _transaction(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        # IMMEDIATE takes the write lock up front so admission decisions are serialized
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+
+class Slot:
+    def __init__(self, controller, lease, tokens):
+        self.controller = controller
+        self.lease = lease
+        self.tokens = tokens
+
+    def settle(self, used_tokens):
+        """Give back the part of the estimate the call did not use."""
+        if self.lease is not None and used_tokens < self.tokens:
+            self.controller._refund(self.tokens - used_tokens)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
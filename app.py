@@ -1,37 +1,133 @@
+import base64
 import json
-from json.decoder import JSONDecodeError
 import os
+import random
+import time
+import zlib
 import logging
+from collections import namedtuple
+import click
 from logging.handlers import RotatingFileHandler
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_from_directory
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_from_directory, Response, stream_with_context, g, has_request_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, current_user, logout_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, or_, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.mutable import MutableDict
+from sqlalchemy.orm import defer, deferred, load_only, undefer
 from sqlalchemy.dialects.sqlite import JSON
 from flask_migrate import Migrate
 import anthropic
 from datetime import datetime
 from dotenv import load_dotenv
+import sqlite3
+
+from config import Config
 
 # Import the new framework and prompt template
 from decision_framework import PERSONAL_DECISION_FRAMEWORK
-from prompt_template import generate_prompt
+from prompt_template import (SUGGESTION_TOOLS, SYSTEM_BLOCKS, SYSTEM_PROMPT_DIGEST, generate_step_request,
+                             step_tool_choice)
+from suggestion_stream import SuggestionStreamParser
+from json_repair import is_valid_json, load_json
+from jobs import JobQueue
+from suggestion_cache import SuggestionCache
+from context_compaction import ContextCompactor, estimate_tokens
+from admission import AdmissionController, AdmissionTimeout
+from single_flight import SingleFlight
+from step_resolver import StepResolver
+from metrics import Registry, COUNT_BUCKETS
+from batch_pipeline import message_batches, run_batches, token_cost
+from compression import CompressedJSON, CompressedText
+from scoring import DecisionMatrix, score_decision
+from search import (create_search_table, find_decisions, highlighted, index_decision, remove_decision,
+                    update_search_column, update_step_text)
+from validators import StepValidator
 
 load_dotenv()
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///decisions.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['ANTHROPIC_API_KEY'] = os.environ.get('ANTHROPIC_API_KEY')
+app.config.from_object(Config)
 
 db = SQLAlchemy(app)
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    db_queries.inc()
+    db_query_seconds.inc(elapsed)
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_seconds += elapsed
+
 migrate = Migrate(app, db)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
-client = anthropic.Anthropic(api_key=app.config['ANTHROPIC_API_KEY'])
+if app.config['USE_FAKE_ANTHROPIC']:
+    from fake_anthropic import FakeAnthropic
+    client = FakeAnthropic(chunk_delay=0.02)
+else:
+    client = anthropic.Anthropic(api_key=app.config['ANTHROPIC_API_KEY'])
+
+suggestion_cache = SuggestionCache(max_entries=app.config['SUGGESTION_CACHE_SIZE'],
+                                   ttl=app.config['SUGGESTION_CACHE_TTL'],
+                                   persistent_path=app.config['SUGGESTION_CACHE_PATH'])
+context_compactor = ContextCompactor()
+step_resolver = StepResolver(PERSONAL_DECISION_FRAMEWORK)
+step_validator = StepValidator(PERSONAL_DECISION_FRAMEWORK)
+
+os.makedirs(app.instance_path, exist_ok=True)
+admission = AdmissionController(app.config['ADMISSION_DB_PATH'] or os.path.join(app.instance_path, 'admission.db'),
+                                max_concurrency=app.config['ANTHROPIC_MAX_CONCURRENCY'],
+                                requests_per_minute=app.config['ANTHROPIC_REQUESTS_PER_MINUTE'],
+                                tokens_per_minute=app.config['ANTHROPIC_TOKENS_PER_MINUTE'],
+                                max_wait=app.config['ANTHROPIC_QUEUE_TIMEOUT'])
+single_flight = SingleFlight(app.config['SINGLE_FLIGHT_LOCK_DIR'] or os.path.join(app.instance_path, 'single_flight'))
+
+# Metrics, served in Prometheus text format on /metrics
+metrics = Registry()
+http_request_seconds = metrics.histogram('http_request_duration_seconds',
+                                         'Time to the response headers, by route', ('method', 'route', 'status'))
+db_queries_per_request = metrics.histogram('db_queries_per_request', 'SQL statements per request',
+                                           buckets=COUNT_BUCKETS)
+db_seconds_per_request = metrics.histogram('db_time_per_request_seconds', 'Time in SQL statements per request')
+db_queries = metrics.counter('db_queries_total', 'SQL statements executed')
+db_query_seconds = metrics.counter('db_query_seconds_total', 'Time spent in SQL statements')
+llm_request_seconds = metrics.histogram('llm_request_duration_seconds',
+                                        'Model call latency to the last token, admission wait excluded', ('call',))
+llm_first_token_seconds = metrics.histogram('llm_time_to_first_token_seconds',
+                                            'Streamed model call latency to the first text chunk', ('call',))
+llm_tokens = metrics.counter('llm_tokens_total', 'Tokens reported in response.usage', ('call', 'direction'))
+scoring_seconds = metrics.histogram('scoring_duration_seconds',
+                                    'Time to score an evaluations matrix, sensitivity samples included')
+step_validation_rejections = metrics.counter('step_validation_rejections_total',
+                                             'Step data rejected by the field validators, by source '
+                                             '(a submission, or AI pre_filled_data fields dropped)', ('source',))
+ai_response_parses = metrics.counter('ai_response_parse_total',
+                                     'Model replies by how they parsed (valid JSON, repaired, or unusable) '
+                                     'and output mode (text, or tool input)', ('outcome', 'mode'))
+suggestion_regenerations = metrics.counter('suggestion_regenerations_total',
+                                           'Suggestions the user asked to regenerate instead of taking the cached one')
+metrics.collect('suggestion_cache', 'Suggestion cache', suggestion_cache.stats)
+metrics.collect('context_compaction', 'Prompt context compaction', context_compactor.stats)
+metrics.collect('step_resolver', 'Step dependency resolution', step_resolver.stats)
+metrics.collect('admission', 'Model call admission control', admission.stats)
+metrics.collect('single_flight', 'Coalesced suggestion requests', single_flight.stats)
 
 # Set up logging
 if not app.debug:
@@ -45,6 +141,23 @@ if not app.debug:
     app.logger.setLevel(logging.INFO)
     app.logger.info('Decision Maker startup')
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_started' in g:
+        # Streamed bodies are still being sent at this point
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_request_seconds.observe(time.perf_counter() - g.request_started,
+                                     method=request.method, route=route, status=response.status_code)
+        db_queries_per_request.observe(g.db_queries)
+        db_seconds_per_request.observe(g.db_seconds)
+    return response
+
 # User model
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -57,27 +170,145 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+def compressed(type_class):
+    # A new instance per column: MutableDict.as_mutable applies to every column sharing one
+    return type_class(app.config['COMPRESSION_CODEC'], app.config['COMPRESSION_MIN_BYTES'])
+
 # Decision model
 class Decision(db.Model):
+    __table_args__ = (db.Index('ix_decision_user_id_created_at', 'user_id', 'created_at'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     question = db.Column(db.String(500), nullable=False)
     framework = db.Column(db.String(50), nullable=False)
-    data = db.Column(MutableDict.as_mutable(JSON), nullable=False, default={})
+    # Step data lives in DecisionStep; this holds what older decisions stored here
+    data = deferred(db.Column(MutableDict.as_mutable(compressed(CompressedJSON)), nullable=False, default={}))
     current_step = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     status = db.Column(db.String(20), default='in_progress')
-    summary = db.Column(db.Text)
+    # Deferred: only the details page and the summary job read it
+    summary = deferred(db.Column(compressed(CompressedText)))
+    # Bumped on every change; drives ETags and the changes endpoint
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    steps = db.relationship('DecisionStep', backref='decision', lazy='dynamic', cascade='all, delete-orphan')
+
+    def load_steps(self, step_indices=None, suggestions=False):
+        """Return {step_index: DecisionStep} for the given steps, or for all saved steps.
+
+        AI suggestions are deferred unless ``suggestions`` is true.
+        """
+        query = self.steps.order_by(DecisionStep.step_index)
+        if suggestions:
+            query = query.options(undefer(DecisionStep.ai_suggestion))
+        if step_indices is not None:
+            query = query.filter(DecisionStep.step_index.in_(list(step_indices)))
+        return {row.step_index: row for row in query}
+
+    def step_data(self, step_indices=None):
+        """Return {step title: saved data} for the given steps, or for all saved steps."""
+        return {row.title: row.data for row in self.load_steps(step_indices).values()}
+
+    def step_versions(self, step_indices):
+        """Return ((step_index, version), ...) for the given steps, without loading their data."""
+        if not step_indices:
+            return ()
+        rows = db.session.query(DecisionStep.step_index, DecisionStep.version).filter(
+            DecisionStep.decision_id == self.id, DecisionStep.step_index.in_(list(step_indices))
+        ).order_by(DecisionStep.step_index)
+        return tuple((row.step_index, row.version) for row in rows)
+
+    def bump_version(self):
+        # Incremented in SQL so concurrent writers cannot hand out the same version
+        self.version = Decision.version + 1
+
+    def save_step(self, step_index, title, data, ai_suggestion):
+        row = self.steps.filter_by(step_index=step_index).first()
+        if row is None:
+            row = DecisionStep(decision=self, step_index=step_index, title=title)
+            db.session.add(row)
+        row.data = data
+        row.ai_suggestion = ai_suggestion
+        row.updated_at = datetime.utcnow()
+        self.bump_version()
+        db.session.flush()
+        row.version = self.version
+        return row
+
+    @property
+    def full_data(self):
+        """All step data in the shape of the old single-blob ``data`` column."""
+        full_data = dict(self.data or {})
+        for row in self.load_steps(suggestions=True).values():
+            full_data[row.title] = row.data
+            full_data[f"{row.title}_ai_suggestion"] = row.ai_suggestion
+        return full_data
+
+@event.listens_for(db.metadata, 'after_create')
+def create_search_index(target, connection, **kw):
+    # For databases set up with create_all; flask db upgrade creates it in a migration
+    if connection.dialect.name == 'sqlite':
+        create_search_table(connection)
+
+def search_index_enabled():
+    # FTS5 is SQLite-only; other databases fall back to matching the question
+    return db.engine.dialect.name == 'sqlite'
+
+def index_new_decision(decision):
+    if search_index_enabled():
+        index_decision(db.session, decision.id, decision.user_id, decision.question)
+
+def index_decision_step(decision, step_index, data):
+    if search_index_enabled():
+        update_step_text(db.session, decision.id, step_index, data)
+
+# Per-step data of a decision
+class DecisionStep(db.Model):
+    __tablename__ = 'decision_step'
+    __table_args__ = (db.UniqueConstraint('decision_id', 'step_index', name='uq_decision_step_decision_id_step_index'),)
+    id = db.Column(db.Integer, primary_key=True)
+    decision_id = db.Column(db.Integer, db.ForeignKey('decision.id'), nullable=False)
+    step_index = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(100), nullable=False)
+    data = db.Column(compressed(CompressedJSON), nullable=False, default={})
+    ai_suggestion = deferred(db.Column(compressed(CompressedJSON)))
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Decision.version at the time this step was last saved
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
 # Feedback model
 class Feedback(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    decision_id = db.Column(db.Integer, db.ForeignKey('decision.id'), nullable=False)
+    decision_id = db.Column(db.Integer, db.ForeignKey('decision.id'), nullable=False, index=True)
     rating = db.Column(db.Integer, nullable=False)
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
+# Background job model
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(JSON, nullable=False, default={})
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_until = db.Column(db.DateTime)
+    result = db.Column(JSON)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+job_queue = JobQueue(app, db, Job,
+                     max_workers=app.config['JOB_WORKERS'],
+                     max_attempts=app.config['JOB_MAX_ATTEMPTS'],
+                     retention_seconds=app.config['JOB_RETENTION_HOURS'] * 3600)
+
+@app.before_request
+def start_job_queue():
+    job_queue.start()
+
 @login_manager.user_loader
 def load_user(user_id):
     return db.session.get(User, int(user_id))
@@ -103,6 +334,8 @@ def start_decision():
         current_step=0
     )
     db.session.add(new_decision)
+    db.session.flush()
+    index_new_decision(new_decision)
     db.session.commit()
     return jsonify({
         'decision_id': new_decision.id, 
@@ -119,52 +352,192 @@ def get_step():
     if decision.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    step = PERSONAL_DECISION_FRAMEWORK['steps'][step_index]
+    return jsonify(step_bundle(decision, step_index)), 200
+
+def step_bundle(decision, step_index):
+    """The resolved step definition with the step's saved data and saved AI suggestion."""
+    dependency_indices = step_resolver.dependencies(step_index)
+    step = step_resolver.resolve(decision.id, step_index, decision.step_versions(dependency_indices),
+                                 lambda: decision.step_data(dependency_indices), decision.created_at)
     
-    for field in step['fields']:
-        if field['type'] == 'matrix':
-            matrix_structure = field['matrix_structure']
-            if 'dependencies' in field:
-                if 'rows' in field['dependencies']:
-                    dep = field['dependencies']['rows']
-                    rows_data = decision.data.get(dep['step'], {}).get(dep['field'], [])
-                    field['row_options'] = [option[dep['use']] for option in rows_data]
-                if 'columns' in field['dependencies']:
-                    dep = field['dependencies']['columns']
-                    columns_data = decision.data.get(dep['step'], {}).get(dep['field'], [])
-                    field['column_options'] = [item[dep['use']] for item in columns_data]
-        
-        elif field['type'] == 'list_of_objects':
-            if 'dependencies' in field:
-                field['dependent_options'] = {}
-                for attr, dep in field['dependencies'].items():
-                    dep_data = decision.data.get(dep['step'], {}).get(dep['field'], [])
-                    field['dependent_options'][attr] = [item[dep['use']] for item in dep_data]
-        
-        elif field['type'] == 'select':
-            if 'dependencies' in field:
-                dep = field['dependencies']
-                dep_data = decision.data.get(dep['step'], {}).get(dep['field'], [])
-                field['options'] = [item[dep['use']] for item in dep_data]
-                
-    saved_data = decision.data.get(step['title'], {})
-    ai_suggestion = decision.data.get(f"{step['title']}_ai_suggestion", "")
+    saved_row = decision.load_steps([step_index], suggestions=True).get(step_index)
+    saved_data = saved_row.data if saved_row else {}
+    ai_suggestion = (saved_row.ai_suggestion if saved_row else None) or ""
     
-    return jsonify({
+    return {
         'step': step,
         'saved_data': saved_data,
         'ai_suggestion': ai_suggestion
-    }), 200
+    }
 
 @app.route('/api/get_suggestion', methods=['GET'])
 @login_required
 def get_suggestion():
+    suggestion_request, error = prepare_suggestion_request()
+    if error:
+        return error
+    
+    ai_response = suggestion_request.cached
+    if ai_response is None:
+        # A double-click or a second tab waits for the call already in flight
+        with single_flight.flight(suggestion_request.cache_key) as flight:
+            if flight.shared:
+                ai_response = flight.result
+            else:
+                ai_response = get_ai_suggestion(suggestion_request.prompt, suggestion_request.step_index,
+                                                suggestion_request.user_id)
+                check_pre_filled_data(suggestion_request.step_index, ai_response)
+                store_suggestion(suggestion_request, ai_response)
+                flight.publish(ai_response)
+    
+    return jsonify(ai_response), 200
+
+@app.route('/api/get_suggestion_stream', methods=['GET'])
+@login_required
+def get_suggestion_stream():
+    suggestion_request, error = prepare_suggestion_request()
+    if error:
+        return error
+    
+    return Response(stream_with_context(suggestion_events(suggestion_request)), mimetype='text/event-stream',
+                    headers=SSE_HEADERS)
+
+def suggestion_events(suggestion_request):
+    """SSE messages of a streamed suggestion, ending with 'done' (or 'error')."""
+    if suggestion_request.cached is not None:
+        yield format_sse('done', suggestion_request.cached)
+        return
+    with single_flight.flight(suggestion_request.cache_key) as flight:
+        if flight.shared:
+            # Only the leader streams; everyone else gets the finished reply
+            yield format_sse('done', flight.result)
+            return
+        for kind, payload in stream_ai_suggestion(suggestion_request.prompt, suggestion_request.step_index,
+                                                  suggestion_request.user_id):
+            if kind == 'pre_filled_data':
+                payload, _ = step_validator.clean(suggestion_request.step_index, payload)
+            elif kind == 'done':
+                check_pre_filled_data(suggestion_request.step_index, payload)
+                store_suggestion(suggestion_request, payload)
+                flight.publish(payload)
+            yield format_sse(kind, payload)
+
+@app.route('/api/step_bundle', methods=['GET'])
+@login_required
+def get_step_bundle():
+    """get_step and get_suggestion_stream in one response, loading the decision once.
+
+    Streams a 'step' event with what get_step returns, then, unless the step
+    has a saved suggestion, the events of get_suggestion_stream.
+    """
+    bundle_request, error = prepare_step_bundle()
+    if error:
+        return error
+    return Response(stream_with_context(bundle_events(bundle_request)), mimetype='text/event-stream',
+                    headers=SSE_HEADERS)
+
+@app.route('/api/submit_step_bundle', methods=['POST'])
+@login_required
+def submit_step_bundle():
+    """submit_step followed by the next step's bundle, in one response.
+
+    Errors come back as submit_step's; otherwise the response streams the
+    events of step_bundle for the next step, or a single 'completed' event with
+    the summary job once the last step is submitted.
+    """
+    bundle_request, error = prepare_submitted_step_bundle()
+    if error:
+        return error
+    return Response(stream_with_context(bundle_events(bundle_request)), mimetype='text/event-stream',
+                    headers=SSE_HEADERS)
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+# The next step's bundle (step_bundle and SuggestionRequest, the latter None when
+# a suggestion is saved), or the summary job once the decision is completed
+BundleRequest = namedtuple('BundleRequest', 'bundle suggestion_request summary_job_id')
+
+def bundle_events(bundle_request):
+    if bundle_request.summary_job_id is not None:
+        yield format_sse('completed', {'completed': True, 'summary_job_id': bundle_request.summary_job_id})
+        return
+    yield format_sse('step', bundle_request.bundle)
+    if bundle_request.suggestion_request is not None:
+        yield from suggestion_events(bundle_request.suggestion_request)
+
+def prepare_step_bundle():
+    """Authorize a step bundle request; returns ``(BundleRequest, None)`` or ``(None, error_response)``."""
+    step_index = int(request.args.get('step'))
+    decision = db.session.get(Decision, request.args.get('decision_id'))
+    if decision is None or decision.user_id != current_user.id:
+        return None, (jsonify({'error': 'Unauthorized'}), 403)
+    return next_bundle_request(decision, step_index), None
+
+def prepare_submitted_step_bundle():
+    """Save a submitted step and build the next step's bundle; errors as ``(None, error_response)``."""
+    decision, error = save_submitted_step(request.json)
+    if error:
+        return None, error
+    if decision.current_step >= len(PERSONAL_DECISION_FRAMEWORK['steps']) - 1:
+        job = job_queue.enqueue('decision_summary', {'decision_id': decision.id}, user_id=current_user.id)
+        return BundleRequest(None, None, job.id), None
+    # No prefetch: the next step's suggestion is generated right away in this response
+    return next_bundle_request(decision, decision.current_step + 1), None
+
+def next_bundle_request(decision, step_index):
+    bundle = step_bundle(decision, step_index)
+    # Like the frontend after get_step, a saved suggestion is shown instead of a new one
+    suggestion_request = None if bundle['ai_suggestion'] else suggestion_request_for(decision, step_index)
+    return BundleRequest(bundle, suggestion_request, None)
+
+SuggestionRequest = namedtuple('SuggestionRequest', 'decision_id step_index prompt cache_key cached user_id')
+
+def format_sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def prepare_suggestion_request():
+    """Authorize a suggestion request and build its prompt.
+
+    Returns ``(SuggestionRequest, None)``, or ``(None, error_response)`` when the
+    request is not allowed. Shared by the WSGI routes and the async routes in asgi.py.
+    """
     decision_id = request.args.get('decision_id')
     step_index = int(request.args.get('step'))
     decision = db.session.get(Decision, decision_id)
     if decision.user_id != current_user.id:
-        return jsonify({'error': 'Unauthorized'}), 403
+        return None, (jsonify({'error': 'Unauthorized'}), 403)
     
+    return suggestion_request_for(decision, step_index), None
+
+def suggestion_request_for(decision, step_index):
+    ai_prompt = build_suggestion_prompt(decision, step_index)
+    cache_key = suggestion_cache_key(ai_prompt)
+    if request.args.get('regenerate'):
+        # The new suggestion replaces the cached one
+        suggestion_regenerations.inc()
+        cached = None
+    else:
+        cached = suggestion_cache.get(cache_key)
+    return SuggestionRequest(decision.id, step_index, ai_prompt, cache_key, cached, decision.user_id)
+
+def suggestion_cache_key(prompt):
+    return suggestion_cache.key_for(prompt, f"{app.config['ANTHROPIC_MODEL']}:{SYSTEM_PROMPT_DIGEST}")
+
+def check_pre_filled_data(step_index, ai_response):
+    """Drop the fields of the AI's pre_filled_data that do not pass the step's validators."""
+    cleaned, errors = step_validator.clean(step_index, ai_response.get('pre_filled_data'))
+    if errors:
+        step_validation_rejections.inc(len(errors), source='ai')
+        app.logger.warning(f"Dropped invalid AI pre_filled_data for step {step_index}: {errors}")
+    ai_response['pre_filled_data'] = cleaned
+    return ai_response
+
+def store_suggestion(suggestion_request, ai_response):
+    if isinstance(ai_response, dict) and ai_response.get('suggestion') != AI_SUGGESTION_ERROR:
+        suggestion_cache.set(suggestion_request.cache_key, ai_response,
+                             decision_id=suggestion_request.decision_id, step=suggestion_request.step_index)
+
+def build_suggestion_prompt(decision, step_index):
     step = PERSONAL_DECISION_FRAMEWORK['steps'][step_index]
     
     # Prepare the context for the AI prompt
@@ -173,48 +546,91 @@ def get_suggestion():
     }
     
     # Include data from all previous steps
+    saved_data = decision.step_data(range(step_index))
     for i in range(step_index):
         previous_step = PERSONAL_DECISION_FRAMEWORK['steps'][i]
-        step_data = decision.data.get(previous_step['title'], {})
-        current_context[previous_step['title']] = step_data
+        current_context[previous_step['title']] = saved_data.get(previous_step['title'], {})
     
-    ai_prompt = generate_prompt(step, current_context)
-    ai_response = get_ai_suggestion(ai_prompt)
+    budget = app.config['PROMPT_CONTEXT_TOKEN_BUDGETS'].get(step['title'], app.config['PROMPT_CONTEXT_TOKEN_BUDGET'])
+    current_context, report = context_compactor.compact(current_context, budget)
+    app.logger.info(f"Prompt context for decision {decision.id} step {step_index}: "
+                    f"~{report.compacted_tokens} tokens (~{report.saved_tokens} saved, budget {budget})")
     
-    return jsonify(ai_response), 200
+    return generate_step_request(step, current_context)
 
 @app.route('/api/submit_step', methods=['POST'])
 @login_required
 def submit_step():
-    data = request.json
+    decision, error = save_submitted_step(request.json)
+    if error:
+        return error
+    step_index = decision.current_step
+    if step_index >= len(PERSONAL_DECISION_FRAMEWORK['steps']) - 1:
+        job = job_queue.enqueue('decision_summary', {'decision_id': decision.id}, user_id=current_user.id)
+        return jsonify({'completed': True, 'summary_job_id': job.id}), 202
+    if app.config['PREFETCH_SUGGESTIONS']:
+        # The frontend asks for the next step's suggestion right after this
+        job_queue.enqueue('prefetch_suggestion', {'decision_id': decision.id, 'step_index': step_index + 1},
+                          user_id=current_user.id)
+    return jsonify({'completed': False}), 200
+
+def save_submitted_step(data):
+    """Validate and save a submitted step; returns ``(decision, None)`` or ``(None, error_response)``."""
+    step_index = data.get('step_index')
+    if not isinstance(step_index, int) or not 0 <= step_index < len(PERSONAL_DECISION_FRAMEWORK['steps']):
+        return None, (jsonify({'error': 'Invalid step_index'}), 400)
+    # Checked before anything is loaded or written
+    errors = step_validator.validate(step_index, data.get('step_data'))
+    if errors:
+        step_validation_rejections.inc(source='submission')
+        return None, (jsonify({'error': 'Invalid step data', 'errors': errors}), 400)
+    
     decision = Decision.query.get(data['decision_id'])
     if decision.user_id != current_user.id:
-        return jsonify({'error': 'Unauthorized'}), 403
+        return None, (jsonify({'error': 'Unauthorized'}), 403)
     
-    step_index = data['step_index']
     step_title = PERSONAL_DECISION_FRAMEWORK['steps'][step_index]['title']
     
-    # Save step data
-    decision.data[step_title] = data['step_data']
-    
-    # Save AI suggestion
-    decision.data[f"{step_title}_ai_suggestion"] = data['ai_suggestion']
+    # Save step data and AI suggestion
+    decision.save_step(step_index, step_title, data['step_data'], data['ai_suggestion'])
     decision.current_step = step_index
+    index_decision_step(decision, step_index, data['step_data'])
 
     try:
         db.session.commit()
         app.logger.info(f"Decision {decision.id} updated successfully")
+        # Later steps see this step's data in their prompt context
+        suggestion_cache.invalidate(decision.id, from_step=step_index + 1)
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"Error updating decision: {str(e)}")
-        return jsonify({'error': 'Error saving decision data'}), 500
-    if decision.current_step >= len(PERSONAL_DECISION_FRAMEWORK['steps']) - 1:
-        summary = generate_decision_summary(decision)
-        decision.status = 'completed'
-        decision.summary = summary
-        db.session.commit()
-        return jsonify({'completed': True, 'summary': summary}), 200
-    return jsonify({'completed': False}), 200
+        return None, (jsonify({'error': 'Error saving decision data'}), 500)
+    return decision, None
+
+@app.route('/api/job_status/<int:job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    # ?wait=N long-polls for up to N seconds until the job finishes
+    try:
+        wait = min(float(request.args.get('wait', 0)), 30)
+    except ValueError:
+        return jsonify({'error': 'Invalid wait'}), 400
+    if not wait >= 0:
+        return jsonify({'error': 'Invalid wait'}), 400
+    job = db.session.get(Job, job_id)
+    if not job or job.user_id != current_user.id:
+        return jsonify({'error': 'Job not found'}), 404
+    if wait > 0 and job.status not in ('completed', 'failed'):
+        job = job_queue.wait(job_id, wait)
+    
+    return jsonify({
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'result': job.result,
+        'error': job.error if job.status == 'failed' else None
+    }), 200
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -278,8 +694,34 @@ def logout():
 @app.route('/api/get_decisions', methods=['GET'])
 @login_required
 def get_decisions():
-    decisions = Decision.query.filter_by(user_id=current_user.id).order_by(Decision.created_at.desc()).all()
-    return jsonify([{
+    # Keyset pagination over (created_at, id); the next page's cursor is sent in X-Next-Cursor
+    try:
+        limit = max(1, min(int(request.args.get('limit', DECISIONS_PAGE_SIZE)), DECISIONS_MAX_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    query = Decision.query.options(
+        load_only(Decision.id, Decision.question, Decision.framework, Decision.created_at,
+                  Decision.current_step, Decision.status)
+    ).filter_by(user_id=current_user.id)
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = decode_decisions_cursor(cursor)
+        except (ValueError, KeyError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(or_(
+            Decision.created_at < cursor_created_at,
+            and_(Decision.created_at == cursor_created_at, Decision.id < cursor_id)
+        ))
+    
+    decisions = query.order_by(Decision.created_at.desc(), Decision.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(decisions) > limit:
+        decisions = decisions[:limit]
+        next_cursor = encode_decisions_cursor(decisions[-1])
+    
+    response = jsonify([{
         'id': d.id,
         'question': d.question,
         'framework': d.framework,
@@ -288,13 +730,102 @@ def get_decisions():
         'status': d.status,
         'total_steps': len(PERSONAL_DECISION_FRAMEWORK['steps'])
     } for d in decisions])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+DECISIONS_PAGE_SIZE = 50
+DECISIONS_MAX_PAGE_SIZE = 200
+
+def encode_decisions_cursor(decision):
+    raw = json.dumps({'created_at': decision.created_at.isoformat(), 'id': decision.id})
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_decisions_cursor(cursor):
+    raw = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return datetime.fromisoformat(raw['created_at']), int(raw['id'])
+
+@app.route('/api/search_decisions', methods=['GET'])
+@login_required
+def search_decisions():
+    # Ranked by relevance; ?cursor= continues from the X-Next-Cursor of the previous page
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing search query'}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', SEARCH_PAGE_SIZE)), DECISIONS_MAX_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    offset = 0
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            offset = decode_search_cursor(cursor)
+        except (ValueError, KeyError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    if search_index_enabled():
+        results = find_decisions(db.session, current_user.id, query, limit + 1, offset)
+    else:
+        results = match_questions(query, limit + 1, offset)
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = encode_search_cursor(offset + limit)
+    
+    for result in results:
+        result['created_at'] = result['created_at'].isoformat()
+        result['total_steps'] = len(PERSONAL_DECISION_FRAMEWORK['steps'])
+    response = jsonify(results)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+SEARCH_PAGE_SIZE = 20
+
+def match_questions(query, limit, offset):
+    """Substring match on the question, newest first, for databases without the search index."""
+    pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    decisions = Decision.query.options(
+        load_only(Decision.id, Decision.question, Decision.framework, Decision.created_at,
+                  Decision.current_step, Decision.status)
+    ).filter(Decision.user_id == current_user.id, Decision.question.ilike(pattern, escape='\\')).order_by(
+        Decision.created_at.desc(), Decision.id.desc()
+    ).offset(offset).limit(limit)
+    return [{
+        'id': d.id,
+        'question': d.question,
+        'framework': d.framework,
+        'created_at': d.created_at,
+        'current_step': d.current_step,
+        'status': d.status,
+        'score': None,
+        'question_html': highlighted(d.question),
+        'snippet_html': '',
+    } for d in decisions]
+
+def encode_search_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({'offset': offset}).encode('utf-8')).decode('ascii')
+
+def decode_search_cursor(cursor):
+    offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))['offset'])
+    if offset < 0:
+        raise ValueError(offset)
+    return offset
 
 @app.route('/api/get_decision_details/<int:decision_id>', methods=['GET'])
 @login_required
 def get_decision_details(decision_id):
-    decision = Decision.query.get(decision_id)
-    if not decision or decision.user_id != current_user.id:
+    result = db.session.query(Decision, Feedback).options(undefer(Decision.summary)).outerjoin(
+        Feedback, Feedback.decision_id == Decision.id
+    ).filter(Decision.id == decision_id).first()
+    if not result or result[0].user_id != current_user.id:
         return jsonify({'error': 'Decision not found'}), 404
+    decision, feedback = result
+    
+    etag = decision_etag(decision)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
     
     details = {
         'id': decision.id,
@@ -304,38 +835,179 @@ def get_decision_details(decision_id):
         'status': decision.status,
         'current_step': decision.current_step,
         'total_steps': len(PERSONAL_DECISION_FRAMEWORK['steps']),
-        'summary': decision.summary or 'Summary not available'
+        'summary': decision.summary or 'Summary not available',
+        'version': decision.version
     }
 
-    feedback = Feedback.query.filter_by(decision_id=decision.id).first()
     if feedback:
         details['feedback'] = {
             'rating': feedback.rating,
             'comment': feedback.comment
         }
 
-    return jsonify(details)
+    return with_etag(jsonify(details), etag)
 
 @app.route('/api/resume_decision/<int:decision_id>', methods=['GET'])
 @login_required
 def resume_decision(decision_id):
+    # ?steps=current (or a comma-separated list of step indices) limits `data` to
+    # those steps, without AI suggestions; ?fields=a,b limits the response keys.
     decision = Decision.query.get(decision_id)
     if not decision or decision.user_id != current_user.id:
         return jsonify({'error': 'Decision not found'}), 404
     
+    etag = decision_etag(decision, request.query_string)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    fields = parse_fields(request.args.get('fields'))
+    steps = request.args.get('steps')
     current_step = PERSONAL_DECISION_FRAMEWORK['steps'][decision.current_step]
-    ai_suggestion = decision.data.get(f"{current_step['title']}_ai_suggestion", "")
+    if steps:
+        try:
+            step_indices = {decision.current_step} if steps == 'current' else {int(i) for i in steps.split(',')}
+        except ValueError:
+            return jsonify({'error': 'Invalid steps'}), 400
+        rows = decision.load_steps(step_indices | {decision.current_step}, suggestions=True)
+        data = {row.title: row.data for index, row in rows.items() if index in step_indices}
+        current_row = rows.get(decision.current_step)
+        ai_suggestion = (current_row.ai_suggestion if current_row else None) or ""
+    elif fields is None or 'data' in fields:
+        data = decision.full_data
+        ai_suggestion = data.get(f"{current_step['title']}_ai_suggestion") or ""
+    else:
+        data = None
+        current_row = decision.load_steps([decision.current_step], suggestions=True).get(decision.current_step)
+        ai_suggestion = (current_row.ai_suggestion if current_row else None) or ""
     
-    return jsonify({
+    return with_etag(jsonify(project_fields({
         'decision_id': decision.id,
         'current_step': current_step,
         'current_step_index': decision.current_step,
         'question': decision.question,
         'framework': decision.framework,
-        'data': decision.data,
+        'data': data,
         'total_steps': len(PERSONAL_DECISION_FRAMEWORK['steps']),
-        'ai_suggestion': ai_suggestion
-    })
+        'ai_suggestion': ai_suggestion,
+        'version': decision.version
+    }, fields)), etag)
+
+@app.route('/api/decision_changes/<int:decision_id>', methods=['GET'])
+@login_required
+def decision_changes(decision_id):
+    # Steps saved after ?since=<version>; ?fields=data,ai_suggestion limits what is sent per step
+    decision = Decision.query.get(decision_id)
+    if not decision or decision.user_id != current_user.id:
+        return jsonify({'error': 'Decision not found'}), 404
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid since'}), 400
+    
+    etag = decision_etag(decision, request.query_string)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    fields = parse_fields(request.args.get('fields'))
+    step_fields = {'data', 'ai_suggestion'} if fields is None else fields
+    query = decision.steps.filter(DecisionStep.version > since).order_by(DecisionStep.step_index)
+    if 'data' not in step_fields:
+        query = query.options(defer(DecisionStep.data))
+    if 'ai_suggestion' in step_fields:
+        query = query.options(undefer(DecisionStep.ai_suggestion))
+    
+    changed = []
+    for row in query:
+        step = {'step_index': row.step_index, 'title': row.title, 'version': row.version}
+        if 'data' in step_fields:
+            step['data'] = row.data
+        if 'ai_suggestion' in step_fields:
+            step['ai_suggestion'] = row.ai_suggestion
+        changed.append(step)
+    
+    return with_etag(jsonify({
+        'decision_id': decision.id,
+        'version': decision.version,
+        'since': since,
+        'current_step_index': decision.current_step,
+        'status': decision.status,
+        'steps': changed
+    }), etag)
+
+# The evaluations matrix rates the options of one step against the criteria of another
+STEP_INDICES = {step['title']: index for index, step in enumerate(PERSONAL_DECISION_FRAMEWORK['steps'])}
+EVALUATIONS_STEP = 'Evaluate Options'
+EVALUATIONS_FIELD = next(field for field in PERSONAL_DECISION_FRAMEWORK['steps'][STEP_INDICES[EVALUATIONS_STEP]]['fields']
+                         if field['name'] == 'evaluations')
+CRITERIA_STEP = EVALUATIONS_FIELD['dependencies']['columns']['step']
+CRITERIA_FIELD = EVALUATIONS_FIELD['dependencies']['columns']['field']
+
+def decision_matrix(step_data):
+    """The DecisionMatrix of a decision's {step title: saved data}."""
+    cell_format = EVALUATIONS_FIELD['cell_format']
+    return DecisionMatrix.from_step_data((step_data.get(CRITERIA_STEP) or {}).get(CRITERIA_FIELD),
+                                         (step_data.get(EVALUATIONS_STEP) or {}).get(EVALUATIONS_FIELD['name']),
+                                         scale=(cell_format['min'], cell_format['max']))
+
+def compute_scores(matrix, samples=None, spread=None):
+    started = time.perf_counter()
+    scores = score_decision(matrix, app.config['SCORING_SAMPLES'] if samples is None else samples,
+                            app.config['SCORING_WEIGHT_SPREAD'] if spread is None else spread)
+    scoring_seconds.observe(time.perf_counter() - started)
+    return scores
+
+@app.route('/api/decision_scores/<int:decision_id>', methods=['GET'])
+@login_required
+def decision_scores(decision_id):
+    # Weighted scores of the evaluations matrix, and how often each option still
+    # ranks first when every criterion weight may be off by up to ?spread
+    decision = Decision.query.get(decision_id)
+    if not decision or decision.user_id != current_user.id:
+        return jsonify({'error': 'Decision not found'}), 404
+    try:
+        samples = int(request.args.get('samples', app.config['SCORING_SAMPLES']))
+        spread = float(request.args.get('spread', app.config['SCORING_WEIGHT_SPREAD']))
+    except ValueError:
+        return jsonify({'error': 'Invalid samples or spread'}), 400
+    if not 0 <= samples <= app.config['SCORING_MAX_SAMPLES'] or not 0 <= spread <= 1:
+        return jsonify({'error': 'Invalid samples or spread'}), 400
+    
+    etag = decision_etag(decision, request.query_string)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    matrix = decision_matrix(decision.step_data([STEP_INDICES[CRITERIA_STEP], STEP_INDICES[EVALUATIONS_STEP]]))
+    if not matrix:
+        return jsonify({'error': 'No options have been evaluated against criteria yet'}), 400
+    scores = compute_scores(matrix, samples, spread)
+    return with_etag(jsonify(dict(scores, decision_id=decision.id, version=decision.version)), etag)
+
+def decision_etag(decision, *parts):
+    # The version covers the decision's content; parts cover the requested representation
+    etag = f"{decision.id}-{decision.version}"
+    for part in parts:
+        if part:
+            etag += f"-{zlib.crc32(part):08x}"
+    return etag
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    # Let browsers keep the response but revalidate it on every use
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified(etag):
+    return with_etag(Response(status=304), etag)
+
+def parse_fields(fields):
+    if not fields:
+        return None
+    return {field.strip() for field in fields.split(',') if field.strip()}
+
+def project_fields(payload, fields):
+    if fields is None:
+        return payload
+    return {key: value for key, value in payload.items() if key in fields}
 
 @app.route('/api/delete_decision/<int:decision_id>', methods=['DELETE'])
 @login_required
@@ -345,9 +1017,45 @@ def delete_decision(decision_id):
         return jsonify({'error': 'Decision not found'}), 404
     
     db.session.delete(decision)
+    if search_index_enabled():
+        remove_decision(db.session, decision_id)
     db.session.commit()
+    suggestion_cache.invalidate(decision_id)
+    step_resolver.invalidate(decision_id)
     return jsonify({'message': 'Decision deleted successfully'})
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache_stats', methods=['GET'])
+@login_required
+def cache_stats():
+    return jsonify(suggestion_cache.stats()), 200
+
+@app.route('/api/step_resolver_stats', methods=['GET'])
+@login_required
+def step_resolver_stats():
+    return jsonify(step_resolver.stats()), 200
+
+@app.route('/api/admission_stats', methods=['GET'])
+@login_required
+def admission_stats():
+    return jsonify(admission.stats()), 200
+
+@app.route('/api/single_flight_stats', methods=['GET'])
+@login_required
+def single_flight_stats():
+    return jsonify(single_flight.stats()), 200
+
+@app.route('/api/compaction_stats', methods=['GET'])
+@login_required
+def compaction_stats():
+    return jsonify(context_compactor.stats()), 200
+
 @app.route('/api/check_login')
 def check_login():
     return jsonify({'logged_in': current_user.is_authenticated})
@@ -372,122 +1080,406 @@ def submit_feedback():
         comment=data.get('comment', '')
     )
     db.session.add(new_feedback)
+    decision.bump_version()
     db.session.commit()
     app.logger.info(f"Feedback submitted for decision {decision_id}")
     return jsonify({'message': 'Feedback submitted successfully'}), 200
 
-def get_ai_suggestion(prompt):
+AI_SUGGESTION_ERROR = "Error generating AI suggestion"
+
+def suggestion_request_kwargs(prompt, step_index):
+    """Arguments for ``messages.create``/``messages.stream`` for a suggestion prompt.
+
+    The framework instructions go in the system blocks, which are marked for
+    prompt caching and identical for every call; ``prompt`` is only the step
+    and decision context. With ``SUGGESTION_OUTPUT_MODE = 'tool'`` the reply is
+    requested as the input of the step's tool, whose JSON schema is built from
+    the step's fields, so it always parses.
+    """
+    kwargs = {
+        'model': app.config['ANTHROPIC_MODEL'],
+        'max_tokens': 1024,
+        'system': SYSTEM_BLOCKS,
+        'messages': [
+            {"role": "user", "content": prompt}
+        ]
+    }
+    if app.config['SUGGESTION_OUTPUT_MODE'] == 'tool':
+        tool_choice = step_tool_choice(PERSONAL_DECISION_FRAMEWORK['steps'][step_index])
+        if tool_choice is not None:
+            kwargs['tools'] = SUGGESTION_TOOLS
+            kwargs['tool_choice'] = tool_choice
+    return kwargs
+
+def output_mode(kwargs):
+    return 'tool' if 'tool_choice' in kwargs else 'text'
+
+AI_BUSY_ERROR = "The AI assistant is busy right now. Please try again in a moment."
+RATE_LIMIT_DEFAULT_PAUSE = 10
+
+def estimated_call_tokens(kwargs):
+    # Charged to the tokens-per-minute bucket up front and settled with the real usage
+    return (sum(estimate_tokens(block['text']) for block in kwargs.get('system', ())) +
+            sum(estimate_tokens(json.dumps(tool)) for tool in kwargs.get('tools', ())) +
+            sum(estimate_tokens(message['content']) for message in kwargs['messages']) + kwargs['max_tokens'])
+
+def cache_usage(usage):
+    """(prompt cache writes, prompt cache reads); both are absent when caching is not used."""
+    return (getattr(usage, 'cache_creation_input_tokens', None) or 0,
+            getattr(usage, 'cache_read_input_tokens', None) or 0)
+
+def usage_tokens(usage):
+    return usage.input_tokens + sum(cache_usage(usage)) + usage.output_tokens
+
+def record_model_call(call, elapsed, usage, first_token=None):
+    llm_request_seconds.observe(elapsed, call=call)
+    if first_token is not None:
+        llm_first_token_seconds.observe(first_token, call=call)
+    cache_write, cache_read = cache_usage(usage)
+    # input_tokens only counts the uncached part of the prompt
+    llm_tokens.inc(usage.input_tokens, call=call, direction='input')
+    llm_tokens.inc(cache_write, call=call, direction='cache_write')
+    llm_tokens.inc(cache_read, call=call, direction='cache_read')
+    llm_tokens.inc(usage.output_tokens, call=call, direction='output')
+
+def log_model_exchange(prompt, response_text):
+    # Full prompts and replies are large; only a sample is logged, and only if enabled
+    if random.random() < app.config['LOG_PROMPT_SAMPLE_RATE']:
+        app.logger.info(f"Sampled AI prompt: {prompt}\nSampled AI response: {response_text}")
+
+def rate_limited(error, attempt):
+    """Pause admission in every worker for the 429's retry-after; False once retries are used up."""
     try:
-        app.logger.info(f"Sending prompt to AI: {prompt}")
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=1024,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        app.logger.info(f"Received AI response: {response.content[0].text}")
-        
-        response_text = response.content[0].text
-        
-        def balance_json(json_string):
-            stack = []
-            in_string = False
-            escape = False
-            for i, char in enumerate(json_string):
-                if char == '"' and not escape:
-                    in_string = not in_string
-                elif not in_string:
-                    if char in '{[':
-                        stack.append(char)
-                    elif char in '}]':
-                        if stack and ((stack[-1] == '{' and char == '}') or (stack[-1] == '[' and char == ']')):
-                            stack.pop()
-                        else:
-                            # Mismatched closing bracket, JSON is malformed
-                            return None
-                
-                escape = char == '\\' and not escape
-            
-            # Close any unclosed strings
-            if in_string:
-                json_string += '"'
-            
-            # Add closing brackets in reverse order
-            closing = ''.join('}' if c == '{' else ']' for c in reversed(stack))
-            return json_string + closing
-
-        # Try to parse the original response
-        try:
-            return json.loads(response_text)
-        except JSONDecodeError:
-            # If parsing fails, try to balance and parse again
-            balanced_json = balance_json(response_text)
-            if balanced_json is not None:
-                try:
-                    return json.loads(balanced_json)
-                except JSONDecodeError:
-                    app.logger.error(f"Failed to parse JSON even after balancing. Response: {balanced_json}")
-            else:
-                app.logger.error(f"JSON structure is malformed. Response: {response_text}")
-            
-            # If it still fails, extract whatever we can
-            suggestion = ""
-            pre_filled_data = {}
-            
-            if '"suggestion":' in response_text:
-                suggestion_parts = response_text.split('"suggestion":', 1)[1].split('"', 2)
-                suggestion = suggestion_parts[1] if len(suggestion_parts) > 1 else ""
-            
-            if '"pre_filled_data":' in response_text:
-                pre_filled_data_str = response_text.split('"pre_filled_data":', 1)[1]
-                try:
-                    pre_filled_data_balanced = balance_json(pre_filled_data_str)
-                    if pre_filled_data_balanced is not None:
-                        pre_filled_data = json.loads(pre_filled_data_balanced)
-                except JSONDecodeError:
-                    app.logger.error(f"Failed to parse pre_filled_data. Extraction attempt: {pre_filled_data_str}")
-            
-            return {"suggestion": suggestion, "pre_filled_data": pre_filled_data}
+        retry_after = float(error.response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        retry_after = RATE_LIMIT_DEFAULT_PAUSE
+    admission.pause(retry_after)
+    app.logger.warning(f"Anthropic rate limit hit (attempt {attempt + 1}), pausing model calls for {retry_after:.0f}s")
+    return attempt < app.config['ANTHROPIC_RATE_LIMIT_RETRIES']
+
+def create_message(user_id, wait=None, call='suggestion', **kwargs):
+    """``client.messages.create`` under admission control, retrying provider 429s."""
+    attempt = 0
+    while True:
+        with admission.slot(user_id, estimated_call_tokens(kwargs), wait=wait) as slot:
+            started = time.perf_counter()
+            try:
+                response = client.messages.create(**kwargs)
+            except anthropic.RateLimitError as e:
+                if not rate_limited(e, attempt):
+                    raise
+                attempt += 1
+                continue
+            record_model_call(call, time.perf_counter() - started, response.usage)
+            slot.settle(usage_tokens(response.usage))
+            return response
+
+def get_ai_suggestion(prompt, step_index, user_id=None, wait=None):
+    try:
+        response = create_message(user_id, wait=wait, **suggestion_request_kwargs(prompt, step_index))
+        log_model_exchange(prompt, reply_text(response.content))
+        return parse_reply(response.content, response.stop_reason)
         
+    except AdmissionTimeout:
+        raise
     except Exception as e:
         app.logger.error(f"Error in get_ai_suggestion: {str(e)}", exc_info=True)
-        return {"suggestion": "Error generating AI suggestion", "pre_filled_data": {}}
+        return {"suggestion": AI_SUGGESTION_ERROR, "pre_filled_data": {}}
+
+def stream_ai_suggestion(prompt, step_index, user_id=None):
+    """Yield ``(event, payload)`` tuples while the model reply is streamed in."""
+    parser = SuggestionStreamParser()
+    chunks = []
+    kwargs = suggestion_request_kwargs(prompt, step_index)
+    try:
+        attempt = 0
+        while True:
+            with admission.slot(user_id, estimated_call_tokens(kwargs)) as slot:
+                started = time.perf_counter()
+                first_token = None
+                try:
+                    with client.messages.stream(**kwargs) as stream:
+                        for text in reply_chunks(stream):
+                            if first_token is None:
+                                first_token = time.perf_counter() - started
+                            chunks.append(text)
+                            yield from parser.feed(text)
+                        usage = stream.get_final_message().usage
+                    record_model_call('suggestion_stream', time.perf_counter() - started, usage, first_token)
+                    slot.settle(usage_tokens(usage))
+                    break
+                except anthropic.RateLimitError as e:
+                    # A 429 comes before any output, so the call can simply be retried
+                    if chunks or not rate_limited(e, attempt):
+                        raise
+                    attempt += 1
+        response_text = ''.join(chunks)
+        log_model_exchange(prompt, response_text)
+        yield 'done', normalize_ai_response(parser.finish(), not is_valid_json(response_text), response_text,
+                                            output_mode(kwargs))
+    except AdmissionTimeout as e:
+        app.logger.warning(f"Model call not admitted: {str(e)}")
+        yield 'error', {"suggestion": AI_BUSY_ERROR, "pre_filled_data": {}}
+    except Exception as e:
+        app.logger.error(f"Error in stream_ai_suggestion: {str(e)}", exc_info=True)
+        yield 'error', {"suggestion": AI_SUGGESTION_ERROR, "pre_filled_data": {}}
+
+def content_blocks(content):
+    # SDK objects, or dicts in batch results
+    return [block if isinstance(block, dict) else vars(block) for block in content]
+
+def reply_text(content):
+    """A reply's text, or the JSON input of its tool call."""
+    blocks = content_blocks(content)
+    for block in blocks:
+        if block['type'] == 'tool_use':
+            return json.dumps(block['input'])
+    return ''.join(block['text'] for block in blocks if block['type'] == 'text')
+
+def parse_reply(content, stop_reason=None):
+    """The suggestion in a reply's content blocks.
+
+    A tool call's input has already been parsed by the API; it can only be
+    incomplete when the reply was cut off at ``max_tokens``.
+    """
+    for block in content_blocks(content):
+        if block['type'] == 'tool_use':
+            return normalize_ai_response(block['input'], stop_reason == 'max_tokens', block['input'], 'tool')
+    return parse_ai_response(reply_text(content))
+
+def reply_chunks(stream):
+    """Text of a streamed reply as it arrives; for a tool call, the pieces of its JSON input."""
+    for stream_event in stream:
+        if stream_event.type == 'text':
+            yield stream_event.text
+        elif stream_event.type == 'input_json':
+            yield stream_event.partial_json
+
+def parse_ai_response(response_text):
+    return normalize_ai_response(*load_json(response_text), response_text)
+
+def normalize_ai_response(parsed, repaired, response_text, mode='text'):
+    if not isinstance(parsed, dict):
+        ai_response_parses.inc(outcome='unusable', mode=mode)
+        app.logger.error(f"No JSON object found in AI response: {response_text}")
+        parsed = {}
+    else:
+        ai_response_parses.inc(outcome='repaired' if repaired else 'valid', mode=mode)
+    parsed.setdefault('suggestion', '')
+    parsed.setdefault('pre_filled_data', {})
+    return parsed
+
+def format_scores(scores):
+    lines = [f"- {option['name']}: {option['score']:g}/100, rank {option['rank']}, "
+             f"ranked first in {option['win_rate']:.0%} of weight variations" for option in scores['options']]
+    return '\n    '.join(lines)
 
 def generate_decision_summary(decision):
+    full_data = decision.full_data
+    context, report = context_compactor.compact(full_data, app.config['SUMMARY_CONTEXT_TOKEN_BUDGET'])
+    app.logger.info(f"Summary context for decision {decision.id}: "
+                    f"~{report.compacted_tokens} tokens (~{report.saved_tokens} saved)")
+    matrix = decision_matrix(full_data)
+    scores_section = ""
+    if matrix:
+        # Ranking is computed here rather than left to the model
+        scores = compute_scores(matrix)
+        scores_section = f"""
+    Computed option scores (criteria-weighted ratings; "ranked first" is the share of
+    {scores['samples']} samples with every criterion weight varied by up to {scores['spread']:.0%}):
+    {format_scores(scores)}
+    """
     prompt = f"""
     Please provide a comprehensive summary of the decision-making process for the following decision:
     
     Decision Question: {decision.question}
     
     Step-by-step data:
-    {json.dumps(decision.data, indent=2)}
-    
+    {json.dumps(context, indent=2)}
+    {scores_section}
     Please structure your summary in markdown format, including:
     1. A restatement of the decision question
     2. Key points considered during the process
-    3. Options evaluated and their outcomes
+    3. Options evaluated and their outcomes (use the computed scores, if given, for the ranking instead of re-scoring)
     4. The final decision or recommendation
     """
     
-    try:
-        response = client.messages.create(
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=4000,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response.content[0].text
-    except Exception as e:
-        app.logger.error(f"Error generating decision summary: {str(e)}", exc_info=True)
-        return "Error generating decision summary"
+    response = create_message(
+        decision.user_id,
+        call='summary',
+        model=app.config['ANTHROPIC_MODEL'],
+        max_tokens=4000,
+        messages=[
+            {"role": "user", "content": prompt}
+        ]
+    )
+    return response.content[0].text
+
+def summary_job_failed(payload, error):
+    decision = db.session.get(Decision, payload['decision_id'])
+    if decision:
+        decision.summary = "Error generating decision summary"
+        decision.status = 'completed'
+        decision.bump_version()
+        db.session.commit()
+
+@job_queue.handler('decision_summary', on_failure=summary_job_failed)
+def run_summary_job(payload):
+    decision = db.session.get(Decision, payload['decision_id'])
+    if decision is None:
+        # Deleted while the job was queued
+        return {'summary': None}
+    summary = generate_decision_summary(decision)
+    decision.summary = summary
+    decision.status = 'completed'
+    if search_index_enabled():
+        update_search_column(db.session, decision.id, 'summary', summary)
+    decision.bump_version()
+    db.session.commit()
+    return {'summary': summary}
+
+@job_queue.handler('prefetch_suggestion', max_attempts=1)
+def run_prefetch_job(payload):
+    decision = db.session.get(Decision, payload['decision_id'])
+    if decision is None:
+        return {'prefetched': False}
+    step_index = payload['step_index']
+    prompt = build_suggestion_prompt(decision, step_index)
+    cache_key = suggestion_cache_key(prompt)
+    if suggestion_cache.contains(cache_key):
+        return {'prefetched': False}
+    
+    # A user request for the same step may already be in flight, or may join this one
+    with single_flight.flight(cache_key, wait=0) as flight:
+        if not flight.leading:
+            return {'prefetched': False}
+        try:
+            # Speculative, so it only runs if a model call slot is free right now
+            ai_response = get_ai_suggestion(prompt, step_index, decision.user_id, wait=0)
+        except AdmissionTimeout:
+            return {'prefetched': False}
+        if ai_response.get('suggestion') == AI_SUGGESTION_ERROR:
+            suggestion_cache.record_wasted_prefetch()
+            return {'prefetched': False}
+        check_pre_filled_data(step_index, ai_response)
+        
+        # An earlier step may have been edited while the model was answering;
+        # the suggestion is only worth keeping if the prompt is still current.
+        db.session.expire_all()
+        decision = db.session.get(Decision, payload['decision_id'])
+        if decision is None or build_suggestion_prompt(decision, step_index) != prompt:
+            app.logger.info(f"Discarding stale prefetched suggestion for decision {payload['decision_id']} step {step_index}")
+            suggestion_cache.record_wasted_prefetch()
+            return {'prefetched': False}
+        
+        suggestion_cache.set(cache_key, ai_response, decision_id=decision.id, step=step_index, prefetched=True)
+        flight.publish(ai_response)
+        return {'prefetched': True}
+
+@app.cli.command('batch-decisions')
+@click.argument('questions_file', type=click.File())
+@click.option('--username', required=True, help='Owner of the decisions that are created.')
+@click.option('--steps', type=click.IntRange(1, len(PERSONAL_DECISION_FRAMEWORK['steps'])),
+              default=len(PERSONAL_DECISION_FRAMEWORK['steps']), help='Run only the first N framework steps.')
+@click.option('--poll-interval', type=float, default=30.0, help='Seconds between batch status checks.')
+@click.option('--input-price', type=float, default=3.0, help='USD per million input tokens at the interactive price.')
+@click.option('--output-price', type=float, default=15.0, help='USD per million output tokens at the interactive price.')
+@click.option('--interactive-sample', type=int, default=0,
+              help='Also send this many first-step prompts through the interactive path to compare timing.')
+def batch_decisions(questions_file, username, steps, poll_interval, input_price, output_price, interactive_sample):
+    """Run every question in QUESTIONS_FILE (one per line) through the framework with message batches.
+
+    Each step is one round: the prompts of all decisions are built with
+    generate_prompt, submitted as message batches, and the suggestions are saved
+    as the step data (the suggestion's pre_filled_data) in one transaction, so
+    the next round's prompts see them.
+    """
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username}")
+    questions = [line.strip() for line in questions_file if line.strip()]
+    decisions = [Decision(user_id=user.id, question=question, framework='personal',
+                          data={'initial_question': question}, current_step=0) for question in questions]
+    db.session.add_all(decisions)
+    db.session.flush()
+    for decision in decisions:
+        index_new_decision(decision)
+    db.session.commit()
+    click.echo(f"Created {len(decisions)} decisions for {username}")
+    
+    batches = message_batches(client)
+    active = decisions
+    failed = set()
+    first_prompts = []
+    requests_sent = succeeded = input_tokens = cache_write_tokens = cache_read_tokens = output_tokens = 0
+    elapsed = 0.0
+    for step_index in range(steps):
+        title = PERSONAL_DECISION_FRAMEWORK['steps'][step_index]['title']
+        prompts = {decision.id: build_suggestion_prompt(decision, step_index) for decision in active}
+        if step_index == 0:
+            first_prompts = list(prompts.values())
+        run = run_batches(batches, [{'custom_id': f"decision-{decision_id}-step-{step_index}",
+                                     'params': suggestion_request_kwargs(prompt, step_index)}
+                                    for decision_id, prompt in prompts.items()],
+                          poll_interval=poll_interval)
+        
+        for decision in active:
+            result = run.results.get(f"decision-{decision.id}-step-{step_index}")
+            if result is None or result['type'] != 'succeeded':
+                failed.add(decision.id)
+                continue
+            message = result['message']
+            ai_response = check_pre_filled_data(step_index, parse_reply(message['content'], message.get('stop_reason')))
+            decision.save_step(step_index, title, ai_response['pre_filled_data'], ai_response['suggestion'])
+            decision.current_step = step_index
+            index_decision_step(decision, step_index, ai_response['pre_filled_data'])
+        db.session.commit()
+        # A decision missing a step cannot go on; later prompts would lack its data
+        active = [decision for decision in active if decision.id not in failed]
+        
+        requests_sent += len(prompts)
+        succeeded += run.succeeded
+        input_tokens += run.input_tokens
+        cache_write_tokens += run.cache_write_tokens
+        cache_read_tokens += run.cache_read_tokens
+        output_tokens += run.output_tokens
+        elapsed += run.elapsed
+        click.echo(f"Step {step_index + 1}/{steps} ({title}): {run.succeeded} succeeded, {run.errored} failed, "
+                   f"{run.batches} batch(es) in {run.elapsed:.1f}s")
+        if not active:
+            break
+    
+    cache_tokens = {'cache_write_tokens': cache_write_tokens, 'cache_read_tokens': cache_read_tokens}
+    batch_cost = token_cost(input_tokens, output_tokens, input_price, output_price, batch=True, **cache_tokens)
+    interactive_cost = token_cost(input_tokens, output_tokens, input_price, output_price, **cache_tokens)
+    click.echo(f"{succeeded}/{requests_sent} requests succeeded in {elapsed:.1f}s "
+               f"({requests_sent / elapsed * 60 if elapsed else 0:.0f} requests/min); "
+               f"{len(decisions) - len(failed)}/{len(decisions)} decisions completed every step")
+    click.echo(f"Tokens: {input_tokens} in (plus {cache_write_tokens} cache writes, {cache_read_tokens} cache reads), "
+               f"{output_tokens} out; cost ${batch_cost:.4f} "
+               f"vs ${interactive_cost:.4f} through the interactive path")
+    
+    if interactive_sample and first_prompts:
+        sample = first_prompts[:interactive_sample]
+        started = time.perf_counter()
+        for prompt in sample:
+            create_message(user.id, call='batch_comparison', **suggestion_request_kwargs(prompt, 0))
+        per_call = (time.perf_counter() - started) / len(sample)
+        click.echo(f"Interactive path: {per_call:.2f}s per call, so ~{per_call * requests_sent:.0f}s for "
+                   f"{requests_sent} sequential calls vs {elapsed:.0f}s batched")
 
 def __init__(self, **kwargs):
         super(Decision, self).__init__(**kwargs)
         if self.data is None:
             self.data = {}
 
+@app.errorhandler(AdmissionTimeout)
+def handle_admission_timeout(e):
+    app.logger.warning(f"Model call not admitted: {str(e)}")
+    response = jsonify({'error': AI_BUSY_ERROR})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     app.logger.error(f'Unhandled exception: {str(e)}', exc_info=True)
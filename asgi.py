@@ -0,0 +1,292 @@
+"""ASGI entry point: async model calls for the AI-bound routes, Flask for everything else.
+
+Run with ``uvicorn asgi:application``. The suggestion and step bundle routes
+await the model through ``anthropic.AsyncAnthropic``, so one process can keep
+many calls in flight without a thread per call. Authorization and prompt building still run
+the Flask code in a worker thread; every other route is served by the Flask
+app through a2wsgi in a bounded thread pool (``ASGI_WSGI_THREADS``), which
+passes response chunks on as Flask yields them. A ``/api/job_status?wait=``
+long poll holds one of those threads until it returns (up to 30 seconds).
+
+The async routes do not go through ``app.wsgi_app``, so Flask's
+``before_request``/``after_request`` hooks do not run for them (``_prepare``
+only pushes a request context): ``application`` records their request time,
+but not their database query counts, and the job queue is only started for
+them when they enqueue a job.
+"""
+import asyncio
+import json
+import time
+
+import anthropic
+from a2wsgi import WSGIMiddleware
+from flask_login import current_user
+
+from admission import AdmissionTimeout
+from app import (app, admission, single_flight, step_validator, AI_BUSY_ERROR, AI_SUGGESTION_ERROR, SSE_HEADERS,
+                 check_pre_filled_data, estimated_call_tokens, format_sse, http_request_seconds, log_model_exchange,
+                 normalize_ai_response, output_mode, parse_reply, prepare_step_bundle, prepare_submitted_step_bundle,
+                 prepare_suggestion_request, rate_limited,
+                 record_model_call, reply_text, store_suggestion, suggestion_request_kwargs, usage_tokens)
+from json_repair import is_valid_json
+from suggestion_stream import SuggestionStreamParser
+
+wsgi_application = WSGIMiddleware(app.wsgi_app, workers=app.config['ASGI_WSGI_THREADS'])
+
+_async_client = None
+
+
+def get_async_client():
+    # Created on first use so it binds to the server's event loop
+    global _async_client
+    if _async_client is None:
+        if app.config['USE_FAKE_ANTHROPIC']:
+            from fake_anthropic import AsyncFakeAnthropic
+            _async_client = AsyncFakeAnthropic(latency=0.5, chunk_delay=0.02)
+        else:
+            _async_client = anthropic.AsyncAnthropic(api_key=app.config['ANTHROPIC_API_KEY'])
+    return _async_client
+
+
+def _prepare(scope, prepare=prepare_suggestion_request, body=b''):
+    """Run ``prepare`` (one of the app's ``prepare_*`` functions) in a Flask request context for ``scope``."""
+    headers = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']]
+    with app.test_request_context(scope['path'], method=scope['method'], query_string=scope['query_string'],
+                                  headers=headers, data=body):
+        if not current_user.is_authenticated:
+            return None, (401, {'Content-Type': 'application/json'}, json.dumps({'error': 'Login required'}).encode())
+        try:
+            prepared, error = prepare()
+        except Exception as e:
+            app.logger.error(f"Error preparing {scope['path']} request: {str(e)}", exc_info=True)
+            error = app.make_response((
+                {'error': 'An unexpected error occurred. Please try again later.'}, 500))
+            prepared = None
+        if error:
+            response = app.make_response(error)
+            return None, (response.status_code, dict(response.headers), response.get_data())
+        return prepared, None
+
+
+async def get_suggestion(scope, receive, send):
+    suggestion_request, error = await asyncio.to_thread(_prepare, scope)
+    if error:
+        await _send(send, *error)
+        return
+
+    ai_response = suggestion_request.cached
+    if ai_response is None:
+        async with single_flight.async_flight(suggestion_request.cache_key) as flight:
+            if flight.shared:
+                ai_response = flight.result
+            else:
+                try:
+                    ai_response = await get_ai_suggestion_async(suggestion_request.prompt,
+                                                                suggestion_request.step_index,
+                                                                suggestion_request.user_id)
+                except AdmissionTimeout as e:
+                    app.logger.warning(f"Model call not admitted: {str(e)}")
+                    await _send(send, 503, {'Content-Type': 'application/json', 'Retry-After': '5'},
+                                json.dumps({'error': AI_BUSY_ERROR}).encode())
+                    return
+                await asyncio.to_thread(finish_suggestion, suggestion_request, ai_response, flight)
+    await _send(send, 200, {'Content-Type': 'application/json'}, json.dumps(ai_response).encode())
+
+
+def finish_suggestion(suggestion_request, ai_response, flight):
+    # Blocking (the cache's SQLite tier, the flight's result file), so run in a worker thread
+    check_pre_filled_data(suggestion_request.step_index, ai_response)
+    store_suggestion(suggestion_request, ai_response)
+    flight.publish(ai_response)
+
+
+async def get_suggestion_stream(scope, receive, send):
+    suggestion_request, error = await asyncio.to_thread(_prepare, scope)
+    if error:
+        await _send(send, *error)
+        return
+
+    await _send_events(send, suggestion_events(suggestion_request))
+
+
+async def get_step_bundle(scope, receive, send):
+    bundle_request, error = await asyncio.to_thread(_prepare, scope, prepare_step_bundle)
+    if error:
+        await _send(send, *error)
+        return
+    await _send_events(send, bundle_events(bundle_request))
+
+
+async def submit_step_bundle(scope, receive, send):
+    body = await _read_body(receive)
+    bundle_request, error = await asyncio.to_thread(_prepare, scope, prepare_submitted_step_bundle, body)
+    if error:
+        await _send(send, *error)
+        return
+    await _send_events(send, bundle_events(bundle_request))
+
+
+async def bundle_events(bundle_request):
+    """Async counterpart of ``app.bundle_events``."""
+    if bundle_request.summary_job_id is not None:
+        yield 'completed', {'completed': True, 'summary_job_id': bundle_request.summary_job_id}
+        return
+    yield 'step', bundle_request.bundle
+    if bundle_request.suggestion_request is not None:
+        async for kind, payload in suggestion_events(bundle_request.suggestion_request):
+            yield kind, payload
+
+
+async def suggestion_events(suggestion_request):
+    """``(event, payload)`` of a streamed suggestion, like ``app.suggestion_events``."""
+    if suggestion_request.cached is not None:
+        yield 'done', suggestion_request.cached
+        return
+    async with single_flight.async_flight(suggestion_request.cache_key) as flight:
+        if flight.shared:
+            yield 'done', flight.result
+            return
+        async for kind, payload in stream_ai_suggestion_async(suggestion_request.prompt,
+                                                              suggestion_request.step_index,
+                                                              suggestion_request.user_id):
+            if kind == 'pre_filled_data':
+                payload, _ = step_validator.clean(suggestion_request.step_index, payload)
+            elif kind == 'done':
+                await asyncio.to_thread(finish_suggestion, suggestion_request, payload, flight)
+            yield kind, payload
+
+
+async def _send_events(send, events):
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': _encode_headers(dict(SSE_HEADERS, **{'Content-Type': 'text/event-stream'}))})
+    async for kind, payload in events:
+        await send({'type': 'http.response.body', 'body': format_sse(kind, payload).encode(), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def create_message_async(user_id, **kwargs):
+    attempt = 0
+    while True:
+        async with admission.async_slot(user_id, estimated_call_tokens(kwargs)) as slot:
+            started = time.perf_counter()
+            try:
+                response = await get_async_client().messages.create(**kwargs)
+            except anthropic.RateLimitError as e:
+                if not await asyncio.to_thread(rate_limited, e, attempt):
+                    raise
+                attempt += 1
+                continue
+            record_model_call('suggestion', time.perf_counter() - started, response.usage)
+            await asyncio.to_thread(slot.settle, usage_tokens(response.usage))
+            return response
+
+
+async def get_ai_suggestion_async(prompt, step_index, user_id=None):
+    try:
+        response = await create_message_async(user_id, **suggestion_request_kwargs(prompt, step_index))
+        log_model_exchange(prompt, reply_text(response.content))
+        return parse_reply(response.content, response.stop_reason)
+    except AdmissionTimeout:
+        raise
+    except Exception as e:
+        app.logger.error(f"Error in get_ai_suggestion_async: {str(e)}", exc_info=True)
+        return {"suggestion": AI_SUGGESTION_ERROR, "pre_filled_data": {}}
+
+
+async def reply_chunks_async(stream):
+    async for stream_event in stream:
+        if stream_event.type == 'text':
+            yield stream_event.text
+        elif stream_event.type == 'input_json':
+            yield stream_event.partial_json
+
+
+async def stream_ai_suggestion_async(prompt, step_index, user_id=None):
+    parser = SuggestionStreamParser()
+    chunks = []
+    kwargs = suggestion_request_kwargs(prompt, step_index)
+    try:
+        attempt = 0
+        while True:
+            async with admission.async_slot(user_id, estimated_call_tokens(kwargs)) as slot:
+                started = time.perf_counter()
+                first_token = None
+                try:
+                    async with get_async_client().messages.stream(**kwargs) as stream:
+                        async for text in reply_chunks_async(stream):
+                            if first_token is None:
+                                first_token = time.perf_counter() - started
+                            chunks.append(text)
+                            for parsed in parser.feed(text):
+                                yield parsed
+                        final_message = await stream.get_final_message()
+                    record_model_call('suggestion_stream', time.perf_counter() - started, final_message.usage,
+                                      first_token)
+                    await asyncio.to_thread(slot.settle, usage_tokens(final_message.usage))
+                    break
+                except anthropic.RateLimitError as e:
+                    if chunks or not await asyncio.to_thread(rate_limited, e, attempt):
+                        raise
+                    attempt += 1
+        response_text = ''.join(chunks)
+        log_model_exchange(prompt, response_text)
+        yield 'done', normalize_ai_response(parser.finish(), not is_valid_json(response_text), response_text,
+                                            output_mode(kwargs))
+    except AdmissionTimeout as e:
+        app.logger.warning(f"Model call not admitted: {str(e)}")
+        yield 'error', {"suggestion": AI_BUSY_ERROR, "pre_filled_data": {}}
+    except Exception as e:
+        app.logger.error(f"Error in stream_ai_suggestion_async: {str(e)}", exc_info=True)
+        yield 'error', {"suggestion": AI_SUGGESTION_ERROR, "pre_filled_data": {}}
+
+
+ASYNC_ROUTES = {
+    ('GET', '/api/get_suggestion'): get_suggestion,
+    ('GET', '/api/get_suggestion_stream'): get_suggestion_stream,
+    ('GET', '/api/step_bundle'): get_step_bundle,
+    ('POST', '/api/submit_step_bundle'): submit_step_bundle,
+}
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    handler = ASYNC_ROUTES.get((scope['method'], scope['path'])) if scope['type'] == 'http' else None
+    if handler is None:
+        await wsgi_application(scope, receive, send)
+        return
+
+    # The Flask request hooks do not run for these routes, so time them here
+    started = time.perf_counter()
+
+    async def timed_send(message):
+        if message['type'] == 'http.response.start':
+            http_request_seconds.observe(time.perf_counter() - started, method=scope['method'], route=scope['path'],
+                                         status=message['status'])
+        await send(message)
+    await handler(scope, receive, timed_send)
+
+
+async def _read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _send(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': _encode_headers(headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _encode_headers(headers):
+    return [(name.lower().encode('latin-1'), str(value).encode('latin-1')) for name, value in headers.items()]
@@ -0,0 +1,96 @@
+import json
+import time
+from collections import namedtuple
+
+import httpx
+
+# Limits of one message batch
+MAX_BATCH_REQUESTS = 10000
+BATCH_DISCOUNT = 0.5
+
+BatchRun = namedtuple('BatchRun', 'results batches succeeded errored input_tokens cache_write_tokens '
+                                   'cache_read_tokens output_tokens elapsed')
+# Prompt cache writes and reads, relative to the input token price
+CACHE_WRITE_PRICE = 1.25
+CACHE_READ_PRICE = 0.1
+
+
+class MessageBatches:
+    """The Message Batches API, called through the SDK's HTTP layer.
+
+    The pinned ``anthropic`` release predates ``client.messages.batches``; going
+    through ``client.post``/``client.get`` keeps its authentication, base URL,
+    timeouts and retries. Batches are plain dicts as returned by the API.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, requests):
+        return self.client.post('/v1/messages/batches', body={'requests': requests}, cast_to=httpx.Response).json()
+
+    def retrieve(self, batch_id):
+        return self.client.get(f"/v1/messages/batches/{batch_id}", cast_to=httpx.Response).json()
+
+    def results(self, batch):
+        """Yield the JSONL result lines of an ended batch, in no particular order."""
+        response = self.client.get(batch['results_url'], cast_to=httpx.Response)
+        for line in response.text.splitlines():
+            if line.strip():
+                yield json.loads(line)
+
+
+def message_batches(client):
+    # The offline fake client brings its own
+    return getattr(client, 'message_batches', None) or MessageBatches(client)
+
+
+def run_batches(batches, requests, poll_interval=30.0, max_batch_requests=MAX_BATCH_REQUESTS, on_poll=None):
+    """Submit ``requests`` (``{'custom_id', 'params'}`` dicts) and wait for every result.
+
+    Requests are split into batches of at most ``max_batch_requests``, all
+    submitted up front and then polled every ``poll_interval`` seconds until
+    they have ended. Returns a ``BatchRun`` whose ``results`` maps each
+    ``custom_id`` to its result (``{'type': 'succeeded', 'message': {...}}`` or an
+    errored, canceled or expired result).
+    """
+    started = time.monotonic()
+    pending = [batches.create(requests[i:i + max_batch_requests])
+               for i in range(0, len(requests), max_batch_requests)]
+    submitted = len(pending)
+    results = {}
+    succeeded = errored = input_tokens = cache_write_tokens = cache_read_tokens = output_tokens = 0
+    while pending:
+        time.sleep(poll_interval)
+        still_pending = []
+        for batch in pending:
+            batch = batches.retrieve(batch['id'])
+            if on_poll:
+                on_poll(batch)
+            if batch['processing_status'] != 'ended':
+                still_pending.append(batch)
+                continue
+            for line in batches.results(batch):
+                result = line['result']
+                results[line['custom_id']] = result
+                if result['type'] == 'succeeded':
+                    succeeded += 1
+                    usage = result['message']['usage']
+                    input_tokens += usage['input_tokens']
+                    cache_write_tokens += usage.get('cache_creation_input_tokens') or 0
+                    cache_read_tokens += usage.get('cache_read_input_tokens') or 0
+                    output_tokens += usage['output_tokens']
+                else:
+                    errored += 1
+        pending = still_pending
+    return BatchRun(results, submitted, succeeded, errored, input_tokens, cache_write_tokens, cache_read_tokens,
+                    output_tokens, time.monotonic() - started)
+
+
+def token_cost(input_tokens, output_tokens, input_price, output_price, batch=False,
+               cache_write_tokens=0, cache_read_tokens=0):
+    """Cost of the tokens at per-million-token prices; batches are billed at a discount."""
+    input_equivalent = (input_tokens + cache_write_tokens * CACHE_WRITE_PRICE +
+                        cache_read_tokens * CACHE_READ_PRICE)
+    cost = (input_equivalent * input_price + output_tokens * output_price) / 1e6
+    return cost * BATCH_DISCOUNT if batch else cost
@@ -0,0 +1,116 @@
+"""Concurrent write benchmark for the database configuration profile.
+
+Starts N worker processes, each saving steps of its own decision the way
+submit_step does (one step row upsert plus current_step, one commit per write),
+and reports total write throughput and failed writes. Each profile runs
+against a fresh SQLite file:
+
+    default  plain SQLite settings (rollback journal, synchronous=FULL)
+    tuned    the SQLITE_PRAGMAS profile from config.Config (WAL, busy_timeout, synchronous=NORMAL)
+
+    python -m benchmarks.bench_db_writes [--clients 1 4 8] [--writes 200]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from benchmarks.sample_data import STEP_DATA
+
+PROFILES = {
+    'default': '{}',
+    'tuned': None,
+}
+
+
+def _configure(db_path, pragmas):
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+    os.environ['USE_FAKE_ANTHROPIC'] = '1'
+    if pragmas is None:
+        os.environ.pop('SQLITE_PRAGMAS', None)
+    else:
+        os.environ['SQLITE_PRAGMAS'] = pragmas
+
+
+def _setup(db_path, pragmas, clients):
+    _configure(db_path, pragmas)
+    import app as app_module
+    with app_module.app.app_context():
+        app_module.db.create_all()
+        user = app_module.User(username='bench')
+        user.set_password('bench')
+        app_module.db.session.add(user)
+        app_module.db.session.commit()
+        for i in range(clients):
+            app_module.db.session.add(app_module.Decision(user_id=user.id, question=f"Decision {i}",
+                                                          framework='personal', data={}))
+        app_module.db.session.commit()
+
+
+def _writer(db_path, pragmas, decision_id, writes, barrier, results):
+    _configure(db_path, pragmas)
+    import app as app_module
+    from decision_framework import PERSONAL_DECISION_FRAMEWORK
+    steps = PERSONAL_DECISION_FRAMEWORK['steps']
+    ok = failed = 0
+    with app_module.app.app_context():
+        # Open the pooled connection before the clock starts
+        app_module.db.session.get(app_module.Decision, decision_id)
+        barrier.wait()
+        started = time.time()
+        for i in range(writes):
+            step_index = i % len(steps)
+            title = steps[step_index]['title']
+            try:
+                decision = app_module.db.session.get(app_module.Decision, decision_id)
+                decision.save_step(step_index, title, STEP_DATA[title], "suggestion")
+                decision.current_step = step_index
+                app_module.db.session.commit()
+                ok += 1
+            except Exception:
+                app_module.db.session.rollback()
+                failed += 1
+    results.put((ok, failed, started, time.time()))
+
+
+def run_profile(name, clients, writes):
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, f"{name}.db")
+        pragmas = PROFILES[name]
+        setup = ctx.Process(target=_setup, args=(db_path, pragmas, clients))
+        setup.start()
+        setup.join()
+
+        results = ctx.Queue()
+        barrier = ctx.Barrier(clients)
+        workers = [ctx.Process(target=_writer, args=(db_path, pragmas, i + 1, writes, barrier, results))
+                   for i in range(clients)]
+        for worker in workers:
+            worker.start()
+        outcomes = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+    ok = sum(o[0] for o in outcomes)
+    failed = sum(o[1] for o in outcomes)
+    elapsed = max(o[3] for o in outcomes) - min(o[2] for o in outcomes)
+    return ok, failed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--writes', type=int, default=200, help='writes per client')
+    args = parser.parse_args()
+
+    print(f"{'profile':<10}{'clients':>8}{'writes/s':>12}{'failed':>8}{'seconds':>10}")
+    for clients in args.clients:
+        for name in PROFILES:
+            ok, failed, elapsed = run_profile(name, clients, args.writes)
+            print(f"{name:<10}{clients:>8}{ok / elapsed:>12.1f}{failed:>8}{elapsed:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
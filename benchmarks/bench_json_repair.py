@@ -0,0 +1,196 @@
+"""Regression, fuzz and throughput checks for json_repair.
+
+Runs three passes:
+
+    corpus      every case in json_repair_corpus.json must parse to its expected value;
+                the legacy json.loads/balance_json/split chain is scored on the same cases
+    fuzz        random replies built from sample_data are fenced, given trailing commas,
+                truncated and fed in random chunks; the parser must never raise, chunked
+                and one-shot parsing must agree, and repairs must not change valid data
+    throughput  legacy chain vs repair_json on valid, fenced, truncated and
+                trailing-comma replies
+
+    python -m benchmarks.bench_json_repair [--fuzz 2000] [--iterations 200] [--seed 0]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import timeit
+from json.decoder import JSONDecodeError
+
+from json_repair import JsonRepairParser, repair_json
+
+from benchmarks.sample_data import STEP_DATA
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'json_repair_corpus.json')
+
+SUGGESTION = ("### Define the decision\nWrite the decision as one question with a deadline, e.g. "
+              "\"Should I accept the offer by Friday?\".\n\n- Name what is at stake\n- Note who else is affected\n")
+
+
+def balance_json(json_string):
+    stack = []
+    in_string = False
+    escape = False
+    for i, char in enumerate(json_string):
+        if char == '"' and not escape:
+            in_string = not in_string
+        elif not in_string:
+            if char in '{[':
+                stack.append(char)
+            elif char in '}]':
+                if stack and ((stack[-1] == '{' and char == '}') or (stack[-1] == '[' and char == ']')):
+                    stack.pop()
+                else:
+                    return None
+        escape = char == '\\' and not escape
+    if in_string:
+        json_string += '"'
+    closing = ''.join('}' if c == '{' else ']' for c in reversed(stack))
+    return json_string + closing
+
+
+def legacy_parse_ai_response(response_text):
+    """parse_ai_response as it was before json_repair, minus the logging."""
+    try:
+        return json.loads(response_text)
+    except JSONDecodeError:
+        balanced_json = balance_json(response_text)
+        if balanced_json is not None:
+            try:
+                return json.loads(balanced_json)
+            except JSONDecodeError:
+                pass
+        suggestion = ""
+        pre_filled_data = {}
+        if '"suggestion":' in response_text:
+            suggestion_parts = response_text.split('"suggestion":', 1)[1].split('"', 2)
+            suggestion = suggestion_parts[1] if len(suggestion_parts) > 1 else ""
+        if '"pre_filled_data":' in response_text:
+            pre_filled_data_str = response_text.split('"pre_filled_data":', 1)[1]
+            try:
+                pre_filled_data_balanced = balance_json(pre_filled_data_str)
+                if pre_filled_data_balanced is not None:
+                    pre_filled_data = json.loads(pre_filled_data_balanced)
+            except JSONDecodeError:
+                pass
+        return {"suggestion": suggestion, "pre_filled_data": pre_filled_data}
+
+
+def normalized(value):
+    # The shape parse_ai_response hands to the frontend
+    value = dict(value) if isinstance(value, dict) else {}
+    value.setdefault('suggestion', '')
+    value.setdefault('pre_filled_data', {})
+    return value
+
+
+def parse_chunked(text, rng):
+    parser = JsonRepairParser()
+    i = 0
+    while i < len(text):
+        size = rng.randint(1, 40)
+        parser.feed(text[i:i + size])
+        i += size
+    return parser.finish()
+
+
+def make_reply(rng):
+    data = STEP_DATA[rng.choice(sorted(STEP_DATA))]
+    reply = {'suggestion': SUGGESTION * rng.randint(1, 3), 'pre_filled_data': data}
+    return reply, json.dumps(reply, indent=rng.choice([None, 2, 4]))
+
+
+def add_trailing_commas(text):
+    return re.sub(r'([\]}"\d])(\s*)([\]}])', r'\1,\2\3', text)
+
+
+def run_corpus():
+    with open(CORPUS_PATH) as f:
+        corpus = json.load(f)
+    print(f"{'case':<32}{'repair_json':>14}{'legacy':>10}")
+    failures = 0
+    legacy_ok = 0
+    for case in corpus:
+        result = repair_json(case['input'])
+        ok = result == case['expected']
+        failures += not ok
+        try:
+            legacy = normalized(legacy_parse_ai_response(case['input'])) == normalized(case['expected'])
+        except Exception:
+            legacy = False
+        legacy_ok += legacy
+        print(f"{case['name']:<32}{'ok' if ok else 'FAIL':>14}{'ok' if legacy else 'lossy':>10}")
+    print(f"repair_json: {len(corpus) - failures}/{len(corpus)} as expected, "
+          f"legacy: {legacy_ok}/{len(corpus)} without data loss")
+    return failures
+
+
+def run_fuzz(iterations, rng):
+    failures = 0
+    for _ in range(iterations):
+        reply, text = make_reply(rng)
+        mutations = {
+            'valid': text,
+            'fenced': f"```json\n{text}\n```\nLet me know if you need more.",
+            'trailing_commas': add_trailing_commas(text),
+        }
+        for name, mutated in mutations.items():
+            if repair_json(mutated) != reply or parse_chunked(mutated, rng) != reply:
+                failures += 1
+                print(f"fuzz {name}: repaired value differs for {mutated[:80]!r}")
+        cut = text[:rng.randint(0, len(text))]
+        try:
+            one_shot = repair_json(cut)
+            chunked = parse_chunked(cut, rng)
+        except Exception as e:
+            failures += 1
+            print(f"fuzz truncated: raised {e!r} for {cut[-80:]!r}")
+            continue
+        if one_shot != chunked:
+            failures += 1
+            print(f"fuzz truncated: chunked result differs for {cut[-80:]!r}")
+        elif isinstance(one_shot, dict) and not reply['suggestion'].startswith(one_shot.get('suggestion', '')):
+            failures += 1
+            print(f"fuzz truncated: suggestion is not a prefix for {cut[-80:]!r}")
+    print(f"fuzz: {iterations} replies x 4 mutations, {failures} failures")
+    return failures
+
+
+def run_throughput(iterations, rng):
+    replies = [make_reply(rng)[1] for _ in range(20)]
+    inputs = {
+        'valid': replies,
+        'fenced': [f"```json\n{text}\n```" for text in replies],
+        'truncated': [text[:len(text) * 2 // 3] for text in replies],
+        'trailing_commas': [add_trailing_commas(text) for text in replies],
+    }
+    print(f"{'input':<18}{'legacy MB/s':>14}{'repair MB/s':>14}{'speedup':>10}")
+    for name, texts in inputs.items():
+        size = sum(len(text) for text in texts) * iterations / 1e6
+        legacy = timeit.timeit(lambda: [legacy_parse_ai_response(text) for text in texts], number=iterations)
+        repair = timeit.timeit(lambda: [repair_json(text) for text in texts], number=iterations)
+        print(f"{name:<18}{size / legacy:>14.1f}{size / repair:>14.1f}{legacy / repair:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fuzz', type=int, default=2000, help='random replies to mutate')
+    parser.add_argument('--iterations', type=int, default=200, help='throughput repetitions')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failures = run_corpus()
+    print()
+    failures += run_fuzz(args.fuzz, rng)
+    print()
+    run_throughput(args.iterations, rng)
+    if failures:
+        raise SystemExit(f"{failures} failures")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+"""End-to-end benchmark of the whole decision lifecycle against the fake model server.
+
+Starts benchmarks.fake_model_server and the app (see load_test for the modes),
+then runs ``--users`` simulated users, ``--concurrency`` at a time, through
+
+    register -> login -> start_decision -> 9 x (get_step, get_suggestion, submit_step) -> get_decisions
+
+or, with ``--flow bundle``, through the step bundle routes (one request per step)
+
+    register -> login -> start_decision -> step_bundle -> 9 x submit_step_bundle -> get_decisions
+
+``--rtt`` adds a network round trip before every request, as for users on
+slow mobile connections.
+Like a real user, a simulated user asks to regenerate a suggestion (up to
+``--max-regenerations`` times) when it comes back without all of the step's
+fields pre-filled. The run reports lifecycle and request throughput,
+p50/p95/p99 latency per endpoint, database growth, the app process's peak
+memory, the parse-failure and regeneration rates and what the app's /metrics
+saw of the model replies. ``--save`` writes the results as a JSON baseline;
+``--compare`` checks a run against one and exits non-zero if throughput or any
+endpoint's p95 is more than ``--tolerance`` worse. ``--output-mode both`` runs
+the text and tool output modes (SUGGESTION_OUTPUT_MODE) one after the other
+and compares them.
+
+    python -m benchmarks.bench_lifecycle --users 50 --concurrency 25 --save benchmarks/baselines/lifecycle.json
+    python -m benchmarks.bench_lifecycle --users 50 --concurrency 25 --compare benchmarks/baselines/lifecycle.json
+    python -m benchmarks.bench_lifecycle --output-mode both --malformed-rate 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks import harness
+from benchmarks.fake_model_server import add_arguments as add_model_arguments, model_server_args
+from benchmarks.load_test import SERVER_COMMANDS
+from benchmarks.sample_data import QUESTION, STEP_DATA
+from decision_framework import PERSONAL_DECISION_FRAMEWORK
+
+STEP_TITLES = [step['title'] for step in PERSONAL_DECISION_FRAMEWORK['steps']]
+ENDPOINTS = ['register', 'login', 'start_decision', 'get_step', 'get_suggestion', 'submit_step',
+             'step_bundle', 'submit_step_bundle', 'get_decisions']
+
+
+def missing_fields(title, ai_response):
+    pre_filled_data = (ai_response or {}).get('pre_filled_data') or {}
+    return [name for name in STEP_DATA[title] if pre_filled_data.get(name) in (None, '', [], {})]
+
+
+def json_body(response):
+    return response.json() if response is not None else None
+
+
+def streamed_suggestion(response):
+    """The final suggestion in a step bundle's event stream, if it has one."""
+    if response is None:
+        return None
+    for message in response.text.split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in message.splitlines() if ': ' in line)
+        if lines.get('event') == 'done':
+            return json.loads(lines['data'])
+    return None
+
+
+async def run_user(base_url, user, latencies, errors, suggestions, args):
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+
+        async def call(endpoint, method, path, **kwargs):
+            started = time.perf_counter()
+            if args.rtt:
+                await asyncio.sleep(args.rtt)
+            try:
+                response = await client.request(method, path, **kwargs)
+            except httpx.HTTPError as e:
+                errors.append(f"{endpoint}: {e!r}")
+                return None
+            latencies[endpoint].append(time.perf_counter() - started)
+            if response.status_code >= 400 or 'Error generating' in response.text:
+                errors.append(f"{endpoint}: HTTP {response.status_code}: {response.text[:200]}")
+                return None
+            return response
+
+        credentials = {'username': f"bench-user-{user}", 'password': 'bench'}
+        await call('register', 'POST', '/register', json=credentials)
+        if await call('login', 'POST', '/login', json=credentials) is None:
+            return False
+        # A question of its own keeps users from sharing cached suggestions
+        response = await call('start_decision', 'POST', '/api/start_decision',
+                              json={'question': f"{QUESTION} (user {user})"})
+        if response is None:
+            return False
+        decision_id = response.json()['decision_id']
+        if args.flow == 'bundle':
+            ai_response = streamed_suggestion(await call('step_bundle', 'GET', '/api/step_bundle',
+                                                         params={'decision_id': decision_id, 'step': 0}))
+        for step_index, title in enumerate(STEP_TITLES):
+            params = {'decision_id': decision_id, 'step': step_index}
+            if args.flow == 'split':
+                await call('get_step', 'GET', '/api/get_step', params=params)
+                ai_response = json_body(await call('get_suggestion', 'GET', '/api/get_suggestion', params=params))
+            suggestions['requested'] += 1
+            regenerations = 0
+            while missing_fields(title, ai_response):
+                suggestions['incomplete'] += 1
+                if regenerations == args.max_regenerations:
+                    break
+                regenerations += 1
+                suggestions['regenerated'] += 1
+                ai_response = json_body(await call('get_suggestion', 'GET', '/api/get_suggestion',
+                                                   params=dict(params, regenerate=1)))
+            submission = {'decision_id': decision_id, 'step_index': step_index, 'step_data': STEP_DATA[title],
+                          'ai_suggestion': (ai_response or {}).get('suggestion', '')}
+            if args.flow == 'bundle':
+                # The response carries the next step and its suggestion
+                response = await call('submit_step_bundle', 'POST', '/api/submit_step_bundle', json=submission)
+                ai_response = streamed_suggestion(response)
+            else:
+                response = await call('submit_step', 'POST', '/api/submit_step', json=submission)
+            if response is None:
+                return False
+        return await call('get_decisions', 'GET', '/api/get_decisions') is not None
+
+
+async def run_lifecycles(base_url, args):
+    latencies = {endpoint: [] for endpoint in ENDPOINTS}
+    errors = []
+    suggestions = {'requested': 0, 'incomplete': 0, 'regenerated': 0}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def user_task(user):
+        async with semaphore:
+            return await run_user(base_url, user, latencies, errors, suggestions, args)
+
+    started = time.perf_counter()
+    completed = await asyncio.gather(*(user_task(user) for user in range(args.users)))
+    return latencies, errors, suggestions, sum(completed), time.perf_counter() - started
+
+
+def db_size(db_path):
+    """Size of the database file once the WAL is checkpointed into it.
+
+    The WAL keeps its size after a checkpoint until it is truncated, so
+    counting it would add however much was written, not what is stored.
+    """
+    with sqlite3.connect(db_path) as connection:
+        connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    connection.close()
+    return os.path.getsize(db_path)
+
+
+def peak_memory(pid):
+    """Peak resident memory of ``pid`` in bytes (Linux only; ``None`` elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def scrape_metrics(base_url):
+    """Model reply and SQL totals from the app's /metrics."""
+    try:
+        text = httpx.get(f"{base_url}/metrics", timeout=10).text
+    except httpx.HTTPError:
+        return {}
+    totals = {}
+    for name, labels, value in re.findall(r'^(ai_response_parse_total|suggestion_regenerations_total|'
+                                          r'llm_tokens_total|db_queries_total)'
+                                          r'(\{[^}]*\})? (\S+)$', text, re.MULTILINE):
+        key = name + (labels.replace('"', '') if labels else '')
+        totals[key] = float(value)
+    return totals
+
+
+def parse_failure_rate(app_metrics):
+    """Share of the model replies that /metrics counted as repaired or unusable."""
+    parses = {key: value for key, value in app_metrics.items() if key.startswith('ai_response_parse_total')}
+    failed = sum(value for key, value in parses.items() if 'outcome=valid' not in key)
+    return failed / sum(parses.values()) if parses else None
+
+
+def summarize(args, output_mode, latencies, errors, suggestions, completed, elapsed, db_before, db_after, memory,
+              app_metrics):
+    requests = sum(len(values) for values in latencies.values())
+    return {
+        'params': {'mode': args.mode, 'users': args.users, 'concurrency': args.concurrency,
+                   'latency': args.latency, 'tokens_per_second': args.tokens_per_second,
+                   'output_chars': args.output_chars, 'malformed_rate': args.malformed_rate,
+                   'prefetch': not args.no_prefetch, 'output_mode': output_mode,
+                   'max_regenerations': args.max_regenerations, 'flow': args.flow, 'rtt': args.rtt},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'elapsed_seconds': elapsed,
+        'lifecycles_completed': completed,
+        'lifecycles_per_second': completed / elapsed,
+        'requests_per_second': requests / elapsed,
+        'errors': len(errors),
+        'endpoints': {endpoint: {'count': len(values),
+                                 'p50_ms': harness.percentile(values, 50) * 1000,
+                                 'p95_ms': harness.percentile(values, 95) * 1000,
+                                 'p99_ms': harness.percentile(values, 99) * 1000}
+                      for endpoint, values in latencies.items()},
+        'db_bytes_before': db_before,
+        'db_bytes_after': db_after,
+        'db_bytes_per_lifecycle': (db_after - db_before) / completed if completed else None,
+        'app_peak_memory_bytes': memory,
+        'suggestions': suggestions,
+        'parse_failure_rate': parse_failure_rate(app_metrics),
+        'regeneration_rate': suggestions['regenerated'] / suggestions['requested'] if suggestions['requested'] else None,
+        'app_metrics': app_metrics,
+    }
+
+
+def report(results, errors):
+    print(f"{results['lifecycles_completed']}/{results['params']['users']} lifecycles in "
+          f"{results['elapsed_seconds']:.1f}s: {results['lifecycles_per_second']:.2f} lifecycles/s, "
+          f"{results['requests_per_second']:.1f} req/s, {results['errors']} errors")
+    if errors:
+        print(f"first error: {errors[0]}")
+    print(f"{'endpoint':<18}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, stats in results['endpoints'].items():
+        if not stats['count']:
+            continue
+        print(f"{endpoint:<18}{stats['count']:>8}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    growth = results['db_bytes_per_lifecycle']
+    print(f"database: {results['db_bytes_before'] / 1e6:.2f} MB -> {results['db_bytes_after'] / 1e6:.2f} MB"
+          + (f" ({growth / 1e3:.1f} KB per lifecycle)" if growth is not None else ''))
+    if results['app_peak_memory_bytes'] is not None:
+        print(f"app peak memory: {results['app_peak_memory_bytes'] / 1e6:.1f} MB")
+    suggestions = results['suggestions']
+    print(f"suggestions: {suggestions['requested']} requested, {suggestions['incomplete']} incomplete, "
+          f"{suggestions['regenerated']} regenerated ({results['regeneration_rate'] or 0:.1%}); "
+          f"parse failures {results['parse_failure_rate'] or 0:.1%} of model replies")
+    for key, value in sorted(results['app_metrics'].items()):
+        print(f"{key}: {value:g}")
+
+
+def compare(results, baseline, tolerance):
+    """Print the change against ``baseline``; returns the regressions beyond ``tolerance``."""
+    regressions = []
+    print(f"\n{'vs baseline':<30}{'baseline':>12}{'now':>12}{'change':>10}")
+
+    def row(name, before, after, higher_is_better):
+        change = (after - before) / before if before else 0.0
+        print(f"{name:<30}{before:>12.1f}{after:>12.1f}{change:>+9.0%}")
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(name)
+
+    row('lifecycles/s', baseline['lifecycles_per_second'], results['lifecycles_per_second'], True)
+    for endpoint, stats in results['endpoints'].items():
+        before = baseline['endpoints'].get(endpoint)
+        if before and stats['count']:
+            row(f"{endpoint} p95 ms", before['p95_ms'], stats['p95_ms'], False)
+    if baseline['params'] != results['params']:
+        print(f"note: baseline was run with different parameters: {baseline['params']}")
+    return regressions
+
+
+def compare_modes(runs):
+    """Print the text and tool output modes side by side."""
+    print(f"\n{'output mode':<30}" + ''.join(f"{mode:>12}" for mode in runs))
+
+    def row(name, value, fmt):
+        print(f"{name:<30}" + ''.join(f"{format(value(results), fmt):>12}" for results in runs.values()))
+
+    row('parse failures', lambda r: r['parse_failure_rate'] or 0, '.1%')
+    row('incomplete suggestions', lambda r: r['suggestions']['incomplete'] / r['suggestions']['requested'], '.1%')
+    row('regenerations', lambda r: r['regeneration_rate'] or 0, '.1%')
+    row('suggestion calls per lifecycle', lambda r: sum(
+        value for key, value in r['app_metrics'].items() if key.startswith('ai_response_parse_total'))
+        / max(r['lifecycles_completed'], 1), '.2f')
+    row('prompt tokens per lifecycle', lambda r: sum(
+        value for key, value in r['app_metrics'].items()
+        if key.startswith('llm_tokens_total') and 'direction=output' not in key)
+        / max(r['lifecycles_completed'], 1), ',.0f')
+    row('lifecycles/s', lambda r: r['lifecycles_per_second'], '.2f')
+    row('get_suggestion p95 ms', lambda r: r['endpoints']['get_suggestion']['p95_ms'], '.1f')
+
+
+def run(args, output_mode):
+    """One benchmark run against fresh servers; returns ``(results, errors)``."""
+    model_port = harness.free_port()
+    app_port = harness.free_port()
+    base_url = f"http://127.0.0.1:{app_port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'lifecycle.db')
+        env = harness.app_env(db_path, model_port, PREFETCH_SUGGESTIONS=int(not args.no_prefetch),
+                              SINGLE_FLIGHT_LOCK_DIR=os.path.join(tmp, 'single_flight'),
+                              SUGGESTION_OUTPUT_MODE=output_mode)
+        harness.create_tables(env)
+        db_before = db_size(db_path)
+        model_server = harness.start(['-m', 'benchmarks.fake_model_server', '--port', str(model_port)]
+                                     + model_server_args(args), port=model_port)
+        app_server = harness.start(SERVER_COMMANDS[args.mode] + ['--port', str(app_port), '--log-level', 'warning'],
+                                   env=env, port=app_port)
+        try:
+            latencies, errors, suggestions, completed, elapsed = asyncio.run(
+                run_lifecycles(base_url, args))
+            app_metrics = scrape_metrics(base_url)
+            memory = peak_memory(app_server.pid)
+        finally:
+            harness.stop(app_server)
+            harness.stop(model_server)
+        db_after = db_size(db_path)
+
+    results = summarize(args, output_mode, latencies, errors, suggestions, completed, elapsed, db_before, db_after,
+                        memory, app_metrics)
+    return results, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=sorted(SERVER_COMMANDS), default='asgi')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=25)
+    parser.add_argument('--no-prefetch', action='store_true', help='run with PREFETCH_SUGGESTIONS=0')
+    parser.add_argument('--save', metavar='PATH', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='baseline to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before failing --compare')
+    parser.add_argument('--output-mode', choices=['text', 'tool', 'both'], default='text',
+                        help='SUGGESTION_OUTPUT_MODE of the app, or both to compare them')
+    parser.add_argument('--flow', choices=['split', 'bundle'], default='split',
+                        help='per-step requests: get_step/get_suggestion/submit_step, or the step bundle routes')
+    parser.add_argument('--rtt', type=float, default=0.0, help='simulated network round trip per request, seconds')
+    parser.add_argument('--max-regenerations', type=int, default=1,
+                        help='times a user regenerates a suggestion missing pre-filled fields')
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    if args.output_mode == 'both':
+        runs = {}
+        for output_mode in ('text', 'tool'):
+            print(f"== {output_mode} output mode")
+            runs[output_mode], errors = run(args, output_mode)
+            report(runs[output_mode], errors)
+        compare_modes(runs)
+        return
+
+    results, errors = run(args, args.output_mode)
+    report(results, errors)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(f"regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+
+
+if __name__ == '__main__':
+    main()
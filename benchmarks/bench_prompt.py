@@ -0,0 +1,49 @@
+"""Micro-benchmark for prompt rendering.
+
+Compares the original generate_prompt (rebuilding every section and re-serializing
+the context on each call) with the precompiled prompts in prompt_template.
+
+    python -m benchmarks.bench_prompt [--iterations 2000]
+"""
+import argparse
+import json
+import timeit
+
+from decision_framework import PERSONAL_DECISION_FRAMEWORK
+from prompt_template import PROMPT_TEMPLATE, generate_field_description, generate_field_format, generate_prompt
+
+from benchmarks.sample_data import sample_context
+
+
+def legacy_generate_prompt(step, current_context):
+    fields_text = "\n".join([generate_field_description(field) for field in step['fields']])
+    field_format = generate_field_format(step['fields'])
+    formatted_context = "\n".join([f"{key}:\n{json.dumps(value, indent=2)}" for key, value in current_context.items()])
+    return PROMPT_TEMPLATE.format(
+        step_title=step['title'],
+        step_description=step.get('description', 'No description provided'),
+        current_context=formatted_context,
+        fields=fields_text,
+        field_format=field_format
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    steps = PERSONAL_DECISION_FRAMEWORK['steps']
+    print(f"{'step':<24}{'legacy us/call':>16}{'compiled us/call':>18}{'speedup':>10}")
+    for index, step in enumerate(steps):
+        context = sample_context(index)
+        assert legacy_generate_prompt(step, context) == generate_prompt(step, context)
+        legacy = timeit.timeit(lambda: legacy_generate_prompt(step, context), number=args.iterations)
+        compiled = timeit.timeit(lambda: generate_prompt(step, context), number=args.iterations)
+        legacy_us = legacy / args.iterations * 1e6
+        compiled_us = compiled / args.iterations * 1e6
+        print(f"{step['title']:<24}{legacy_us:>16.1f}{compiled_us:>18.1f}{legacy_us / compiled_us:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Throughput of the weight-sensitivity analysis in scoring.py.
+
+Scores random options x criteria matrices with ``--samples`` weight samples
+each and reports samples per second, against a plain Python loop doing the
+same per-sample work (run on fewer samples, since it is much slower):
+
+    python -m benchmarks.bench_scoring [--samples 100000] [--sizes 4x4 20x10 100x30 500x50]
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from scoring import DecisionMatrix, score_decision
+
+
+def random_matrix(n_options, n_criteria, rng):
+    criteria = [{'name': f"criterion {j}", 'weight': rng.randint(1, 100)} for j in range(n_criteria)]
+    evaluations = {f"option {i}": {c['name']: rng.randint(1, 5) for c in criteria} for i in range(n_options)}
+    return DecisionMatrix.from_step_data(criteria, evaluations)
+
+
+def python_sensitivity(scores, weights, samples, spread, rng):
+    """The per-sample work of scoring.sensitivity, one sample at a time."""
+    scores = scores.tolist()
+    weights = weights.tolist()
+    wins = [0] * len(scores)
+    rank_sum = [0] * len(scores)
+    for _ in range(samples):
+        perturbed = [w * rng.uniform(1 - spread, 1 + spread) for w in weights]
+        total_weight = sum(perturbed)
+        totals = [sum(s * w for s, w in zip(row, perturbed)) / total_weight * 100 for row in scores]
+        order = sorted(range(len(totals)), key=lambda i: -totals[i])
+        wins[order[0]] += 1
+        for rank, i in enumerate(order, 1):
+            rank_sum[i] += rank
+    return wins, rank_sum
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=100000)
+    parser.add_argument('--python-samples', type=int, default=2000, help='samples for the plain Python loop')
+    parser.add_argument('--sizes', nargs='+', default=['4x4', '20x10', '100x30', '500x50'],
+                        help='options x criteria')
+    parser.add_argument('--spread', type=float, default=0.2)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'size':<10}{'numpy samples/s':>18}{'ms':>10}{'python samples/s':>18}{'speedup':>10}")
+    for size in args.sizes:
+        n_options, n_criteria = (int(n) for n in size.split('x'))
+        matrix = random_matrix(n_options, n_criteria, rng)
+        score_decision(matrix, samples=1000)  # warm up
+
+        started = time.perf_counter()
+        score_decision(matrix, samples=args.samples, spread=args.spread)
+        elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        python_sensitivity(matrix.scores, matrix.weights, args.python_samples, args.spread, rng)
+        python_rate = args.python_samples / (time.perf_counter() - started)
+
+        rate = args.samples / elapsed
+        print(f"{size:<10}{rate:>18,.0f}{elapsed * 1000:>10.1f}{python_rate:>18,.0f}{rate / python_rate:>9.0f}x")
+    print(f"numpy {np.__version__}")
+
+
+if __name__ == '__main__':
+    main()
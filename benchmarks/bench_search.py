@@ -0,0 +1,182 @@
+"""Query latency of the FTS5 decision search index in search.py.
+
+Fills a fresh SQLite file with ``--decisions`` decisions spread over
+``--users`` users, with questions, summaries and step data drawn from a
+Zipf-distributed vocabulary, builds the index the way the b8e4d17a3c52
+migration does, then runs ``--queries`` searches of each kind as random users
+and reports latency per page of ``--limit`` results:
+
+    owner   find_decisions, which intersects the query with the user's owner
+            token inside the index
+    join    the same query without the owner token, filtered by joining
+            decision.user_id, as a plain external-content index would
+
+It also reports how long a submitted step takes to re-index, against
+rebuilding the decision's steps text from all of its stored steps.
+
+    python -m benchmarks.bench_search [--decisions 100000] [--users 1000] [--queries 200]
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.harness import percentile
+from benchmarks.sample_data import STEP_DATA
+
+COMMON_WORDS = ("option cost risk family income career learn skill time plan stay move offer team growth salary "
+                "market manager bootcamp degree savings goal value confidence review month year evidence "
+                "priority outcome criteria weight score regret friend mentor project python analytics").split()
+SYLLABLES = "ka lo mi ren tas vel dor pin sul gar mo tek bri fan zu col har nid op quin".split()
+QUERY_KINDS = ['common word', 'rare word', 'two words', 'no match']
+
+
+def vocabulary():
+    """Common words first, then made-up ones; word frequency falls off as 1/rank."""
+    words = COMMON_WORDS + [''.join(parts) for parts in itertools.product(SYLLABLES, repeat=3)]
+    return words, list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+
+def prose(rng, words, cum_weights, count):
+    return ' '.join(rng.choices(words, cum_weights=cum_weights, k=count))
+
+
+def fill(app_module, decisions, users, rng):
+    """Insert ``decisions`` decisions with their steps, stored compressed as the app stores them."""
+    from sqlalchemy import text
+    from compression import compress
+    from config import Config
+    db = app_module.db
+    words, cum_weights = vocabulary()
+    db.session.execute(text("INSERT INTO user (id, username, password_hash) VALUES (:id, :name, 'x')"),
+                       [{'id': user, 'name': f"user{user}"} for user in range(1, users + 1)])
+    titles = list(STEP_DATA)
+    for first in range(1, decisions + 1, 1000):
+        batch = range(first, min(first + 1000, decisions + 1))
+        db.session.execute(text(
+            "INSERT INTO decision (id, user_id, question, framework, data, current_step, created_at, status, "
+            "summary, version) VALUES (:id, :user_id, :question, 'personal', '{}', :step, '2024-08-01 12:00:00', "
+            "'completed', :summary, 1)"
+        ), [{'id': decision_id, 'user_id': rng.randint(1, users), 'step': len(titles) - 1,
+             'question': f"Should I {prose(rng, words, cum_weights, 8)}?",
+             'summary': compress(prose(rng, words, cum_weights, 150).encode('utf-8'),
+                                 Config.COMPRESSION_CODEC, Config.COMPRESSION_MIN_BYTES)}
+            for decision_id in batch])
+        db.session.execute(text(
+            "INSERT INTO decision_step (decision_id, step_index, title, data, updated_at, version) "
+            "VALUES (:decision_id, :step_index, :title, :data, '2024-08-01 12:00:00', 1)"
+        ), [{'decision_id': decision_id, 'step_index': step_index, 'title': title,
+             'data': compress(json.dumps({'notes': prose(rng, words, cum_weights, 20)}).encode('utf-8'),
+                              Config.COMPRESSION_CODEC, Config.COMPRESSION_MIN_BYTES)}
+            for decision_id in batch for step_index, title in enumerate(titles)])
+    db.session.commit()
+
+
+def make_query(kind, rng):
+    words, _ = vocabulary()
+    if kind == 'common word':
+        return rng.choice(COMMON_WORDS[:10])
+    if kind == 'rare word':
+        return rng.choice(words[2000:])
+    if kind == 'two words':
+        return f"{rng.choice(COMMON_WORDS)} {rng.choice(words[len(COMMON_WORDS):500])}"
+    return 'zzzz'
+
+
+def join_filtered(connection, user_id, query, limit):
+    """The search without the owner token: every user's matches are ranked, then joined and filtered."""
+    from sqlalchemy import text
+    from search import MATCH_END, MATCH_START, SEARCH_TABLE, match_query
+    return connection.execute(text(
+        f"SELECT decision.id, {SEARCH_TABLE}.rank, highlight({SEARCH_TABLE}, 1, :start, :end), "
+        f"snippet({SEARCH_TABLE}, 2, :start, :end, '…', 24), snippet({SEARCH_TABLE}, 3, :start, :end, '…', 24) "
+        f"FROM {SEARCH_TABLE} JOIN decision ON decision.id = {SEARCH_TABLE}.rowid "
+        f"WHERE {SEARCH_TABLE} MATCH :expression AND decision.user_id = :user_id "
+        f"ORDER BY {SEARCH_TABLE}.rank, decision.id DESC LIMIT :limit"
+    ), {'expression': match_query(query), 'user_id': user_id, 'limit': limit,
+        'start': MATCH_START, 'end': MATCH_END}).fetchall()
+
+
+def measure(search, connection, users, queries, limit, rng):
+    timings, results = {}, {}
+    for kind in QUERY_KINDS:
+        latencies, found = [], 0
+        for _ in range(queries):
+            user_id, query = rng.randint(1, users), make_query(kind, rng)
+            started = time.perf_counter()
+            found += len(search(connection, user_id, query, limit))
+            latencies.append(time.perf_counter() - started)
+        timings[kind] = latencies
+        results[kind] = found / queries
+    return timings, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--decisions', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=200, help='searches of each kind')
+    parser.add_argument('--limit', type=int, default=20, help='results per page')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'search.db')
+        os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+        os.environ['USE_FAKE_ANTHROPIC'] = '1'
+        import app as app_module
+        from search import find_decisions, rebuild_search_index, steps_text, update_search_column
+        rng = random.Random(0)
+        with app_module.app.app_context():
+            db = app_module.db
+            db.create_all()
+            started = time.perf_counter()
+            fill(app_module, args.decisions, args.users, rng)
+            fill_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            with db.engine.begin() as connection:
+                rebuild_search_index(connection)
+            index_seconds = time.perf_counter() - started
+            db.session.remove()
+            database_bytes = os.path.getsize(db_path)
+
+            with db.engine.connect() as connection:
+                # Warm the page cache so both strategies start alike
+                measure(find_decisions, connection, args.users, 5, args.limit, rng)
+                owner, found = measure(find_decisions, connection, args.users, args.queries, args.limit, rng)
+                joined, _ = measure(join_filtered, connection, args.users, args.queries, args.limit, rng)
+
+            words, cum_weights = vocabulary()
+            reindex, rebuild = [], []
+            for _ in range(200):
+                decision = db.session.get(app_module.Decision, rng.randint(1, args.decisions))
+                step_index = rng.randrange(len(STEP_DATA))
+                data = {'notes': prose(rng, words, cum_weights, 20)}
+                started = time.perf_counter()
+                app_module.index_decision_step(decision, step_index, data)
+                db.session.commit()
+                reindex.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                step_data = {index: row.data for index, row in decision.load_steps().items()}
+                update_search_column(db.session, decision.id, 'steps', steps_text(step_data))
+                db.session.commit()
+                rebuild.append(time.perf_counter() - started)
+
+    print(f"{args.decisions} decisions, {args.users} users: filled in {fill_seconds:.1f}s, "
+          f"indexed in {index_seconds:.1f}s ({args.decisions / index_seconds:,.0f}/s), "
+          f"database {database_bytes / 1e6:.0f} MB")
+    print(f"{'query':<14}{'results':>9}{'owner p50':>11}{'p95':>8}{'p99':>8}{'join p50':>10}{'p95':>8}{'p99':>8}  (ms)")
+    for kind in QUERY_KINDS:
+        row = [percentile(timings[kind], pct) * 1000 for timings in (owner, joined) for pct in (50, 95, 99)]
+        print(f"{kind:<14}{found[kind]:>9.1f}{row[0]:>11.2f}{row[1]:>8.2f}{row[2]:>8.2f}"
+              f"{row[3]:>10.2f}{row[4]:>8.2f}{row[5]:>8.2f}")
+    print(f"re-index a submitted step: p50 {percentile(reindex, 50) * 1000:.2f} ms, "
+          f"p95 {percentile(reindex, 95) * 1000:.2f} ms; from all stored steps: "
+          f"p50 {percentile(rebuild, 50) * 1000:.2f} ms, p95 {percentile(rebuild, 95) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
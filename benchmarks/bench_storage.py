@@ -0,0 +1,144 @@
+"""Database size and row read time before and after compressing and deferring large columns.
+
+Fills a fresh SQLite file with ``--decisions`` completed decisions stored the
+way they were before compression (plain JSON and text), then measures
+
+    before  the rows as stored, every column loaded eagerly
+    after   the rows rewritten by the same recompression the 3f9d2b6c8a17
+            migration runs, loaded with the models' deferred columns
+
+for three reads: ``get`` (the decision row, as most endpoints load it),
+``get_step`` (one step with its suggestion plus the data of earlier steps) and
+``details`` (the decision with its summary). Sizes are after VACUUM.
+
+    python -m benchmarks.bench_storage [--decisions 500] [--reads 2000]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.sample_data import QUESTION, STEP_DATA
+
+WORDS = ("option cost risk family income career learn skill time plan stay move offer team growth salary "
+         "market manager bootcamp degree savings goal value trade-off confidence review month year evidence "
+         "priority outcome criteria weight score regret friend mentor project python analytics").split()
+
+
+def prose(rng, words):
+    sentences = []
+    while words > 0:
+        length = rng.randint(8, 20)
+        sentences.append(' '.join(rng.choice(WORDS) for _ in range(length)).capitalize() + '.')
+        words -= length
+    return ' '.join(sentences)
+
+
+def fill(app_module, decisions, rng):
+    """Insert ``decisions`` completed decisions as plain JSON/text, like rows written before compression."""
+    from sqlalchemy import text
+    db = app_module.db
+    db.session.execute(text("INSERT INTO user (id, username, password_hash) VALUES (1, 'bench', 'x')"))
+    step_id = 0
+    for decision_id in range(1, decisions + 1):
+        summary = '\n\n'.join(f"## {title}\n\n{prose(rng, 250)}" for title in STEP_DATA)
+        db.session.execute(text(
+            "INSERT INTO decision (id, user_id, question, framework, data, current_step, created_at, status, "
+            "summary, version) VALUES (:id, 1, :question, 'personal', '{}', :step, '2024-08-01 12:00:00', "
+            "'completed', :summary, 1)"
+        ), {'id': decision_id, 'question': QUESTION, 'step': len(STEP_DATA) - 1, 'summary': summary})
+        for step_index, (title, data) in enumerate(STEP_DATA.items()):
+            step_id += 1
+            db.session.execute(text(
+                "INSERT INTO decision_step (id, decision_id, step_index, title, data, ai_suggestion, updated_at, "
+                "version) VALUES (:id, :decision_id, :step_index, :title, :data, :suggestion, "
+                "'2024-08-01 12:00:00', 1)"
+            ), {'id': step_id, 'decision_id': decision_id, 'step_index': step_index, 'title': title,
+                'data': json.dumps(data), 'suggestion': json.dumps(prose(rng, 200))})
+    db.session.commit()
+
+
+def measure_reads(app_module, decisions, reads, eager, rng):
+    from sqlalchemy.orm import undefer
+    db, Decision = app_module.db, app_module.Decision
+    timings = {}
+    for name in ('get', 'get_step', 'details'):
+        # The details endpoint asks for the summary up front
+        options = [undefer(Decision.data), undefer(Decision.summary)] if eager else (
+            [undefer(Decision.summary)] if name == 'details' else [])
+        ids = [rng.randint(1, decisions) for _ in range(reads)]
+        started = time.perf_counter()
+        for decision_id in ids:
+            db.session.expunge_all()
+            decision = db.session.get(Decision, decision_id, options=options)
+            if name == 'get_step':
+                step_index = rng.randrange(len(STEP_DATA))
+                # Before deferral the earlier steps' suggestions came along with their data
+                {row.title: row.data for row in decision.load_steps(range(step_index), suggestions=eager).values()}
+                decision.load_steps([step_index], suggestions=True)[step_index].ai_suggestion
+            elif name == 'details':
+                decision.summary
+        timings[name] = (time.perf_counter() - started) / reads
+    db.session.rollback()
+    return timings
+
+
+def file_size(app_module, db_path):
+    from sqlalchemy import text
+    app_module.db.session.remove()
+    with app_module.db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text('VACUUM'))
+        connection.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+    return os.path.getsize(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--decisions', type=int, default=500)
+    parser.add_argument('--reads', type=int, default=2000, help='reads per measurement')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'storage.db')
+        os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+        os.environ['USE_FAKE_ANTHROPIC'] = '1'
+        import app as app_module
+        from compression import recompress_column, zstandard
+        from config import Config
+        rng = random.Random(0)
+        with app_module.app.app_context():
+            app_module.db.create_all()
+            fill(app_module, args.decisions, rng)
+            size_before = file_size(app_module, db_path)
+            before = measure_reads(app_module, args.decisions, args.reads, True, rng)
+
+            started = time.perf_counter()
+            stored_before = stored_after = 0
+            with app_module.db.engine.begin() as connection:
+                for table, column in (('decision', 'data'), ('decision', 'summary'),
+                                      ('decision_step', 'data'), ('decision_step', 'ai_suggestion')):
+                    _, column_before, column_after = recompress_column(
+                        connection, table, column, Config.COMPRESSION_CODEC, Config.COMPRESSION_MIN_BYTES)
+                    stored_before += column_before
+                    stored_after += column_after
+            recompress_seconds = time.perf_counter() - started
+            size_after = file_size(app_module, db_path)
+            after = measure_reads(app_module, args.decisions, args.reads, False, rng)
+
+    codec = 'zstd' if Config.COMPRESSION_CODEC == 'zstd' and zstandard is not None else 'zlib'
+    print(f"{args.decisions} decisions; recompressed in {recompress_seconds:.2f}s "
+          f"({codec}, threshold {Config.COMPRESSION_MIN_BYTES} bytes)")
+    print(f"{'':<22}{'before':>12}{'after':>12}{'change':>10}")
+    print(f"{'database MB':<22}{size_before / 1e6:>12.2f}{size_after / 1e6:>12.2f}"
+          f"{(size_after - size_before) / size_before:>+10.0%}")
+    print(f"{'large columns MB':<22}{stored_before / 1e6:>12.2f}{stored_after / 1e6:>12.2f}"
+          f"{(stored_after - stored_before) / stored_before:>+10.0%}")
+    for name in before:
+        print(f"{name + ' read ms':<22}{before[name] * 1000:>12.3f}{after[name] * 1000:>12.3f}"
+              f"{(after[name] - before[name]) / before[name]:>+10.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Throughput of the compiled step validators in validators.py.
+
+Validates the sample data of every framework step, a copy with one bad value
+in each field (so every field reports an error), and a large matrix, and
+reports validations per second:
+
+    python -m benchmarks.bench_validators [--seconds 0.5]
+"""
+import argparse
+import copy
+import time
+
+from benchmarks.sample_data import STEP_DATA
+from decision_framework import PERSONAL_DECISION_FRAMEWORK
+from validators import StepValidator
+
+STEPS = PERSONAL_DECISION_FRAMEWORK['steps']
+
+
+def broken(data):
+    """``data`` with the first value of every field replaced by one of the wrong type."""
+    data = copy.deepcopy(data)
+    for name, value in data.items():
+        if isinstance(value, str):
+            data[name] = 42
+        elif isinstance(value, list) and value:
+            value[0] = 42 if isinstance(value[0], str) else {'unknown': 'attribute'}
+        elif isinstance(value, dict):
+            row = next(iter(value.values()))
+            row[next(iter(row))] = 99
+    return data
+
+
+def large_matrix(rows, columns):
+    return {'evaluations': {f"option {i}": {f"criterion {j}": (i + j) % 5 + 1 for j in range(columns)}
+                            for i in range(rows)}}
+
+
+def rate(validate, step_index, data, seconds):
+    """Validations per second of ``data``, and the errors it produced."""
+    errors = validate(step_index, data)
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            validate(step_index, data)
+        count += 100
+    return count / (time.perf_counter() - started), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=0.5, help='time spent on each measurement')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    validator = StepValidator(PERSONAL_DECISION_FRAMEWORK)
+    print(f"compiled {len(STEPS)} steps in {(time.perf_counter() - started) * 1000:.2f} ms\n")
+
+    print(f"{'step':<24}{'valid/s':>12}{'invalid/s':>12}{'errors':>8}")
+    for step_index, step in enumerate(STEPS):
+        data = STEP_DATA[step['title']]
+        valid_rate, errors = rate(validator.validate, step_index, data, args.seconds)
+        assert not errors, errors
+        invalid_rate, errors = rate(validator.validate, step_index, broken(data), args.seconds)
+        print(f"{step['title']:<24}{valid_rate:>12,.0f}{invalid_rate:>12,.0f}{len(errors):>8}")
+
+    evaluate_index = next(i for i, step in enumerate(STEPS) if step['title'] == 'Evaluate Options')
+    for rows, columns in ((20, 10), (200, 50)):
+        matrix_rate, errors = rate(validator.validate, evaluate_index, large_matrix(rows, columns), args.seconds)
+        print(f"{f'{rows}x{columns} matrix':<24}{matrix_rate:>12,.0f}{'':>12}{len(errors):>8}")
+
+    clean_rate, _ = rate(validator.clean, evaluate_index, broken(STEP_DATA['Evaluate Options']), args.seconds)
+    print(f"\nclean() of invalid AI pre_filled_data: {clean_rate:,.0f}/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""Local stand-in for the Anthropic Messages API, for load tests and benchmarks.
+
+Implements ``POST /v1/messages`` (plain and ``stream: true``) and the Message
+Batches endpoints (batches end ``--batch-seconds`` after they are created) as
+an ASGI app.
+Point the app at it with ``ANTHROPIC_BASE_URL=http://127.0.0.1:<port>``.
+System blocks marked with ``cache_control`` are prompt-cached the way the real
+API does it (5 minute TTL refreshed on use, above a minimum prefix size); with
+``--prefill-tokens-per-second`` uncached prompt tokens also delay the reply.
+Replies pre-fill the step's fields with the sample data of the step named in
+the prompt; a request that forces a tool with ``tool_choice`` gets the reply as
+that tool's input. ``--malformed-rate`` makes that fraction of replies arrive
+damaged the way real model output sometimes is (code fences, trailing commas,
+cut off mid-reply); tool calls can only be cut off, since the API parses their
+input.
+
+    python -m benchmarks.fake_model_server --port 8400 --latency 0.5 --tokens-per-second 80
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+
+import uvicorn
+
+from benchmarks.sample_data import STEP_DATA
+from decision_framework import PERSONAL_DECISION_FRAMEWORK
+from json_repair import load_json
+from prompt_template import step_tool_name
+
+CHARS_PER_TOKEN = 4
+CACHE_TTL = 300
+MIN_CACHEABLE_TOKENS = 1024
+STEP_TITLES = {step_tool_name(step): step['title'] for step in PERSONAL_DECISION_FRAMEWORK['steps']}
+
+
+class FakeModelServer:
+    def __init__(self, latency=0.5, tokens_per_second=80.0, output_chars=600, malformed_rate=0.0, seed=0,
+                 batch_seconds=5.0, prefill_tokens_per_second=0.0):
+        self.latency = latency
+        self.batch_seconds = batch_seconds
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self._batches = {}
+        self._prompt_cache = {}
+        self.tokens_per_second = tokens_per_second
+        self.output_chars = output_chars
+        self.malformed_rate = malformed_rate
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+
+    def reply_text(self, request):
+        """``(text, tool name or None, stop_reason)`` of the reply to ``request``."""
+        tool_name = _forced_tool(request)
+        filler = "Consider each field carefully and write down concrete, specific answers. " * 20
+        text = json.dumps({
+            'suggestion': filler[:self.output_chars],
+            'pre_filled_data': STEP_DATA.get(_step_title(request, tool_name), {})
+        }, indent=2)
+        stop_reason = 'tool_use' if tool_name else 'end_turn'
+        if self._random.random() < self.malformed_rate:
+            malformation = self._random.choice(MALFORMATIONS)
+            if not tool_name:
+                text = malformation(text)
+            elif malformation is cut_off:
+                text, stop_reason = cut_off(text), 'max_tokens'
+        return text, tool_name, stop_reason
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['path'].startswith('/v1/messages/batches'):
+            await self._batch_endpoint(scope, receive, send)
+            return
+        if scope['path'] != '/v1/messages' or scope['method'] != 'POST':
+            await _respond(send, 404, NOT_FOUND)
+            return
+
+        request = await _read_json(receive)
+        text, tool_name, stop_reason, usage = self._reply(request)
+        message_id = f"msg_fake_{next(self._ids)}"
+
+        delay = self.latency
+        if self.prefill_tokens_per_second:
+            delay += (usage['input_tokens'] + usage['cache_creation_input_tokens']) / self.prefill_tokens_per_second
+        await asyncio.sleep(delay)
+        if request.get('stream'):
+            await self._stream(send, request, message_id, text, tool_name, stop_reason, usage)
+        else:
+            if self.tokens_per_second:
+                await asyncio.sleep(usage['output_tokens'] / self.tokens_per_second)
+            await _respond(send, 200, {
+                'id': message_id,
+                'type': 'message',
+                'role': 'assistant',
+                'model': request.get('model'),
+                'content': _content(text, tool_name),
+                'stop_reason': stop_reason,
+                'stop_sequence': None,
+                'usage': usage
+            })
+
+    def _reply(self, request):
+        text, tool_name, stop_reason = self.reply_text(request)
+        system = request.get('system') or []
+        if isinstance(system, str):
+            system = [{'type': 'text', 'text': system}]
+        tools_chars = len(json.dumps(request['tools'])) if request.get('tools') else 0
+        input_tokens = (len(json.dumps(request.get('messages', []))) + tools_chars +
+                        sum(len(block['text']) for block in system)) // CHARS_PER_TOKEN
+        cache_write = cache_read = 0
+        breakpoints = [i for i, block in enumerate(system) if block.get('cache_control')]
+        if breakpoints:
+            # The tools come first in the cached prefix
+            prefix = system[:breakpoints[-1] + 1]
+            prefix_tokens = (tools_chars + sum(len(block['text']) for block in prefix)) // CHARS_PER_TOKEN
+            if prefix_tokens >= MIN_CACHEABLE_TOKENS:
+                key = (request.get('model'), json.dumps([request.get('tools'), prefix], sort_keys=True))
+                now = time.time()
+                if self._prompt_cache.get(key, 0) > now:
+                    cache_read = prefix_tokens
+                else:
+                    cache_write = prefix_tokens
+                self._prompt_cache[key] = now + CACHE_TTL
+                input_tokens -= prefix_tokens
+        return text, tool_name, stop_reason, {'input_tokens': input_tokens, 'cache_creation_input_tokens': cache_write,
+                      'cache_read_input_tokens': cache_read, 'output_tokens': len(text) // CHARS_PER_TOKEN}
+
+    async def _batch_endpoint(self, scope, receive, send):
+        parts = scope['path'].rstrip('/').split('/')[4:]
+        if scope['method'] == 'POST' and not parts:
+            batch_id = f"msgbatch_fake_{next(self._ids)}"
+            results = []
+            for item in (await _read_json(receive))['requests']:
+                text, tool_name, stop_reason, usage = self._reply(item['params'])
+                results.append({'custom_id': item['custom_id'], 'result': {'type': 'succeeded', 'message': {
+                    'id': f"msg_fake_{next(self._ids)}", 'type': 'message', 'role': 'assistant',
+                    'model': item['params'].get('model'), 'content': _content(text, tool_name),
+                    'stop_reason': stop_reason, 'stop_sequence': None,
+                    'usage': usage}}})
+            host = dict(scope['headers']).get(b'host', b'127.0.0.1').decode()
+            self._batches[batch_id] = (time.time() + self.batch_seconds, results,
+                                       f"http://{host}/v1/messages/batches/{batch_id}/results")
+            await _respond(send, 200, self._batch(batch_id))
+        elif scope['method'] == 'GET' and len(parts) == 1 and parts[0] in self._batches:
+            await _respond(send, 200, self._batch(parts[0]))
+        elif scope['method'] == 'GET' and len(parts) == 2 and parts[1] == 'results' and parts[0] in self._batches:
+            body = ''.join(json.dumps(line) + '\n' for line in self._batches[parts[0]][1]).encode()
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', b'application/binary'),
+                                    (b'content-length', str(len(body)).encode())]})
+            await send({'type': 'http.response.body', 'body': body})
+        else:
+            await _respond(send, 404, NOT_FOUND)
+
+    def _batch(self, batch_id):
+        ends_at, results, results_url = self._batches[batch_id]
+        ended = time.time() >= ends_at
+        return {
+            'id': batch_id,
+            'type': 'message_batch',
+            'processing_status': 'ended' if ended else 'in_progress',
+            'request_counts': {'processing': 0 if ended else len(results), 'succeeded': len(results) if ended else 0,
+                               'errored': 0, 'canceled': 0, 'expired': 0},
+            'results_url': results_url if ended else None,
+        }
+
+    async def _stream(self, send, request, message_id, text, tool_name, stop_reason, usage):
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream')]})
+
+        async def event(name, data):
+            payload = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+            await send({'type': 'http.response.body', 'body': payload, 'more_body': True})
+
+        await event('message_start', {'type': 'message_start', 'message': {
+            'id': message_id, 'type': 'message', 'role': 'assistant', 'model': request.get('model'),
+            'content': [], 'stop_reason': None, 'stop_sequence': None,
+            'usage': dict(usage, output_tokens=1)
+        }})
+        if tool_name:
+            block = {'type': 'tool_use', 'id': f"toolu_{message_id}", 'name': tool_name, 'input': {}}
+        else:
+            block = {'type': 'text', 'text': ''}
+        await event('content_block_start', {'type': 'content_block_start', 'index': 0, 'content_block': block})
+        chunk_chars = CHARS_PER_TOKEN * 4
+        for i in range(0, len(text), chunk_chars):
+            if self.tokens_per_second:
+                await asyncio.sleep(4 / self.tokens_per_second)
+            chunk = text[i:i + chunk_chars]
+            delta = ({'type': 'input_json_delta', 'partial_json': chunk} if tool_name else
+                     {'type': 'text_delta', 'text': chunk})
+            await event('content_block_delta', {'type': 'content_block_delta', 'index': 0, 'delta': delta})
+        await event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+        await event('message_delta', {'type': 'message_delta',
+                                      'delta': {'stop_reason': stop_reason, 'stop_sequence': None},
+                                      'usage': {'output_tokens': usage['output_tokens']}})
+        await event('message_stop', {'type': 'message_stop'})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+def cut_off(text):
+    return text[:len(text) * 3 // 4]
+
+
+MALFORMATIONS = [
+    lambda text: f"```json\n{text}\n```",
+    lambda text: f"Here is my suggestion:\n{text}\nLet me know if you need more.",
+    lambda text: re.sub(r'(["\d\]}])\n', r'\1,\n', text),
+    cut_off,
+]
+
+
+def _forced_tool(request):
+    tool_choice = request.get('tool_choice') or {}
+    return tool_choice.get('name') if tool_choice.get('type') == 'tool' else None
+
+
+def _step_title(request, tool_name):
+    if tool_name:
+        return STEP_TITLES.get(tool_name)
+    for message in reversed(request.get('messages', [])):
+        match = re.search(r'^Step: (.+)$', str(message.get('content')), re.MULTILINE)
+        if match:
+            return match.group(1).strip()
+    return None
+
+
+def _content(text, tool_name):
+    if not tool_name:
+        return [{'type': 'text', 'text': text}]
+    # A cut-off tool input is closed the way the API does it, keeping what was complete
+    tool_input, _ = load_json(text)
+    return [{'type': 'tool_use', 'id': 'toolu_fake', 'name': tool_name,
+             'input': tool_input if isinstance(tool_input, dict) else {}}]
+
+
+NOT_FOUND = {'type': 'error', 'error': {'type': 'not_found_error', 'message': 'Not found'}}
+
+
+async def _read_json(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return json.loads(body)
+
+
+async def _respond(send, status, payload):
+    body = json.dumps(payload).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=80.0, help='output rate; 0 for instant')
+    parser.add_argument('--output-chars', type=int, default=600, help='length of the suggestion text')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='fraction of replies to damage')
+    parser.add_argument('--batch-seconds', type=float, default=5.0, help='time for a message batch to end')
+    parser.add_argument('--prefill-tokens-per-second', type=float, default=0.0,
+                        help='processing rate of uncached prompt tokens; 0 for no prefill delay')
+
+
+def model_server_args(args):
+    """Command line for ``python -m benchmarks.fake_model_server`` with the options from ``add_arguments``."""
+    return ['--latency', str(args.latency), '--tokens-per-second', str(args.tokens_per_second),
+            '--output-chars', str(args.output_chars), '--malformed-rate', str(args.malformed_rate),
+            '--batch-seconds', str(args.batch_seconds),
+            '--prefill-tokens-per-second', str(args.prefill_tokens_per_second)]
+
+
+def server_from_args(args):
+    return FakeModelServer(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                           output_chars=args.output_chars, malformed_rate=args.malformed_rate,
+                           batch_seconds=args.batch_seconds,
+                           prefill_tokens_per_second=args.prefill_tokens_per_second)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8400)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(server_from_args(args), host='127.0.0.1', port=args.port, log_level='warning',
+                backlog=4096, limit_concurrency=None)
+
+
+if __name__ == '__main__':
+    main()
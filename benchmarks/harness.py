@@ -0,0 +1,78 @@
+"""Helpers for benchmarks that run the app and the fake model server as subprocesses."""
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def start(args, env=None, port=None):
+    """Start ``python <args>`` from the project root and wait for ``port`` if given."""
+    process = subprocess.Popen([sys.executable] + list(args), cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if port is not None:
+        try:
+            wait_for_port(port)
+        except RuntimeError:
+            process.kill()
+            raise
+    return process
+
+
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def app_env(db_path, model_port, **extra):
+    """Environment for an app process backed by ``db_path`` and the fake model server."""
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': f"sqlite:///{db_path}",
+        'ANTHROPIC_API_KEY': 'benchmark',
+        'ANTHROPIC_BASE_URL': f"http://127.0.0.1:{model_port}",
+        'USE_FAKE_ANTHROPIC': '0',
+        'SECRET_KEY': 'benchmark',
+        # Admission limits would throttle the load being measured
+        'ANTHROPIC_MAX_CONCURRENCY': '0',
+        'ANTHROPIC_REQUESTS_PER_MINUTE': '0',
+        'ANTHROPIC_TOKENS_PER_MINUTE': '0',
+        'ADMISSION_DB_PATH': os.path.join(os.path.dirname(db_path), 'admission.db'),
+    })
+    env.update({k: str(v) for k, v in extra.items()})
+    return env
+
+
+def create_tables(env):
+    subprocess.run([sys.executable, '-c', 'from app import app, db\nwith app.app_context(): db.create_all()'],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
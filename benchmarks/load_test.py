@@ -0,0 +1,97 @@
+"""Concurrent load test of the suggestion endpoint against the fake model server.
+
+Starts benchmarks.fake_model_server and the app, either the ASGI entry point
+(asgi:application) or the plain Flask app behind uvicorn's WSGI adapter, and
+fires ``--requests`` get_suggestion calls with ``--concurrency`` in flight. Each
+request targets its own decision so the suggestion cache never answers.
+
+    python -m benchmarks.load_test --mode asgi --concurrency 200 --requests 1000
+    python -m benchmarks.load_test --mode wsgi --concurrency 200 --requests 1000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+from benchmarks import harness
+from benchmarks.fake_model_server import add_arguments as add_model_arguments, model_server_args
+
+SERVER_COMMANDS = {
+    'asgi': ['-m', 'uvicorn', 'asgi:application'],
+    'wsgi': ['-m', 'uvicorn', '--interface', 'wsgi', 'app:app'],
+}
+
+
+async def run_load(base_url, requests, concurrency, stream):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        await client.post('/register', json={'username': 'load', 'password': 'load'})
+        await client.post('/login', json={'username': 'load', 'password': 'load'})
+        decision_ids = []
+        for i in range(requests):
+            response = await client.post('/api/start_decision', json={'question': f"Load test decision {i}"})
+            response.raise_for_status()
+            decision_ids.append(response.json()['decision_id'])
+
+        path = '/api/get_suggestion_stream' if stream else '/api/get_suggestion'
+        latencies = []
+        errors = []
+        queue = asyncio.Queue()
+        for decision_id in decision_ids:
+            queue.put_nowait(decision_id)
+
+        async def worker():
+            while not queue.empty():
+                decision_id = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path, params={'decision_id': decision_id, 'step': 0})
+                    if response.status_code != 200 or 'Error generating' in response.text:
+                        errors.append(f"HTTP {response.status_code}: {response.text[:200]}")
+                except httpx.HTTPError as e:
+                    errors.append(repr(e))
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=sorted(SERVER_COMMANDS), default='asgi')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--stream', action='store_true', help='use /api/get_suggestion_stream')
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    model_port = harness.free_port()
+    app_port = harness.free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = harness.app_env(os.path.join(tmp, 'load.db'), model_port)
+        harness.create_tables(env)
+        model_server = harness.start(['-m', 'benchmarks.fake_model_server', '--port', str(model_port)]
+                                     + model_server_args(args), port=model_port)
+        app_server = harness.start(SERVER_COMMANDS[args.mode] + ['--port', str(app_port), '--log-level', 'warning'],
+                                   env=env, port=app_port)
+        try:
+            latencies, errors, elapsed = asyncio.run(
+                run_load(f"http://127.0.0.1:{app_port}", args.requests, args.concurrency, args.stream))
+        finally:
+            harness.stop(app_server)
+            harness.stop(model_server)
+
+    print(f"mode={args.mode} requests={args.requests} concurrency={args.concurrency} stream={args.stream}")
+    print(f"throughput: {len(latencies) / elapsed:.1f} req/s over {elapsed:.1f}s, errors: {len(errors)}")
+    if errors:
+        print(f"first error: {errors[0]}")
+    print(f"latency p50: {harness.percentile(latencies, 50) * 1000:.0f} ms, "
+          f"p99: {harness.percentile(latencies, 99) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
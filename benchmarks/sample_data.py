@@ -0,0 +1,68 @@
+"""Realistic step data for every step of PERSONAL_DECISION_FRAMEWORK, shared by the benchmarks."""
+from decision_framework import PERSONAL_DECISION_FRAMEWORK
+
+QUESTION = "Should I change my career from marketing to software development within the next year?"
+
+OPTIONS = ["Stay in marketing", "Bootcamp and switch", "Part-time degree", "Internal transfer"]
+CRITERIA = [("Income", 30), ("Job satisfaction", 30), ("Stability", 20), ("Time to switch", 20)]
+
+STEP_DATA = {
+    "Define the Decision": {
+        "decision_statement": QUESTION,
+        "context": "I have worked in marketing for six years. I enjoy the analytics side of the job and have "
+                   "been automating reports with Python for the last year.",
+        "desired_outcome": "A more fulfilling career with better long-term prospects"
+    },
+    "Gather Information": {
+        "key_areas": ["Job market trends", "Required skills", "Salary differences", "Learning paths"],
+        "information_sources": ["Industry reports", "Job postings", "Developer friends", "Online courses"],
+        "critical_questions": ["Which skills are in highest demand?", "How long does a switch usually take?",
+                               "Can I afford a pay cut for a year?"]
+    },
+    "Identify Options": {
+        "options": [{"name": name, "description": f"Pursue the '{name}' path and review progress after six months."}
+                    for name in OPTIONS]
+    },
+    "Establish Criteria": {
+        "criteria": [{"name": name, "description": f"How well the option scores on {name.lower()}.", "weight": weight}
+                     for name, weight in CRITERIA]
+    },
+    "Evaluate Options": {
+        "evaluations": {option: {name: (i + j) % 5 + 1 for j, (name, _) in enumerate(CRITERIA)}
+                        for i, option in enumerate(OPTIONS)},
+        "option_notes": [{"option": option, "strengths": "Clear path with known costs.",
+                          "weaknesses": "Requires sustained effort outside of work."} for option in OPTIONS]
+    },
+    "Consider Consequences": {
+        "consequences": [{"option": option, "short_term": "Less free time and some financial pressure.",
+                          "long_term": "Broader career options.", "risks": "Burnout or stalled progress."}
+                         for option in OPTIONS],
+        "risk_mitigation": [{"risk": "Burnout", "strategy": "Cap study time at ten hours a week."},
+                            {"risk": "Financial pressure", "strategy": "Build a six-month buffer first."}]
+    },
+    "Make the Decision": {
+        "chosen_option": "Bootcamp and switch",
+        "decision_rationale": "It scores best on income and satisfaction and has a fixed timeline."
+    },
+    "Create an Action Plan": {
+        "action_steps": [{"description": "Choose a bootcamp", "timeline": "Month 1", "resources_needed": "Reviews, budget"},
+                         {"description": "Complete the course", "timeline": "Months 2-5", "resources_needed": "Evenings"},
+                         {"description": "Apply for junior roles", "timeline": "Month 6", "resources_needed": "Portfolio"}],
+        "potential_obstacles": ["Limited time", "Imposter syndrome"],
+        "obstacle_strategies": [{"obstacle": "Limited time", "strategy": "Block fixed study slots."},
+                                {"obstacle": "Imposter syndrome", "strategy": "Join a peer study group."}]
+    },
+    "Reflect and Learn": {
+        "outcomes": "Started the bootcamp and built two portfolio projects.",
+        "lessons_learned": ["Writing criteria down early made the choice easier"],
+        "future_improvements": "Talk to more people already doing the job before deciding."
+    }
+}
+
+
+def sample_context(step_index, question=QUESTION):
+    """The prompt context get_suggestion builds for ``step_index``."""
+    context = {'initial_question': question}
+    for step in PERSONAL_DECISION_FRAMEWORK['steps'][:step_index]:
+        context[step['title']] = STEP_DATA[step['title']]
+    return context
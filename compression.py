@@ -0,0 +1,107 @@
+import json
+import zlib
+
+from sqlalchemy import text
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # zlib only
+    zstandard = None
+
+# First byte of a compressed value. Values below the size threshold are stored
+# as plain UTF-8, which never starts with either, as do rows written before
+# compression was introduced.
+ZLIB_HEADER = b'\x01'
+ZSTD_HEADER = b'\x02'
+
+
+def compress(raw, codec='zstd', min_bytes=512):
+    """Compress ``raw`` bytes with ``codec`` if they are at least ``min_bytes`` long and it pays off."""
+    if len(raw) < min_bytes:
+        return raw
+    if codec == 'zstd' and zstandard is not None:
+        packed = ZSTD_HEADER + zstandard.ZstdCompressor(level=3).compress(raw)
+    else:
+        packed = ZLIB_HEADER + zlib.compress(raw, 6)
+    return packed if len(packed) < len(raw) else raw
+
+
+def decompress(stored):
+    """Inverse of ``compress``; also accepts plain bytes and ``str`` values from uncompressed rows."""
+    if isinstance(stored, str):
+        return stored.encode('utf-8')
+    stored = bytes(stored)
+    if stored[:1] == ZLIB_HEADER:
+        return zlib.decompress(stored[1:])
+    if stored[:1] == ZSTD_HEADER:
+        if zstandard is None:
+            raise RuntimeError('Value is zstd-compressed but the zstandard package is not installed')
+        return zstandard.ZstdDecompressor().decompress(stored[1:])
+    return stored
+
+
+class CompressedText(TypeDecorator):
+    """Text stored as a blob, compressed when it is at least ``min_bytes`` long."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, codec='zstd', min_bytes=512):
+        super().__init__()
+        self.codec = codec
+        self.min_bytes = min_bytes
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress(self.serialize(value), self.codec, self.min_bytes)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self.deserialize(decompress(value))
+
+    def serialize(self, value):
+        return value.encode('utf-8')
+
+    def deserialize(self, raw):
+        return raw.decode('utf-8')
+
+
+class CompressedJSON(CompressedText):
+    """JSON stored like ``CompressedText``; ``None`` is stored as SQL NULL."""
+
+    cache_ok = True
+
+    def serialize(self, value):
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    def deserialize(self, raw):
+        return json.loads(raw)
+
+
+def recompress_column(connection, table, column, codec='zstd', min_bytes=512, batch_size=500):
+    """Rewrite every value of ``table.column`` in the ``compress`` format for ``codec`` and ``min_bytes``.
+
+    Reads plain, compressed and legacy text values alike, so it both compresses
+    existing rows and (with ``min_bytes=float('inf')``) stores them uncompressed
+    again. Returns (rows rewritten, bytes before, bytes after).
+    """
+    rows = size_before = size_after = 0
+    last_id = 0
+    while True:
+        batch = connection.execute(text(
+            f"SELECT id, {column} FROM {table} WHERE id > :last_id AND {column} IS NOT NULL ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': batch_size}).fetchall()
+        if not batch:
+            return rows, size_before, size_after
+        updates = []
+        for row_id, stored in batch:
+            value = compress(decompress(stored), codec, min_bytes)
+            size_before += len(stored.encode('utf-8') if isinstance(stored, str) else stored)
+            size_after += len(value)
+            updates.append({'id': row_id, 'value': value})
+        connection.execute(text(f"UPDATE {table} SET {column} = :value WHERE id = :id"), updates)
+        rows += len(updates)
+        last_id = batch[-1][0]
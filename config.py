@@ -1,8 +1,104 @@
+import json
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+def database_url():
+    url = os.environ.get('DATABASE_URL') or 'sqlite:///decisions.db'
+    # Some hosts still hand out the pre-SQLAlchemy-1.4 scheme
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def engine_options(url):
+    if url.startswith('sqlite'):
+        return {
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+            # Pooled connections are handed between the request and job worker threads
+            'connect_args': {'check_same_thread': False},
+        }
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
-    ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
\ No newline at end of file
+
+    SQLALCHEMY_DATABASE_URI = database_url()
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    # Applied to every new SQLite connection. WAL lets readers run alongside the
+    # single writer and busy_timeout makes concurrent writers wait instead of
+    # failing with "database is locked".
+    SQLITE_PRAGMAS = json.loads(os.environ['SQLITE_PRAGMAS']) if 'SQLITE_PRAGMAS' in os.environ else {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+    }
+    # Summaries and step data at least this many bytes are stored compressed;
+    # zstd needs the optional zstandard package and falls back to zlib without it
+    COMPRESSION_CODEC = os.environ.get('COMPRESSION_CODEC', 'zstd')
+    COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 512))
+
+    ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
+    ANTHROPIC_MODEL = os.environ.get('ANTHROPIC_MODEL', 'claude-3-5-sonnet-20240620')
+    USE_FAKE_ANTHROPIC = env_flag('USE_FAKE_ANTHROPIC')
+
+    # Admission control for model calls, shared by all workers on the host
+    # through a SQLite file (instance/admission.db by default); 0 disables a limit
+    ANTHROPIC_MAX_CONCURRENCY = int(os.environ.get('ANTHROPIC_MAX_CONCURRENCY', 8))
+    ANTHROPIC_REQUESTS_PER_MINUTE = int(os.environ.get('ANTHROPIC_REQUESTS_PER_MINUTE', 50))
+    ANTHROPIC_TOKENS_PER_MINUTE = int(os.environ.get('ANTHROPIC_TOKENS_PER_MINUTE', 40000))
+    ANTHROPIC_QUEUE_TIMEOUT = float(os.environ.get('ANTHROPIC_QUEUE_TIMEOUT', 30))
+    ANTHROPIC_RATE_LIMIT_RETRIES = int(os.environ.get('ANTHROPIC_RATE_LIMIT_RETRIES', 2))
+    ADMISSION_DB_PATH = os.environ.get('ADMISSION_DB_PATH')
+
+    # Identical suggestion requests in flight at once share one model call; worker
+    # processes coordinate through lock files here (instance/single_flight by default)
+    SINGLE_FLIGHT_LOCK_DIR = os.environ.get('SINGLE_FLIGHT_LOCK_DIR')
+
+    # Fraction of model calls whose full prompt and reply are logged (0 = never)
+    LOG_PROMPT_SAMPLE_RATE = float(os.environ.get('LOG_PROMPT_SAMPLE_RATE', 0))
+    # When set, /metrics requires "Authorization: Bearer <token>"
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    SUGGESTION_CACHE_SIZE = int(os.environ.get('SUGGESTION_CACHE_SIZE', 512))
+    SUGGESTION_CACHE_TTL = int(os.environ.get('SUGGESTION_CACHE_TTL', 3600))
+    SUGGESTION_CACHE_PATH = os.environ.get('SUGGESTION_CACHE_PATH')
+    # Generate the next step's suggestion in the background after submit_step
+    PREFETCH_SUGGESTIONS = env_flag('PREFETCH_SUGGESTIONS', True)
+    # 'text' asks for the reply as JSON in the message text; 'tool' asks for it as
+    # the input of a tool whose schema is built from the step's fields
+    SUGGESTION_OUTPUT_MODE = os.environ.get('SUGGESTION_OUTPUT_MODE', 'text')
+
+    PROMPT_CONTEXT_TOKEN_BUDGET = int(os.environ.get('PROMPT_CONTEXT_TOKEN_BUDGET', 3000))
+    # Optional per-step overrides, e.g. '{"Reflect and Learn": 2000}'
+    PROMPT_CONTEXT_TOKEN_BUDGETS = json.loads(os.environ.get('PROMPT_CONTEXT_TOKEN_BUDGETS', '{}'))
+    SUMMARY_CONTEXT_TOKEN_BUDGET = int(os.environ.get('SUMMARY_CONTEXT_TOKEN_BUDGET', 6000))
+
+    # Threads serving the regular Flask routes under asgi.py
+    ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 32))
+
+    # Sensitivity analysis of the evaluations matrix: weight samples per request
+    # and how far (as a fraction) each criterion weight is varied
+    SCORING_SAMPLES = int(os.environ.get('SCORING_SAMPLES', 100000))
+    SCORING_MAX_SAMPLES = int(os.environ.get('SCORING_MAX_SAMPLES', 1000000))
+    SCORING_WEIGHT_SPREAD = float(os.environ.get('SCORING_WEIGHT_SPREAD', 0.2))
+
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    # Completed and failed jobs are deleted after this many hours
+    JOB_RETENTION_HOURS = float(os.environ.get('JOB_RETENTION_HOURS', 168))
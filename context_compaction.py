@@ -0,0 +1,103 @@
+import json
+import math
+import threading
+from collections import namedtuple
+
+AI_SUGGESTION_SUFFIX = '_ai_suggestion'
+CHARS_PER_TOKEN = 4
+
+# Each pass is (string length limit, whether the most recent steps are truncated too).
+# Passes run in order until the context fits the budget.
+TRUNCATION_PASSES = [(400, False), (120, False), (120, True), (40, True)]
+SUMMARY_LIST_ITEMS = 3
+OMITTED_STEP = '(omitted to fit the prompt budget)'
+
+CompactionReport = namedtuple('CompactionReport', 'original_tokens compacted_tokens saved_tokens budget fits')
+
+
+def estimate_tokens(value):
+    """Rough token estimate for a value as it would appear in a prompt."""
+    text = value if isinstance(value, str) else json.dumps(value, separators=(',', ':'))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_strings(value, max_chars):
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else value[:max_chars].rstrip() + '...'
+    if isinstance(value, dict):
+        return {k: truncate_strings(v, max_chars) for k, v in value.items()}
+    if isinstance(value, list):
+        return [truncate_strings(v, max_chars) for v in value]
+    return value
+
+
+def summarize_step(value):
+    """Collapse a step's data to its first few list items with short strings."""
+    if isinstance(value, dict):
+        return {k: summarize_step(v) for k, v in value.items()}
+    if isinstance(value, list):
+        summary = [summarize_step(v) for v in value[:SUMMARY_LIST_ITEMS]]
+        if len(value) > SUMMARY_LIST_ITEMS:
+            summary.append(f"... ({len(value) - SUMMARY_LIST_ITEMS} more)")
+        return summary
+    return truncate_strings(value, 40)
+
+
+class ContextCompactor:
+    """Shrinks prompt context to a token budget and keeps running totals of the savings.
+
+    Stored ``*_ai_suggestion`` entries are always dropped, since the model does
+    not need its own earlier advice to make the next suggestion. If the context
+    is still over budget, strings in older steps are truncated, then strings
+    everywhere, then older steps are reduced to a short summary and finally
+    left out, oldest first. The
+    ``keep_recent`` most recent steps are left alone for as long as possible.
+    """
+
+    def __init__(self, keep_recent=2):
+        self.keep_recent = keep_recent
+        self._lock = threading.Lock()
+        self.totals = {'calls': 0, 'original_tokens': 0, 'compacted_tokens': 0, 'saved_tokens': 0, 'over_budget': 0}
+
+    def compact(self, context, budget):
+        original_tokens = self._estimate(context)
+        compacted = {k: v for k, v in context.items() if not k.endswith(AI_SUGGESTION_SUFFIX)}
+        tokens = self._estimate(compacted)
+
+        step_keys = [k for k in compacted if k != 'initial_question']
+        recent_keys = set(step_keys[-self.keep_recent:]) if self.keep_recent else set()
+        older_keys = [k for k in step_keys if k not in recent_keys]
+
+        if tokens > budget:
+            for max_chars, include_recent in TRUNCATION_PASSES:
+                keys = step_keys if include_recent else older_keys
+                compacted.update({k: truncate_strings(context[k], max_chars) for k in keys})
+                tokens = self._estimate(compacted)
+                if tokens <= budget:
+                    break
+        if tokens > budget:
+            compacted.update({k: summarize_step(compacted[k]) for k in older_keys})
+            tokens = self._estimate(compacted)
+        # Last resort: leave out the oldest steps entirely
+        for key in older_keys:
+            if tokens <= budget:
+                break
+            compacted[key] = OMITTED_STEP
+            tokens = self._estimate(compacted)
+
+        report = CompactionReport(original_tokens, tokens, original_tokens - tokens, budget, tokens <= budget)
+        with self._lock:
+            self.totals['calls'] += 1
+            self.totals['original_tokens'] += report.original_tokens
+            self.totals['compacted_tokens'] += report.compacted_tokens
+            self.totals['saved_tokens'] += report.saved_tokens
+            self.totals['over_budget'] += 0 if report.fits else 1
+        return compacted, report
+
+    def stats(self):
+        with self._lock:
+            return dict(self.totals)
+
+    @staticmethod
+    def _estimate(context):
+        return sum(estimate_tokens(k) + estimate_tokens(v) for k, v in context.items())
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+DEFAULT_RESPONSE = {
+    "suggestion": "### Suggestion\nThis is an offline suggestion from the fake Anthropic client.\nFill in each field as concretely as you can.",
+    "pre_filled_data": {}
+}
+
+
+class _FakeStream:
+    def __init__(self, text, chunk_size, chunk_delay, usage, tool_name=None):
+        self._text = text
+        self._chunk_size = chunk_size
+        self._chunk_delay = chunk_delay
+        self._usage = usage
+        self._tool_name = tool_name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    @property
+    def text_stream(self):
+        for i in range(0, len(self._text), self._chunk_size):
+            if self._chunk_delay:
+                time.sleep(self._chunk_delay)
+            yield self._text[i:i + self._chunk_size]
+
+    def __iter__(self):
+        for i in range(0, len(self._text), self._chunk_size):
+            if self._chunk_delay:
+                time.sleep(self._chunk_delay)
+            yield _stream_event(self._text[i:i + self._chunk_size], self._tool_name)
+
+    def get_final_message(self):
+        return _make_message(self._text, self._usage, self._tool_name)
+
+
+def _tool_name(kwargs):
+    """Name of the tool ``kwargs`` forces with ``tool_choice``, if any."""
+    tool_choice = kwargs.get('tool_choice') or {}
+    return tool_choice.get('name') if tool_choice.get('type') == 'tool' else None
+
+
+def _tool_input(text):
+    # The API always hands back a tool call's input as an object
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return {}
+    return value if isinstance(value, dict) else {}
+
+
+def _content(text, tool_name):
+    if tool_name:
+        return [{'type': 'tool_use', 'id': 'toolu_fake', 'name': tool_name, 'input': _tool_input(text)}]
+    return [{'type': 'text', 'text': text}]
+
+
+def _stream_event(chunk, tool_name):
+    if tool_name:
+        return SimpleNamespace(type='input_json', partial_json=chunk)
+    return SimpleNamespace(type='text', text=chunk)
+
+
+def _make_message(text, usage, tool_name=None):
+    return SimpleNamespace(
+        content=[SimpleNamespace(**block) for block in _content(text, tool_name)],
+        usage=SimpleNamespace(**usage),
+        stop_reason='tool_use' if tool_name else 'end_turn'
+    )
+
+
+class _FakeMessages:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, **kwargs):
+        self._owner.calls.append(kwargs)
+        if self._owner.latency:
+            time.sleep(self._owner.latency)
+        text = self._owner.next_response()
+        return _make_message(text, self._owner.usage_for(kwargs, text), _tool_name(kwargs))
+
+    def stream(self, **kwargs):
+        self._owner.calls.append(kwargs)
+        text = self._owner.next_response()
+        return _FakeStream(text, self._owner.chunk_size, self._owner.chunk_delay,
+                           self._owner.usage_for(kwargs, text), _tool_name(kwargs))
+
+
+class _FakeMessageBatches:
+    """Offline stand-in for ``batch_pipeline.MessageBatches``; batches end as soon as they are created."""
+
+    def __init__(self, owner):
+        self._owner = owner
+        self._batches = {}
+
+    def create(self, requests):
+        batch_id = f"msgbatch_fake_{len(self._batches) + 1}"
+        results = []
+        for request in requests:
+            self._owner.calls.append(request['params'])
+            text = self._owner.next_response()
+            usage = self._owner.usage_for(request['params'], text)
+            results.append({'custom_id': request['custom_id'], 'result': {'type': 'succeeded', 'message': {
+                'content': _content(text, _tool_name(request['params'])), 'usage': usage}}})
+        self._batches[batch_id] = results
+        return self.retrieve(batch_id)
+
+    def retrieve(self, batch_id):
+        count = len(self._batches[batch_id])
+        return {'id': batch_id, 'type': 'message_batch', 'processing_status': 'ended',
+                'request_counts': {'processing': 0, 'succeeded': count, 'errored': 0, 'canceled': 0, 'expired': 0},
+                'results_url': batch_id}
+
+    def results(self, batch):
+        return iter(self._batches[batch['id']])
+
+
+class FakeAnthropic:
+    """Offline stand-in for ``anthropic.Anthropic`` covering the calls the app makes.
+
+    ``responses`` is a list of reply texts (or dicts, serialized as JSON) handed
+    out in order; the last one is repeated once the list is exhausted. A call
+    that forces a tool with ``tool_choice`` gets the reply as that tool's input.
+    """
+
+    def __init__(self, responses=None, latency=0.0, chunk_size=16, chunk_delay=0.0):
+        self.responses = list(responses or [DEFAULT_RESPONSE])
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.calls = []
+        self.messages = _FakeMessages(self)
+        self.message_batches = _FakeMessageBatches(self)
+
+    def next_response(self):
+        response = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        return response if isinstance(response, str) else json.dumps(response)
+
+    def usage_for(self, kwargs, text):
+        prompt_chars = (sum(len(block['text']) for block in kwargs.get('system', ())) +
+                        sum(len(json.dumps(tool)) for tool in kwargs.get('tools', ())) +
+                        sum(len(str(m.get('content', ''))) for m in kwargs.get('messages', [])))
+        return {'input_tokens': prompt_chars // 4, 'output_tokens': len(text) // 4}
+
+
+class _AsyncFakeStream(_FakeStream):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    @property
+    async def text_stream(self):
+        for i in range(0, len(self._text), self._chunk_size):
+            if self._chunk_delay:
+                await asyncio.sleep(self._chunk_delay)
+            yield self._text[i:i + self._chunk_size]
+
+    async def __aiter__(self):
+        for i in range(0, len(self._text), self._chunk_size):
+            if self._chunk_delay:
+                await asyncio.sleep(self._chunk_delay)
+            yield _stream_event(self._text[i:i + self._chunk_size], self._tool_name)
+
+    async def get_final_message(self):
+        return _make_message(self._text, self._usage, self._tool_name)
+
+
+class _AsyncFakeMessages(_FakeMessages):
+    async def create(self, **kwargs):
+        self._owner.calls.append(kwargs)
+        if self._owner.latency:
+            await asyncio.sleep(self._owner.latency)
+        text = self._owner.next_response()
+        return _make_message(text, self._owner.usage_for(kwargs, text), _tool_name(kwargs))
+
+    def stream(self, **kwargs):
+        self._owner.calls.append(kwargs)
+        text = self._owner.next_response()
+        return _AsyncFakeStream(text, self._owner.chunk_size, self._owner.chunk_delay,
+                                self._owner.usage_for(kwargs, text), _tool_name(kwargs))
+
+
+class AsyncFakeAnthropic(FakeAnthropic):
+    """Offline stand-in for ``anthropic.AsyncAnthropic``."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.messages = _AsyncFakeMessages(self)
@@ -0,0 +1,223 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, or_, update
+
+
+class JobQueue:
+    """Background job runner backed by a database table.
+
+    Jobs are rows in ``job_model``; any process sharing the database can claim
+    them, so pending work survives a restart. A claimed job holds a lease
+    (``locked_until``); if its worker dies the lease expires and another worker
+    picks the job up again. Failed jobs are retried with exponential backoff.
+    Finished jobs are deleted once they are older than ``retention_seconds``.
+    """
+
+    def __init__(self, app, db, job_model, max_workers=2, max_attempts=3,
+                 backoff_base=2.0, backoff_max=300.0, lease_seconds=300, poll_interval=1.0,
+                 retention_seconds=7 * 24 * 3600, prune_interval=3600):
+        self.app = app
+        self.db = db
+        self.job_model = job_model
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.prune_interval = prune_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers = {}
+        self._executor = None
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._finished = threading.Condition()
+        self._started = False
+        self._last_prune = 0.0
+
+    def handler(self, kind, on_failure=None, max_attempts=None):
+        """Register ``func(payload)`` as the handler for jobs of ``kind``.
+
+        ``on_failure(payload, error)`` is called once the job has used up all of
+        its attempts. ``max_attempts`` overrides the queue default for this kind.
+        """
+        def decorator(func):
+            self._handlers[kind] = (func, on_failure, max_attempts or self.max_attempts)
+            return func
+        return decorator
+
+    def enqueue(self, kind, payload, user_id=None):
+        job = self.job_model(kind=kind, payload=payload, user_id=user_id, status='pending',
+                             attempts=0, run_at=datetime.utcnow())
+        self.db.session.add(job)
+        self.db.session.commit()
+        self.start()
+        self._wakeup.set()
+        return job
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job-worker')
+        threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True).start()
+
+    def wait(self, job_id, timeout):
+        """Block until the job finishes or ``timeout`` seconds pass; return the job row."""
+        deadline = datetime.utcnow() + timedelta(seconds=timeout)
+        while True:
+            self.db.session.expire_all()
+            job = self.db.session.get(self.job_model, job_id)
+            remaining = (deadline - datetime.utcnow()).total_seconds()
+            if job is None or job.status in ('completed', 'failed') or remaining <= 0:
+                return job
+            # Jobs finished in this process wake us at once; others are seen on the next poll.
+            with self._finished:
+                self._finished.wait(min(remaining, self.poll_interval))
+
+    def _dispatch_loop(self):
+        with self.app.app_context():
+            self._recover_orphaned_jobs()
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    self._prune_finished_jobs()
+                    for job_id in self._claim_jobs():
+                        with self._lock:
+                            self._active += 1
+                        self._executor.submit(self._run_job, job_id)
+            except Exception as e:
+                self.app.logger.error(f"Job dispatcher error: {str(e)}", exc_info=True)
+
+    def _recover_orphaned_jobs(self):
+        # Jobs left running by a process on this host that no longer exists
+        # are released immediately instead of waiting for their lease to expire.
+        Job = self.job_model
+        host = socket.gethostname()
+        try:
+            running = Job.query.filter(Job.status == 'running', Job.locked_by.like(f"{host}:%")).all()
+        except Exception as e:
+            self.db.session.rollback()
+            self.app.logger.error(f"Could not recover orphaned jobs: {str(e)}")
+            return
+        for job in running:
+            pid = int(job.locked_by.rsplit(':', 1)[1])
+            if pid != os.getpid() and not _pid_alive(pid):
+                self.app.logger.info(f"Recovering job {job.id} orphaned by {job.locked_by}")
+                job.status = 'pending'
+                job.locked_by = None
+                job.locked_until = None
+        self.db.session.commit()
+
+    def _prune_finished_jobs(self):
+        # Every submitted step can add a prefetch job, so finished rows would
+        # otherwise pile up; their results are only read by job_status polls.
+        now = time.monotonic()
+        if now - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = now
+        Job = self.job_model
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention_seconds)
+        result = self.db.session.execute(
+            delete(Job).where(Job.status.in_(('completed', 'failed')), Job.finished_at < cutoff)
+        )
+        self.db.session.commit()
+        if result.rowcount:
+            self.app.logger.info(f"Pruned {result.rowcount} finished jobs")
+
+    def _claim_jobs(self):
+        with self._lock:
+            free = self.max_workers - self._active
+        if free <= 0:
+            return []
+        Job = self.job_model
+        now = datetime.utcnow()
+        claimable = or_(
+            and_(Job.status == 'pending', Job.run_at <= now),
+            and_(Job.status == 'running', Job.locked_until < now)
+        )
+        candidates = [row[0] for row in self.db.session.query(Job.id).filter(claimable)
+                      .order_by(Job.run_at).limit(free).all()]
+        claimed = []
+        for job_id in candidates:
+            result = self.db.session.execute(
+                update(Job).where(Job.id == job_id, claimable).values(
+                    status='running',
+                    attempts=Job.attempts + 1,
+                    locked_by=self.worker_id,
+                    locked_until=now + timedelta(seconds=self.lease_seconds)
+                )
+            )
+            if result.rowcount:
+                claimed.append(job_id)
+        self.db.session.commit()
+        return claimed
+
+    def _run_job(self, job_id):
+        try:
+            with self.app.app_context():
+                job = self.db.session.get(self.job_model, job_id)
+                # A kind with no handler here (e.g. queued by a newer version) fails at once
+                func, on_failure, max_attempts = self._handlers.get(job.kind, (None, None, 1))
+                try:
+                    if func is None:
+                        raise LookupError(f"No handler for job kind {job.kind!r}")
+                    job.result = func(job.payload)
+                    job.status = 'completed'
+                    job.finished_at = datetime.utcnow()
+                    job.locked_by = None
+                    job.locked_until = None
+                    self.db.session.commit()
+                    self.app.logger.info(f"Job {job.id} ({job.kind}) completed")
+                except Exception as e:
+                    self.db.session.rollback()
+                    self._record_failure(job, e, on_failure, max_attempts)
+        except Exception as e:
+            self.app.logger.error(f"Job {job_id} could not be run: {str(e)}", exc_info=True)
+        finally:
+            with self._lock:
+                self._active -= 1
+            with self._finished:
+                self._finished.notify_all()
+            self._wakeup.set()
+
+    def _record_failure(self, job, error, on_failure, max_attempts):
+        job.error = str(error)
+        job.locked_by = None
+        job.locked_until = None
+        if job.attempts < max_attempts:
+            delay = min(self.backoff_base ** job.attempts, self.backoff_max)
+            job.status = 'pending'
+            job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+            self.app.logger.warning(f"Job {job.id} ({job.kind}) failed on attempt {job.attempts}, "
+                                    f"retrying in {delay:.0f}s: {str(error)}")
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+            self.app.logger.error(f"Job {job.id} ({job.kind}) failed after {job.attempts} attempts: {str(error)}")
+            if on_failure:
+                try:
+                    on_failure(job.payload, error)
+                except Exception as e:
+                    self.app.logger.error(f"Failure handler for job {job.id} raised: {str(e)}", exc_info=True)
+        self.db.session.commit()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,357 @@
+import json
+import re
+from json.decoder import scanstring
+
+_WHITESPACE = ' \t\r\n'
+_WHITESPACE_RUN = re.compile(r'[ \t\r\n]*')
+_CONTAINER_START = re.compile(r'[{\[]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_LITERALS = {'true': True, 'false': False, 'null': None, 'True': True, 'False': False, 'None': None}
+_STRING_STATES = ('string', 'quote', 'escape', 'unicode')
+_STRUCTURE_STATES = ('value', 'key', 'colon', 'after')
+_INVALID = object()
+# strict=False lets raw control characters (mostly newlines) through inside strings
+_DECODER = json.JSONDecoder(strict=False)
+
+
+class JsonRepairParser:
+    """Single-pass, incremental parser for the JSON that models reply with.
+
+    Text is passed to ``feed`` as it arrives, in chunks of any size; ``finish``
+    returns the document with every open string and container closed. Damage
+    that is common in model output is repaired along the way:
+
+    - prose or markdown code fences around the JSON (anything before the first
+      ``{`` or ``[`` and after its matching close is ignored)
+    - trailing, missing or doubled commas and missing colons
+    - raw newlines and unescaped quotes inside strings
+    - Python literals (``True``, ``False``, ``None``)
+    - output cut off mid-string, mid-number or mid-object
+
+    ``root`` holds the document parsed so far; open containers are filled in
+    place. Subclasses can override ``on_string`` and ``on_value`` to react while
+    the reply is still streaming; anything they append to ``self.events`` is
+    returned by the ``feed`` call that triggered it. By default ``feed`` returns
+    a ``(key, value)`` tuple for each member of the root container once that
+    member is complete.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.events = []
+        self._stack = []
+        self._state = 'start'
+        self._chars = []
+        self._is_key = False
+        self._reported = 0
+        self._pending = ''
+        self._hex = ''
+
+    def on_string(self, path, text):
+        """Called with new characters of the string value at ``path``."""
+
+    def on_value(self, path, value):
+        """Called once the value at ``path`` is complete."""
+        if len(path) == 1:
+            self.events.append((path[0], value))
+
+    def feed(self, chunk):
+        self.events = []
+        i, n = 0, len(chunk)
+        while i < n:
+            state = self._state
+            if state == 'string':
+                match = _STRING_SPECIAL.search(chunk, i)
+                end = match.start() if match else n
+                if end > i:
+                    self._chars.append(chunk[i:end])
+                if match is None:
+                    break
+                i = end + 1
+                if chunk[end] == '\\':
+                    self._state = 'escape'
+                elif self._is_key:
+                    self._end_key()
+                else:
+                    # Only a closing quote if a delimiter follows; models often
+                    # leave quotes inside strings unescaped.
+                    self._state = 'quote'
+                    self._pending = ''
+                continue
+            if state in _STRUCTURE_STATES:
+                i = _WHITESPACE_RUN.match(chunk, i).end()
+                if i == n:
+                    break
+            elif state == 'start':
+                match = _CONTAINER_START.search(chunk, i)
+                if match is None:
+                    break
+                i = self._open(chunk, match.start())
+                continue
+            elif state == 'end':
+                break
+
+            char = chunk[i]
+            i += 1
+            if state == 'quote':
+                if char in _WHITESPACE:
+                    self._pending += char
+                elif char in ',}]' or (char == '"' and '\n' in self._pending):
+                    # A quote on a new line starts the next member (missing comma)
+                    self._end_string()
+                    i -= 1
+                else:
+                    self._chars.append('"' + self._pending)
+                    self._state = 'string'
+                    i -= 1
+            elif state == 'escape':
+                if char == 'u':
+                    self._hex = ''
+                    self._state = 'unicode'
+                else:
+                    self._chars.append(_ESCAPES.get(char, char))
+                    self._state = 'string'
+            elif state == 'unicode':
+                if char in _HEX_DIGITS:
+                    self._hex += char
+                    if len(self._hex) == 4:
+                        self._end_unicode()
+                else:
+                    # Not a \uXXXX escape: keep it as written and read on from here
+                    self._chars.append('\\u' + self._hex)
+                    self._state = 'string'
+                    i -= 1
+            elif state == 'scalar':
+                if char in _WHITESPACE or char in ',}]:':
+                    self._end_scalar()
+                    i -= 1
+                else:
+                    self._chars.append(char)
+            elif char in '}]':
+                self._close(char)
+            elif state == 'value':
+                if char == '"':
+                    i = self._start_string(chunk, i - 1, is_key=False)
+                elif char in '{[':
+                    i = self._open(chunk, i - 1)
+                elif char == ',':
+                    # Missing value; a dict member without one is dropped
+                    self._skip_value()
+                elif char != ':':
+                    self._chars = [char]
+                    self._state = 'scalar'
+            elif state == 'key':
+                if char == '"':
+                    i = self._start_string(chunk, i - 1, is_key=True)
+            elif state == 'colon':
+                self._state = 'value'
+                if char != ':':
+                    i -= 1
+            elif state == 'after':
+                self._state = 'key' if isinstance(self._stack[-1][0], dict) else 'value'
+                if char != ',':
+                    # Missing comma
+                    i -= 1
+
+        if self._state in _STRING_STATES and not self._is_key and self._reported < len(self._chars):
+            self.on_string(self._path(), ''.join(self._chars[self._reported:]))
+            self._reported = len(self._chars)
+        return self.events
+
+    def finish(self):
+        """Close whatever is still open and return the document (``None`` if none was found)."""
+        self.events = []
+        if self._state in _STRING_STATES:
+            if not self._is_key:
+                self._end_string()
+        elif self._state == 'scalar':
+            self._end_scalar(final=True)
+        while self._stack:
+            self._complete(self._stack.pop()[0])
+        self._state = 'end'
+        return self.root
+
+    def _path(self):
+        return tuple(frame[1] for frame in self._stack)
+
+    def _insert(self, value):
+        if not self._stack:
+            self.root = value
+            return True
+        container, key = self._stack[-1]
+        if isinstance(container, dict):
+            if key is None:
+                return False
+            container[key] = value
+        else:
+            container.append(value)
+        return True
+
+    def _complete(self, value):
+        self.on_value(self._path(), value)
+        self._advance()
+
+    def _advance(self):
+        if not self._stack:
+            self._state = 'end'
+            return
+        frame = self._stack[-1]
+        if isinstance(frame[0], dict):
+            frame[1] = None
+        else:
+            frame[1] += 1
+        self._state = 'after'
+
+    def _skip_value(self):
+        if isinstance(self._stack[-1][0], dict):
+            self._stack[-1][1] = None
+            self._state = 'key'
+
+    def _open(self, chunk, start):
+        # Containers that are complete and valid within this chunk are decoded
+        # in C; only damaged or unfinished ones are walked character by character.
+        try:
+            value, end = _DECODER.raw_decode(chunk, start)
+        except ValueError:
+            pass
+        else:
+            if self._insert(value):
+                self._replay(self._path(), value)
+            self._advance()
+            return end
+
+        char = chunk[start]
+        container = {} if char == '{' else []
+        self._insert(container)
+        self._stack.append([container, None if char == '{' else 0])
+        self._state = 'key' if char == '{' else 'value'
+        return start + 1
+
+    def _replay(self, path, value):
+        # The hooks a character-by-character parse of ``value`` would have fired
+        if isinstance(value, dict):
+            for key, item in value.items():
+                self._replay(path + (key,), item)
+        elif isinstance(value, list):
+            for index, item in enumerate(value):
+                self._replay(path + (index,), item)
+        elif isinstance(value, str) and value:
+            self.on_string(path, value)
+        self.on_value(path, value)
+
+    def _close(self, char):
+        kind = dict if char == '}' else list
+        for depth in range(len(self._stack) - 1, -1, -1):
+            if isinstance(self._stack[depth][0], kind):
+                break
+        else:
+            return
+        while len(self._stack) > depth:
+            self._complete(self._stack.pop()[0])
+
+    def _start_string(self, chunk, start, is_key):
+        self._chars = []
+        self._reported = 0
+        self._is_key = is_key
+        # Strings that end within this chunk are decoded in C, as long as the
+        # closing quote is followed by a delimiter (so it is not a stray quote).
+        try:
+            text, end = scanstring(chunk, start + 1, False)
+        except ValueError:
+            pass
+        else:
+            follower = _WHITESPACE_RUN.match(chunk, end).end()
+            if is_key or (follower < len(chunk) and chunk[follower] in ',}]'):
+                self._chars.append(text)
+                self._end_string()
+                return end
+        self._state = 'string'
+        return start + 1
+
+    def _end_key(self):
+        self._stack[-1][1] = ''.join(self._chars)
+        self._state = 'colon'
+
+    def _end_string(self):
+        if self._is_key:
+            self._end_key()
+            return
+        if self._reported < len(self._chars):
+            self.on_string(self._path(), ''.join(self._chars[self._reported:]))
+        value = ''.join(self._chars)
+        if self._insert(value):
+            self._complete(value)
+        else:
+            self._skip_value()
+
+    def _end_unicode(self):
+        self._state = 'string'
+        code = int(self._hex, 16)
+        last = self._chars[-1] if self._chars else ''
+        if 0xDC00 <= code <= 0xDFFF and last and '\ud800' <= last[-1] <= '\udbff':
+            # Second half of a surrogate pair
+            code = 0x10000 + ((ord(last[-1]) - 0xD800) << 10) + (code - 0xDC00)
+            self._chars[-1] = last[:-1]
+        self._chars.append(chr(code))
+
+    def _end_scalar(self, final=False):
+        value = _parse_scalar(''.join(self._chars), final)
+        if value is not _INVALID and self._insert(value):
+            self._complete(value)
+            return
+        if isinstance(self._stack[-1][0], dict):
+            self._stack[-1][1] = None
+        self._state = 'after'
+
+
+def _parse_scalar(token, final):
+    if token in _LITERALS:
+        return _LITERALS[token]
+    try:
+        return json.loads(token)
+    except ValueError:
+        pass
+    if final:
+        # Cut off mid-token
+        for literal in ('true', 'false', 'null'):
+            if literal.startswith(token):
+                return _LITERALS[literal]
+        token = token.rstrip('.eE+-')
+        if token:
+            try:
+                return json.loads(token)
+            except ValueError:
+                pass
+    return _INVALID
+
+
+def repair_json(text):
+    """Parse a model reply into a dict or list, repairing it if it is not valid JSON.
+
+    Valid replies take the C ``json.loads`` path; anything else gets one pass of
+    ``JsonRepairParser``. Returns ``None`` if the text holds no object or array.
+    """
+    return load_json(text)[0]
+
+
+def load_json(text):
+    """``repair_json``, returning ``(value, repaired)``; ``repaired`` is false for valid JSON."""
+    try:
+        value = json.loads(text)
+        if isinstance(value, (dict, list)):
+            return value, False
+    except ValueError:
+        pass
+    parser = JsonRepairParser()
+    parser.feed(text)
+    return parser.finish(), True
+
+
+def is_valid_json(text):
+    """Whether ``text`` is an object or array as it stands, e.g. a reply parsed while it streamed."""
+    try:
+        return isinstance(json.loads(text), (dict, list))
+    except ValueError:
+        return False
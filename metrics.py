@@ -0,0 +1,120 @@
+import bisect
+import threading
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Registry:
+    """In-process metrics rendered in the Prometheus text exposition format.
+
+    ``counter`` and ``histogram`` return metrics that are updated on the hot
+    path (a lock and a few additions each). ``collect`` registers a function
+    whose ``{name: number}`` result is exported as gauges at scrape time, for
+    components that already keep their own stats. Each worker process has its
+    own registry, so scrape every worker (or sum across them) when there are
+    several.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def collect(self, prefix, help, stats):
+        self._collectors.append((prefix, help, stats))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            metric.render(lines)
+        for prefix, help, stats in self._collectors:
+            for key, value in sorted(stats().items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                lines.append(f"# HELP {name} {help}: {key}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+class Counter:
+    def __init__(self, name, help, labelnames):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} counter")
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames, buckets):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (last is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,53 @@
+"""Store decision summaries and step data compressed.
+
+Revision ID: 3f9d2b6c8a17
+Revises: e5c81b7f2a40
+Create Date: 2024-08-12 10:41:07.552914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from compression import recompress_column
+from config import Config
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9d2b6c8a17'
+down_revision = 'e5c81b7f2a40'
+branch_labels = None
+depends_on = None
+
+# (table, column, type before this revision)
+COLUMNS = [
+    ('decision', 'data', sa.JSON()),
+    ('decision', 'summary', sa.Text()),
+    ('decision_step', 'data', sa.JSON()),
+    ('decision_step', 'ai_suggestion', sa.JSON()),
+]
+
+
+def upgrade():
+    for table, column, existing_type in COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(column, existing_type=existing_type, type_=sa.LargeBinary(),
+                                  postgresql_using=f"convert_to({column}::text, 'UTF8')")
+
+    connection = op.get_bind()
+    for table, column, _ in COLUMNS:
+        recompress_column(connection, table, column, Config.COMPRESSION_CODEC, Config.COMPRESSION_MIN_BYTES)
+
+
+def downgrade():
+    connection = op.get_bind()
+    for table, column, _ in COLUMNS:
+        recompress_column(connection, table, column, min_bytes=float('inf'))
+
+    for table, column, existing_type in reversed(COLUMNS):
+        cast = '::json' if isinstance(existing_type, sa.JSON) else ''
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(column, existing_type=sa.LargeBinary(), type_=existing_type,
+                                  postgresql_using=f"convert_from({column}, 'UTF8'){cast}")
+        if connection.dialect.name == 'sqlite':
+            # Back to TEXT storage, as the columns were written before
+            op.execute(f"UPDATE {table} SET {column} = CAST({column} AS TEXT) WHERE typeof({column}) = 'blob'")
@@ -0,0 +1,45 @@
+"""Add job table for background summary generation.
+
+Revision ID: 4b1f0c2d9e7a
+Revises: cca6b7c9cd21
+Create Date: 2024-07-22 10:41:18.402913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b1f0c2d9e7a'
+down_revision = 'cca6b7c9cd21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=50), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('run_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_by', sa.String(length=100), nullable=True),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_job_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_job_status'))
+
+    op.drop_table('job')
@@ -0,0 +1,111 @@
+"""Move per-step data out of Decision.data into a decision_step table.
+
+Revision ID: 7d3e5a91c4b2
+Revises: 4b1f0c2d9e7a
+Create Date: 2024-07-29 14:02:51.118734
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3e5a91c4b2'
+down_revision = '4b1f0c2d9e7a'
+branch_labels = None
+depends_on = None
+
+# Step titles of PERSONAL_DECISION_FRAMEWORK at the time of this migration,
+# in step order. Frozen here so the migration does not change with the framework.
+STEP_TITLES = [
+    "Define the Decision",
+    "Gather Information",
+    "Identify Options",
+    "Establish Criteria",
+    "Evaluate Options",
+    "Consider Consequences",
+    "Make the Decision",
+    "Create an Action Plan",
+    "Reflect and Learn",
+]
+
+decision_table = sa.table('decision',
+    sa.column('id', sa.Integer),
+    sa.column('data', sa.JSON)
+)
+
+decision_step_table = sa.table('decision_step',
+    sa.column('decision_id', sa.Integer),
+    sa.column('step_index', sa.Integer),
+    sa.column('title', sa.String),
+    sa.column('data', sa.JSON),
+    sa.column('ai_suggestion', sa.JSON),
+    sa.column('updated_at', sa.DateTime)
+)
+
+
+def upgrade():
+    op.create_table('decision_step',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('decision_id', sa.Integer(), nullable=False),
+        sa.Column('step_index', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=100), nullable=False),
+        sa.Column('data', sa.JSON(), nullable=False),
+        sa.Column('ai_suggestion', sa.JSON(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['decision_id'], ['decision.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('decision_id', 'step_index', name='uq_decision_step_decision_id_step_index')
+    )
+
+    connection = op.get_bind()
+    now = datetime.utcnow()
+    for decision_id, data in connection.execute(sa.select(decision_table.c.id, decision_table.c.data)).fetchall():
+        data = dict(data or {})
+        rows = []
+        for step_index, title in enumerate(STEP_TITLES):
+            suggestion_key = f"{title}_ai_suggestion"
+            if title not in data and suggestion_key not in data:
+                continue
+            rows.append({
+                'decision_id': decision_id,
+                'step_index': step_index,
+                'title': title,
+                'data': data.pop(title, None) or {},
+                'ai_suggestion': data.pop(suggestion_key, None),
+                'updated_at': now
+            })
+        if rows:
+            op.bulk_insert(decision_step_table, rows)
+            connection.execute(decision_table.update()
+                               .where(decision_table.c.id == decision_id)
+                               .values(data=data))
+
+
+def downgrade():
+    connection = op.get_bind()
+    steps = connection.execute(sa.select(
+        decision_step_table.c.decision_id,
+        decision_step_table.c.title,
+        decision_step_table.c.data,
+        decision_step_table.c.ai_suggestion
+    ).order_by(decision_step_table.c.decision_id, decision_step_table.c.step_index)).fetchall()
+
+    by_decision = {}
+    for decision_id, title, data, ai_suggestion in steps:
+        entries = by_decision.setdefault(decision_id, {})
+        entries[title] = data
+        entries[f"{title}_ai_suggestion"] = ai_suggestion
+
+    for decision_id, entries in by_decision.items():
+        current = connection.execute(sa.select(decision_table.c.data)
+                                     .where(decision_table.c.id == decision_id)).scalar()
+        merged = dict(current or {})
+        merged.update(entries)
+        connection.execute(decision_table.update()
+                           .where(decision_table.c.id == decision_id)
+                           .values(data=merged))
+
+    op.drop_table('decision_step')
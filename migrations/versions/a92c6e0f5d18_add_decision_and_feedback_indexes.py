@@ -0,0 +1,31 @@
+"""Add indexes for the decision history listing.
+
+Revision ID: a92c6e0f5d18
+Revises: 7d3e5a91c4b2
+Create Date: 2024-08-02 09:17:44.560291
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a92c6e0f5d18'
+down_revision = '7d3e5a91c4b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('decision', schema=None) as batch_op:
+        batch_op.create_index('ix_decision_user_id_created_at', ['user_id', 'created_at'], unique=False)
+
+    with op.batch_alter_table('feedback', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_feedback_decision_id'), ['decision_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('feedback', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_feedback_decision_id'))
+
+    with op.batch_alter_table('decision', schema=None) as batch_op:
+        batch_op.drop_index('ix_decision_user_id_created_at')
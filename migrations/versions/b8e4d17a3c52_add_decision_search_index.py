@@ -0,0 +1,32 @@
+"""Add a full-text search index of decisions and fill it from existing rows.
+
+Revision ID: b8e4d17a3c52
+Revises: 3f9d2b6c8a17
+Create Date: 2024-08-19 16:27:43.905126
+
+"""
+from alembic import op
+
+from search import create_search_table, drop_search_table, rebuild_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e4d17a3c52'
+down_revision = '3f9d2b6c8a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    # FTS5 is SQLite-only; other databases search questions without an index
+    if connection.dialect.name != 'sqlite':
+        return
+    create_search_table(connection)
+    rebuild_search_index(connection)
+
+
+def downgrade():
+    connection = op.get_bind()
+    if connection.dialect.name == 'sqlite':
+        drop_search_table(connection)
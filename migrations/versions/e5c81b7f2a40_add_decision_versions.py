@@ -0,0 +1,32 @@
+"""Add version counters to decision and decision_step.
+
+Revision ID: e5c81b7f2a40
+Revises: a92c6e0f5d18
+Create Date: 2024-08-06 14:02:51.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c81b7f2a40'
+down_revision = 'a92c6e0f5d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('decision', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+    with op.batch_alter_table('decision_step', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('decision_step', schema=None) as batch_op:
+        batch_op.drop_column('version')
+
+    with op.batch_alter_table('decision', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -1,4 +1,8 @@
+import hashlib
 import json
+import re
+import threading
+from collections import OrderedDict
 
 from decision_framework import PERSONAL_DECISION_FRAMEWORK
 
@@ -31,13 +35,68 @@ Please structure your response in the following JSON format:
 }}
 """
 
+# Cacheable form: everything static lives in one system prompt shared by every
+# user and step, and only the step title and decision context vary per call.
+# Each step's own static text is well under the provider's minimum cacheable
+# prefix, so the whole framework goes into the one cached block.
+SYSTEM_PROMPT_TEMPLATE = """You guide people through a structured personal decision-making process, one step at a time.
+
+The process has these steps:
+
+{steps}
+For the step you are asked about, provide:
+1. A brief explanation and suggestions for this step (in markdown format) Important: always use \\n for new lines.
+2. Pre-filled data for the user input fields, based on your best guess of what user would write
+
+Please ensure that your pre-filled data adheres to the field types, structures, and validations described for that step.
+Respond only with a JSON object in the response format given for that step.
+"""
+
+STEP_SPEC_TEMPLATE = """## {step_title}
+
+{step_description}
+
+Fields the user needs to complete:
+
+{fields}
+Response format:
+
+{{
+    "suggestion": "Your brief markdown-formatted suggestion here",
+    "pre_filled_data": {{
+        {field_format}
+    }}
+}}
+"""
+
+STEP_REQUEST_TEMPLATE = """
+Step: {step_title}
+
+Current Decision Context:
+{current_context}
+
+Please provide guidance for the user on the "{step_title}" step of their decision-making process, \
+in the response format for that step.
+"""
+
+def example_number(spec):
+    # Half the maximum, so the two example objects stay within limits such as total_weight
+    return max(spec.get('min', 0), spec.get('max', 10) // 2)
+
 def generate_field_format(fields):
     formats = []
     for field in fields:
         if field['type'] == 'matrix':
-            formats.append(f'"{field["name"]}": {{"Option1": {{"Criterion1": 5, "Criterion2": 4}}, "Option2": {{"Criterion1": 3, "Criterion2": 5}}}}')
+            cell = field.get('cell_format', {})
+            high = cell.get('max', 5)
+            low = max(cell.get('min', 1), high - 1)
+            formats.append(f'"{field["name"]}": {{"Option1": {{"Criterion1": {high}, "Criterion2": {low}}}, '
+                           f'"Option2": {{"Criterion1": {low}, "Criterion2": {high}}}}}')
         elif field['type'] == 'list_of_objects':
-            object_format = ", ".join([f'"{k}": "Example {k}"' for k in field['object_structure'].keys()])
+            # Numbers are shown as numbers, or the model answers with strings
+            object_format = ", ".join([
+                f'"{k}": {example_number(spec)}' if isinstance(spec, dict) else f'"{k}": "Example {k}"'
+                for k, spec in field['object_structure'].items()])
             formats.append(f'"{field["name"]}": [{{{object_format}}}, {{{object_format}}}]')
         elif field['type'] == 'list':
             formats.append(f'"{field["name"]}": ["Example 1", "Example 2", "Example 3"]')
@@ -66,9 +125,138 @@ def generate_field_description(field):
     
     return description
 
-def generate_prompt(step, current_context):
-    fields_text = "\n".join([generate_field_description(field) for field in step['fields']])
-    field_format = generate_field_format(step['fields'])
+def generate_number_schema(spec):
+    whole = spec.get('step') == 1 and isinstance(spec.get('min', 0), int)
+    schema = {"type": "integer" if whole else "number"}
+    if 'min' in spec:
+        schema['minimum'] = spec['min']
+    if 'max' in spec:
+        schema['maximum'] = spec['max']
+    return schema
+
+def generate_field_schema(field):
+    """JSON schema of one field's value, as the form submits it."""
+    if field['type'] == 'matrix':
+        # Rows and columns are the option and criterion names, so only the cells are typed
+        schema = {"type": "object", "additionalProperties": {
+            "type": "object", "additionalProperties": generate_number_schema(field['cell_format'])}}
+    elif field['type'] == 'list_of_objects':
+        properties = {name: {"type": "string"} if isinstance(spec, str) else generate_number_schema(spec)
+                      for name, spec in field['object_structure'].items()}
+        schema = {"type": "array", "items": {"type": "object", "properties": properties,
+                                             "additionalProperties": False}}
+    elif field['type'] == 'list':
+        schema = {"type": "array", "items": {"type": "string"}}
+    else:
+        schema = {"type": "string"}
+    schema['description'] = f"{field['label']}: {field['description']}"
+    return schema
+
+def generate_response_schema(step):
+    return {
+        "type": "object",
+        "properties": {
+            "suggestion": {"type": "string", "description": "Your brief markdown-formatted suggestion for this step"},
+            "pre_filled_data": {
+                "type": "object",
+                "description": "Your best guess of what the user would write in each field",
+                "properties": {field['name']: generate_field_schema(field) for field in step['fields']},
+                "additionalProperties": False,
+            },
+        },
+        "required": ["suggestion", "pre_filled_data"],
+    }
+
+def step_tool_name(step):
+    return "suggest_" + re.sub(r'[^a-z0-9]+', '_', step['title'].lower()).strip('_')
+
+def generate_step_tool(step):
+    """Tool whose input is the suggestion reply for ``step``; forcing it makes the reply parseable JSON."""
+    return {
+        "name": step_tool_name(step),
+        "description": f'Give the user your suggestion and pre-filled data for the "{step["title"]}" step.',
+        "input_schema": generate_response_schema(step),
+    }
+
+class CompiledPrompt:
+    """Prompt for a single step with everything except the decision context pre-rendered."""
+
+    def __init__(self, step):
+        self.step = step
+        head_template, tail_template = PROMPT_TEMPLATE.split('{current_context}')
+        self.head = head_template.format(
+            step_title=step['title'],
+            step_description=step.get('description', 'No description provided')
+        )
+        fields = "\n".join([generate_field_description(field) for field in step['fields']])
+        field_format = generate_field_format(step['fields'])
+        self.tail = tail_template.format(fields=fields, field_format=field_format)
+        self.spec = STEP_SPEC_TEMPLATE.format(
+            step_title=step['title'],
+            step_description=step.get('description', 'No description provided'),
+            fields=fields,
+            field_format=field_format
+        )
+        request_head, self.request_tail = STEP_REQUEST_TEMPLATE.split('{current_context}')
+        self.request_head = request_head.format(step_title=step['title'])
+        self.request_tail = self.request_tail.format(step_title=step['title'])
+        self.tool = generate_step_tool(step)
+
+    def render(self, context_dict):
+        return self.head + context_serializer.render(context_dict) + self.tail
+
+    def render_request(self, context_dict):
+        return self.request_head + context_serializer.render(context_dict) + self.request_tail
+
+
+class ContextSerializer:
+    """Renders context entries as ``key:\n<indented JSON>``, reusing earlier renderings.
+
+    ``json.dumps`` with ``indent`` falls back to the pure-Python encoder, while the
+    compact form goes through the C encoder, so the compact dump is used as the
+    cache key and the indented one is only built for values not seen before.
+    """
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._rendered = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, context_dict):
+        parts = []
+        for key, value in context_dict.items():
+            cache_key = (key, json.dumps(value, separators=(',', ':')))
+            with self._lock:
+                rendered = self._rendered.get(cache_key)
+                if rendered is not None:
+                    self._rendered.move_to_end(cache_key)
+            if rendered is None:
+                rendered = f"{key}:\n{json.dumps(value, indent=2)}"
+                with self._lock:
+                    self._rendered[cache_key] = rendered
+                    if len(self._rendered) > self.max_entries:
+                        self._rendered.popitem(last=False)
+            parts.append(rendered)
+        return "\n".join(parts)
+
+
+context_serializer = ContextSerializer()
+
+COMPILED_PROMPTS = {step['title']: CompiledPrompt(step) for step in PERSONAL_DECISION_FRAMEWORK['steps']}
+
+SYSTEM_PROMPT = SYSTEM_PROMPT_TEMPLATE.format(
+    steps="\n".join(compiled.spec for compiled in COMPILED_PROMPTS.values()))
+# Part of the suggestion cache key, so cached suggestions do not outlive a framework change
+SYSTEM_PROMPT_DIGEST = hashlib.sha256(SYSTEM_PROMPT.encode('utf-8')).hexdigest()[:16]
+SYSTEM_BLOCKS = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+# Tools come before the system blocks in the cached prefix, so every call sends
+# the tools of all steps and only tool_choice says which one to use
+SUGGESTION_TOOLS = [compiled.tool for compiled in COMPILED_PROMPTS.values()]
+
+def _compiled(step, current_context):
+    compiled = COMPILED_PROMPTS.get(step['title'])
+    if compiled is None or compiled.step is not step:
+        compiled = CompiledPrompt(step)
     
     # Parse the current_context if it's a string, otherwise use it as is
     if isinstance(current_context, str):
@@ -76,12 +264,26 @@ def generate_prompt(step, current_context):
     else:
         context_dict = current_context
 
-    formatted_context = "\n".join([f"{key}:\n{json.dumps(value, indent=2)}" for key, value in context_dict.items()])
-    
-    return PROMPT_TEMPLATE.format(
-        step_title=step['title'],
-        step_description=step.get('description', 'No description provided'),
-        current_context=formatted_context,
-        fields=fields_text,
-        field_format=field_format
-    )
\ No newline at end of file
+    return compiled, context_dict
+
+def generate_prompt(step, current_context):
+    """The whole prompt for a step as a single message, static instructions included."""
+    compiled, context_dict = _compiled(step, current_context)
+    return compiled.render(context_dict)
+
+def generate_step_request(step, current_context):
+    """The per-call user message for a step, to be sent with ``SYSTEM_BLOCKS``.
+
+    Steps that are not part of ``SYSTEM_PROMPT`` get the single-message prompt.
+    """
+    compiled, context_dict = _compiled(step, current_context)
+    if COMPILED_PROMPTS.get(step['title']) is not compiled:
+        return compiled.render(context_dict)
+    return compiled.render_request(context_dict)
+
+def step_tool_choice(step):
+    """``tool_choice`` forcing the tool of ``step``, or None for steps without one in ``SUGGESTION_TOOLS``."""
+    compiled = COMPILED_PROMPTS.get(step['title'])
+    if compiled is None or compiled.step is not step:
+        return None
+    return {"type": "tool", "name": compiled.tool['name']}
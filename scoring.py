@@ -0,0 +1,166 @@
+import numpy as np
+
+DEFAULT_SAMPLES = 100000
+DEFAULT_SPREAD = 0.2
+# Samples are drawn in chunks of about this many matrix cells to bound memory
+CHUNK_CELLS = 1 << 20
+# Sampled scores (0..1, float32) closer than this count as a tie
+TIE_TOLERANCE = 1e-6
+
+
+class DecisionMatrix:
+    """Options x criteria ratings and criterion weights, as arrays.
+
+    ``scores`` holds the ratings rescaled from ``scale`` to 0..1, ``weights``
+    the criterion weights normalized to sum to 1 (equal weights if none are
+    set). Ratings that are missing or not numbers count as the scale minimum,
+    the value the form starts from.
+    """
+
+    def __init__(self, options, criteria, scores, weights):
+        self.options = options
+        self.criteria = criteria
+        self.scores = scores
+        self.weights = weights
+
+    @classmethod
+    def from_step_data(cls, criteria, evaluations, scale=(1, 5)):
+        """Build the matrix from the "criteria" and "evaluations" fields of the framework steps."""
+        low, high = scale
+        names, weights = [], []
+        for criterion in criteria or []:
+            if not isinstance(criterion, dict) or not criterion.get('name') or criterion['name'] in names:
+                continue
+            names.append(criterion['name'])
+            weights.append(_number(criterion.get('weight'), 0.0))
+        options = [option for option in (evaluations or {}) if isinstance(evaluations[option], dict)]
+        scores = np.full((len(options), len(names)), float(low))
+        for i, option in enumerate(options):
+            for j, name in enumerate(names):
+                scores[i, j] = min(max(_number(evaluations[option].get(name), low), low), high)
+        weights = np.clip(np.array(weights, dtype=float), 0.0, None)
+        if weights.sum() == 0:
+            weights = np.ones(len(names))
+        return cls(options, names, (scores - low) / (high - low), weights / weights.sum())
+
+    def __bool__(self):
+        return bool(self.options) and bool(self.criteria)
+
+
+def weighted_scores(scores, weights):
+    """Weighted score of each option, 0..100."""
+    return scores @ weights * 100
+
+
+def competition_ranks(values):
+    """1 + the number of values strictly greater, so ties share a rank."""
+    values = np.asarray(values)
+    ordered = np.sort(values)
+    return 1 + len(values) - np.searchsorted(ordered, values, side='right')
+
+
+def sensitivity(scores, weights, samples=DEFAULT_SAMPLES, spread=DEFAULT_SPREAD, seed=0):
+    """Monte Carlo sensitivity of the ranking to the criterion weights.
+
+    Each sample scales every weight by an independent factor drawn uniformly
+    from ``1 - spread`` to ``1 + spread``, renormalizes, and rescores all
+    options. Returns per-option win rates, mean ranks and the mean and standard
+    deviation of the score across samples.
+
+    Options within ``TIE_TOLERANCE`` of each other tie: they split the win of
+    a sample between them and share the average of their ranks, so identically
+    rated options (e.g. ones not rated yet) come out even instead of favouring
+    whichever is listed first.
+    """
+    n_options, n_criteria = scores.shape
+    rng = np.random.default_rng(seed)
+    # Ranking only needs float32, which sorts faster
+    scores_t = scores.T.astype(np.float32)
+    wins = np.zeros(n_options)
+    rank_sum = np.zeros(n_options)
+    weight_sum = np.zeros(n_criteria)
+    weight_products = np.zeros((n_criteria, n_criteria))
+    chunk = max(1, CHUNK_CELLS // max(n_options, n_criteria))
+    done = 0
+    while done < samples:
+        size = min(chunk, samples - done)
+        perturbed = weights * rng.uniform(1 - spread, 1 + spread, (size, n_criteria))
+        perturbed /= perturbed.sum(axis=1, keepdims=True)
+        sample_scores = perturbed.astype(np.float32) @ scores_t
+        # Options of each sample from best to worst
+        order = np.argsort(-sample_scores, axis=1)
+        ordered = np.take_along_axis(sample_scores, order, axis=1)
+        # An option within the tolerance of the one ranked above it ties with it
+        starts = np.ones((size, n_options), dtype=bool)
+        starts[:, 1:] = ordered[:, :-1] - ordered[:, 1:] > TIE_TOLERANCE
+        tied = ~starts.all(axis=1)
+        if tied.any():
+            _share_ties(order[tied], starts[tied], wins, rank_sum)
+            order = order[~tied]
+        wins += np.bincount(order[:, 0], minlength=n_options)
+        rank_sum += np.bincount(order.ravel(), weights=np.tile(np.arange(1.0, n_options + 1), len(order)),
+                                minlength=n_options)
+        # Scores are linear in the weights, so their mean and variance follow from the weights'
+        weight_sum += perturbed.sum(axis=0)
+        weight_products += perturbed.T @ perturbed
+        done += size
+    mean_weights = weight_sum / samples
+    covariance = weight_products / samples - np.outer(mean_weights, mean_weights)
+    variance = np.einsum('ij,jk,ik->i', scores, covariance, scores)
+    return {
+        'win_rate': wins / samples,
+        'mean_rank': rank_sum / samples,
+        'score_mean': scores @ mean_weights * 100,
+        'score_std': np.sqrt(np.maximum(variance, 0.0)) * 100,
+    }
+
+
+def _share_ties(order, starts, wins, rank_sum):
+    """Add the wins and ranks of samples whose sorted options contain tie groups.
+
+    ``starts`` marks the options (in ``order``) that start a new group. Tied
+    options get the average of their positions as their rank, and the options
+    of a sample's first group split its win.
+    """
+    size, n_options = order.shape
+    # Group ids are unique across the chunk: row * n_options + group within the row
+    groups = (np.cumsum(starts, axis=1) - 1 + np.arange(size)[:, None] * n_options).ravel()
+    group_sizes = np.bincount(groups, minlength=size * n_options)[groups]
+    positions = np.bincount(groups, weights=np.tile(np.arange(1.0, n_options + 1), size),
+                            minlength=size * n_options)[groups]
+    shared_wins = np.where(groups % n_options == 0, 1.0 / group_sizes, 0.0)
+    wins += np.bincount(order.ravel(), weights=shared_wins, minlength=n_options)
+    rank_sum += np.bincount(order.ravel(), weights=positions / group_sizes, minlength=n_options)
+
+
+def score_decision(matrix, samples=DEFAULT_SAMPLES, spread=DEFAULT_SPREAD, seed=0):
+    """Scores, ranking and weight sensitivity of ``matrix``, as JSON-ready data (best option first)."""
+    scores = weighted_scores(matrix.scores, matrix.weights)
+    ranks = competition_ranks(scores)
+    result = sensitivity(matrix.scores, matrix.weights, samples, spread, seed) if samples else None
+    options = []
+    for i in np.lexsort((np.arange(len(scores)), -scores)):
+        option = {'name': matrix.options[i], 'score': round(float(scores[i]), 2), 'rank': int(ranks[i])}
+        if result is not None:
+            option.update({'win_rate': round(float(result['win_rate'][i]), 4),
+                           'mean_rank': round(float(result['mean_rank'][i]), 3),
+                           'score_mean': round(float(result['score_mean'][i]), 2),
+                           'score_std': round(float(result['score_std'][i]), 2)})
+        options.append(option)
+    return {
+        'criteria': [{'name': name, 'weight': round(float(weight) * 100, 2)}
+                     for name, weight in zip(matrix.criteria, matrix.weights)],
+        'options': options,
+        'samples': samples,
+        'spread': spread,
+        # Share of samples in which the top-ranked option stays on top
+        'stability': options[0]['win_rate'] if result is not None else None,
+    }
+
+
+def _number(value, default):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    return number if np.isfinite(number) else default
@@ -0,0 +1,217 @@
+import json
+import re
+
+from markupsafe import escape
+from sqlalchemy import DateTime, text
+
+from compression import decompress
+
+SEARCH_TABLE = 'decision_search'
+# Column weights for bm25, in column order; the owner column only filters
+RANK = 'bm25(0.0, 10.0, 4.0, 1.0)'
+MAX_TERMS = 16
+SNIPPET_TOKENS = 24
+# Private-use characters mark matches in snippets until the text is escaped
+MATCH_START, MATCH_END = '\ue000', '\ue001'
+# Between the steps' text in the steps column, so that one step's text can be
+# replaced without loading the others; the tokenizer treats it as a space
+STEP_SEPARATOR = '\x1e'
+INSERT_DOCUMENT = (f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, owner, question, summary, steps) "
+                   "VALUES (:id, :owner, :question, :summary, :steps)")
+
+
+def create_search_table(connection):
+    """Create the FTS5 index of decisions, one row per decision with ``rowid = decision.id``.
+
+    The owner column holds a ``u<user_id>`` token so that a user's search is
+    an intersection with their own rows inside the index: bm25 is then only
+    computed for that user's matches, not for every user's.
+    """
+    connection.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+        "owner, question, summary, steps, "
+        "tokenize='porter unicode61 remove_diacritics 2')"
+    ))
+    connection.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('rank', :rank)"),
+                       {'rank': RANK})
+
+
+def drop_search_table(connection):
+    connection.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+
+
+def is_search_table(name):
+    """True for the index and the shadow tables FTS5 keeps next to it."""
+    return name == SEARCH_TABLE or name.startswith(f"{SEARCH_TABLE}_")
+
+
+def owner_token(user_id):
+    return f"u{user_id}"
+
+
+def document_text(value):
+    """The text in a step's data, one string per line; numbers and keys are left out.
+
+    ``STEP_SEPARATOR`` is replaced with a space, so the text is always one segment.
+    """
+    parts = []
+    _collect_text(value, parts)
+    return '\n'.join(parts)
+
+
+def _collect_text(value, parts):
+    if isinstance(value, str):
+        if value.strip():
+            # A separator typed by the user would shift the other steps' segments
+            parts.append(value.replace(STEP_SEPARATOR, ' '))
+    elif isinstance(value, dict):
+        for item in value.values():
+            _collect_text(item, parts)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_text(item, parts)
+
+
+def steps_text(step_data):
+    """Index text of all steps from ``{step_index: data}``, one segment per step index."""
+    segments = [''] * (max(step_data, default=-1) + 1)
+    for step_index, data in step_data.items():
+        segments[step_index] = document_text(data)
+    return STEP_SEPARATOR.join(segments)
+
+
+def document(decision_id, user_id, question, summary=None, steps=''):
+    return {'id': decision_id, 'owner': owner_token(user_id), 'question': question,
+            'summary': summary or '', 'steps': steps}
+
+
+def index_decision(connection, decision_id, user_id, question, summary=None, steps=''):
+    connection.execute(text(INSERT_DOCUMENT), document(decision_id, user_id, question, summary, steps))
+
+
+def update_search_column(connection, decision_id, column, value):
+    """Replace the ``summary`` or ``steps`` text of an indexed decision."""
+    if column not in ('summary', 'steps'):
+        raise ValueError(f"Not an updatable search column: {column!r}")
+    connection.execute(text(f"UPDATE {SEARCH_TABLE} SET {column} = :value WHERE rowid = :id"),
+                       {'id': decision_id, 'value': value or ''})
+
+
+def update_step_text(connection, decision_id, step_index, data):
+    """Replace one step's segment of an indexed decision's steps text.
+
+    The other steps' text is read back from the index, so a submitted step
+    does not load and decompress every step of the decision.
+    """
+    steps = connection.execute(text(f"SELECT steps FROM {SEARCH_TABLE} WHERE rowid = :id"),
+                               {'id': decision_id}).scalar()
+    if steps is None:
+        return
+    segments = steps.split(STEP_SEPARATOR) if steps else []
+    segments.extend([''] * (step_index + 1 - len(segments)))
+    segments[step_index] = document_text(data)
+    update_search_column(connection, decision_id, 'steps', STEP_SEPARATOR.join(segments))
+
+
+def remove_decision(connection, decision_id):
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {'id': decision_id})
+
+
+def match_query(query, user_id=None):
+    """FTS5 query for the words in ``query``, or None if it has none.
+
+    Words are quoted, so FTS5 syntax in user input is searched for literally,
+    and all of them must match (in any form the stemmer maps to the same
+    stem). With ``user_id`` only that user's decisions match.
+
+    The words are not limited to the text columns: a column filter makes
+    bm25 read the positions of every row with the word, which nearly triples query
+    time for common words, and the only other thing a word can match is the
+    user's own owner token. Prefix queries are not offered for the same
+    reason; they merge the rows of every matching word.
+    """
+    terms = re.findall(r'\w+', query)[:MAX_TERMS]
+    if not terms:
+        return None
+    expression = '(' + ' '.join(f'"{term}"' for term in terms) + ')'
+    if user_id is not None:
+        expression = f"owner : {owner_token(user_id)} AND {expression}"
+    return expression
+
+
+def find_decisions(connection, user_id, query, limit, offset=0):
+    """The user's decisions matching ``query``, best first.
+
+    Each result has the decision's list fields, ``score`` (bm25, lower is
+    better), and ``question_html`` and ``snippet_html`` with the matches in
+    ``<mark>`` tags and everything else escaped. The snippet comes from the
+    steps, or from the summary if only it matched.
+    """
+    expression = match_query(query, user_id)
+    if expression is None:
+        return []
+    rows = connection.execute(text(
+        "SELECT decision.id, decision.question, decision.framework, decision.created_at, "
+        f"decision.current_step, decision.status, {SEARCH_TABLE}.rank AS score, "
+        f"highlight({SEARCH_TABLE}, 1, :start, :end) AS question_marked, "
+        f"snippet({SEARCH_TABLE}, 2, :start, :end, :ellipsis, :tokens) AS summary_snippet, "
+        f"snippet({SEARCH_TABLE}, 3, :start, :end, :ellipsis, :tokens) AS steps_snippet "
+        f"FROM {SEARCH_TABLE} JOIN decision ON decision.id = {SEARCH_TABLE}.rowid "
+        f"WHERE {SEARCH_TABLE} MATCH :expression AND decision.user_id = :user_id "
+        f"ORDER BY {SEARCH_TABLE}.rank, decision.id DESC LIMIT :limit OFFSET :offset"
+    ).columns(created_at=DateTime), {
+        'expression': expression, 'user_id': user_id, 'limit': limit, 'offset': offset,
+        'start': MATCH_START, 'end': MATCH_END, 'ellipsis': '…', 'tokens': SNIPPET_TOKENS,
+    }).mappings()
+    results = []
+    for row in rows:
+        result = {key: row[key] for key in ('id', 'question', 'framework', 'created_at', 'current_step',
+                                            'status', 'score')}
+        result['question_html'] = highlighted(row['question_marked'])
+        result['snippet_html'] = highlighted(_matched(row['steps_snippet']) or _matched(row['summary_snippet']))
+        results.append(result)
+    return results
+
+
+def highlighted(marked):
+    """Escape marked text for HTML, turning the match markers into ``<mark>`` tags."""
+    return (str(escape(marked or '')).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+            .replace(STEP_SEPARATOR, '\n'))
+
+
+def _matched(snippet):
+    return snippet if snippet and MATCH_START in snippet else None
+
+
+def rebuild_search_index(connection, batch_size=500):
+    """Index every decision from the decision and decision_step tables; returns the number indexed.
+
+    Reads the stored columns directly (decompressing them), so it can run from
+    a migration without the models.
+    """
+    connection.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    indexed = 0
+    last_id = 0
+    while True:
+        decisions = connection.execute(text(
+            "SELECT id, user_id, question, summary FROM decision WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {'last_id': last_id, 'limit': batch_size}).fetchall()
+        if not decisions:
+            break
+        last_id = decisions[-1].id
+        steps = {}
+        for row in connection.execute(text(
+            "SELECT decision_id, step_index, data FROM decision_step WHERE decision_id BETWEEN :first AND :last"
+        ), {'first': decisions[0].id, 'last': last_id}):
+            if row.data is not None:
+                steps.setdefault(row.decision_id, {})[row.step_index] = json.loads(decompress(row.data))
+        connection.execute(text(INSERT_DOCUMENT), [
+            document(decision.id, decision.user_id, decision.question,
+                     decompress(decision.summary).decode('utf-8') if decision.summary is not None else None,
+                     steps_text(steps.get(decision.id, {})))
+            for decision in decisions
+        ])
+        indexed += len(decisions)
+    # Merge the segments written batch by batch into one
+    connection.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"))
+    return indexed
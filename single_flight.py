@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalescing stays within one process
+    fcntl = None
+
+_MISSING = object()
+
+
+class SingleFlight:
+    """Lets concurrent identical calls share one execution.
+
+    The first caller for a key leads: it makes the call and ``publish``es the
+    result. Callers that arrive while it is in flight wait and receive the same
+    result instead of calling again. Threads of one process wait on an event;
+    other worker processes wait on an ``flock`` of a per-key file in
+    ``lock_dir`` and read the result the leader leaves next to it.
+
+    A leader that fails without publishing releases its followers, which then
+    run the call themselves. So does a follower that waits longer than
+    ``max_wait``; with ``wait=0`` a caller never waits at all.
+    """
+
+    def __init__(self, lock_dir=None, max_wait=60.0, poll_interval=0.05, result_ttl=60.0):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.counters = {'leaders': 0, 'coalesced': 0, 'coalesced_across_processes': 0, 'wait_timeouts': 0}
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    @contextmanager
+    def flight(self, key, wait=None):
+        """Join the call for ``key``; yields a ``Flight``.
+
+        ``flight.shared`` is true when another caller's result is in
+        ``flight.result``. Otherwise the caller makes the call itself and, if
+        ``flight.leading``, publishes the result for anyone waiting.
+        """
+        flight = self._join(key, wait)
+        try:
+            yield flight
+        finally:
+            self._land(flight)
+
+    @asynccontextmanager
+    async def async_flight(self, key, wait=None):
+        """``flight`` for coroutines; waiting happens in a worker thread."""
+        flight = await asyncio.to_thread(self._join, key, wait)
+        try:
+            yield flight
+        finally:
+            await asyncio.to_thread(self._land, flight)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, in_flight=len(self._calls))
+
+    def _join(self, key, wait):
+        deadline = time.monotonic() + (self.max_wait if wait is None else wait)
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    break
+            call.done.wait(max(0.0, deadline - time.monotonic()))
+            if call.result is not _MISSING:
+                self._count('coalesced')
+                return Flight(self, key, None, call.result)
+            if not call.done.is_set():
+                self._count('wait_timeouts')
+                return Flight(self, key, None)
+            # The leader gave up without a result; try to lead instead
+
+        flight = Flight(self, key, call)
+        if self.lock_dir:
+            try:
+                self._lock_file(flight, deadline)
+            except BaseException:
+                self._land(flight)
+                raise
+        if flight.leading:
+            self._count('leaders')
+        return flight
+
+    def _lock_file(self, flight, deadline):
+        path = os.path.join(self.lock_dir, flight.key)
+        started = time.time()
+        waited_since = None
+        handle = open(path + '.lock', 'a+')
+        while True:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                waited_since = started
+                if time.monotonic() >= deadline:
+                    handle.close()
+                    self._count('wait_timeouts')
+                    flight.leading = False
+                    return
+                time.sleep(self.poll_interval)
+        flight.handle = handle
+        os.utime(handle.fileno())
+        if waited_since is not None:
+            # Another process led while we waited; its result is only ours if written since
+            result = _read_result(path + '.json', waited_since)
+            if result is not _MISSING:
+                flight.result = result
+                flight.leading = False
+                self._count('coalesced_across_processes')
+                # Threads of this process waiting on us get it too
+                flight.call.result = result
+
+    def _publish(self, flight, result):
+        flight.call.result = result
+        if flight.handle is not None:
+            path = os.path.join(self.lock_dir, flight.key + '.json')
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_path, 'w') as f:
+                json.dump(result, f)
+            os.replace(tmp_path, path)
+
+    def _land(self, flight):
+        if flight.handle is not None:
+            fcntl.flock(flight.handle, fcntl.LOCK_UN)
+            flight.handle.close()
+            flight.handle = None
+        if flight.call is not None:
+            with self._lock:
+                if self._calls.get(flight.key) is flight.call:
+                    del self._calls[flight.key]
+            flight.call.done.set()
+            flight.call = None
+        self._sweep()
+
+    def _sweep(self):
+        # Result files are only read by callers that were already waiting, so old
+        # ones (and their lock files) can go. Losing a lock file to this race only
+        # costs a missed coalesce, never a wrong result.
+        now = time.time()
+        if not self.lock_dir or now - self._last_sweep < self.result_ttl:
+            return
+        self._last_sweep = now
+        for entry in os.scandir(self.lock_dir):
+            try:
+                if entry.stat().st_mtime < now - self.result_ttl:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+
+class Flight:
+    def __init__(self, single_flight, key, call, result=_MISSING):
+        self.single_flight = single_flight
+        self.key = key
+        self.call = call
+        self.result = result
+        self.leading = call is not None
+        self.handle = None
+
+    @property
+    def shared(self):
+        return self.result is not _MISSING
+
+    def publish(self, result):
+        """Hand ``result`` (JSON-serializable) to every caller waiting on this flight."""
+        if self.leading:
+            self.single_flight._publish(self, result)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = _MISSING
+
+
+def _read_result(path, written_since):
+    try:
+        if os.stat(path).st_mtime < written_since:
+            return _MISSING
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return _MISSING
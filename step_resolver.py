@@ -0,0 +1,117 @@
+import threading
+from collections import OrderedDict
+
+
+class StepResolver:
+    """Fills in a framework step's dependent options from a decision's saved data.
+
+    The framework's ``dependencies`` declarations are compiled once into a
+    dependency graph: for every step, the fields whose options come from other
+    steps and the steps they read. ``resolve`` never touches the framework; it
+    returns a copy of the step with ``row_options``, ``column_options``,
+    ``dependent_options`` or ``options`` filled in.
+
+    Resolved copies are memoized per decision and step, keyed on the versions of
+    the steps they were built from, so loading a step again while its
+    dependencies are unchanged costs a dictionary lookup. Memoized copies are
+    shared between requests and must be treated as read-only.
+
+    SQLite hands the id of a deleted decision to the next one, and versions
+    start over with it, so the key also holds the decision's creation time:
+    a copy memoized in another process before a delete can never be returned
+    for the new decision. ``invalidate`` frees a deleted decision's entries.
+    """
+
+    def __init__(self, framework, max_entries=1024):
+        self.framework = framework
+        self.max_entries = max_entries
+        self.step_indices = {step['title']: index for index, step in enumerate(framework['steps'])}
+        self._resolutions = [self._compile(step) for step in framework['steps']]
+        self._dependencies = [frozenset(self.step_indices[dep['step']]
+                                        for _, targets in resolutions
+                                        for _, deps, per_attribute in targets
+                                        for dep in (deps.values() if per_attribute else [deps]))
+                              for resolutions in self._resolutions]
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def _compile(step):
+        # [(field index, [(target attribute, dependency, per_attribute)])]
+        resolutions = []
+        for field_index, field in enumerate(step['fields']):
+            dependencies = field.get('dependencies')
+            if not dependencies:
+                continue
+            if field['type'] == 'matrix':
+                targets = [(target, dependencies[axis], False)
+                           for axis, target in (('rows', 'row_options'), ('columns', 'column_options'))
+                           if axis in dependencies]
+            elif field['type'] == 'list_of_objects':
+                targets = [('dependent_options', dependencies, True)]
+            elif field['type'] == 'select':
+                targets = [('options', dependencies, False)]
+            else:
+                continue
+            resolutions.append((field_index, targets))
+        return resolutions
+
+    def dependencies(self, step_index):
+        """Indices of the steps whose saved data ``step_index`` reads."""
+        return self._dependencies[step_index]
+
+    def resolve(self, decision_id, step_index, versions, load_step_data, created_at=None):
+        """Return step ``step_index`` with its dependent options filled in.
+
+        ``versions`` identifies the state of the dependency steps (it is part of
+        the memo key, with ``decision_id`` and the decision's ``created_at``);
+        ``load_step_data()`` returns ``{step title: data}`` for them and is only
+        called when there is no memoized copy.
+        """
+        if not self._resolutions[step_index]:
+            return self.framework['steps'][step_index]
+
+        key = (decision_id, created_at, step_index, versions)
+        with self._lock:
+            step = self._memo.get(key)
+            if step is not None:
+                self._memo.move_to_end(key)
+                self.counters['hits'] += 1
+                return step
+            self.counters['misses'] += 1
+
+        step = self._build(step_index, load_step_data())
+        with self._lock:
+            self._memo[key] = step
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return step
+
+    def invalidate(self, decision_id):
+        """Forget the memoized steps of a decision, e.g. once it is deleted."""
+        with self._lock:
+            for key in [key for key in self._memo if key[0] == decision_id]:
+                del self._memo[key]
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, size=len(self._memo), max_entries=self.max_entries)
+
+    def _build(self, step_index, step_data):
+        step = dict(self.framework['steps'][step_index])
+        fields = list(step['fields'])
+        for field_index, targets in self._resolutions[step_index]:
+            field = dict(fields[field_index])
+            for target, deps, per_attribute in targets:
+                if per_attribute:
+                    field[target] = {attr: _options(dep, step_data) for attr, dep in deps.items()}
+                else:
+                    field[target] = _options(deps, step_data)
+            fields[field_index] = field
+        step['fields'] = fields
+        return step
+
+
+def _options(dep, step_data):
+    return [item[dep['use']] for item in step_data.get(dep['step'], {}).get(dep['field'], [])]
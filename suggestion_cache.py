@@ -0,0 +1,179 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class SuggestionCache:
+    """Two-tier cache for AI suggestions, keyed on a hash of model + prompt.
+
+    The in-process tier is an LRU dict bounded by ``max_entries``; the optional
+    persistent tier is a SQLite file shared by every worker process. Both tiers
+    expire entries after ``ttl`` seconds. Entries remember the decision and step
+    they were generated for so they can be dropped when that context changes.
+
+    Entries stored with ``prefetched=True`` were generated speculatively. The
+    first lookup that finds one counts as a prefetch hit; one dropped unread
+    (evicted, expired or invalidated) counts as a wasted model call.
+    """
+
+    def __init__(self, max_entries=512, ttl=3600, persistent_path=None, max_persistent_entries=10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persistent_path = persistent_path
+        self.max_persistent_entries = max_persistent_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._prefetched = set()
+        self.counters = {'hits': 0, 'memory_hits': 0, 'persistent_hits': 0,
+                         'misses': 0, 'evictions': 0, 'invalidations': 0,
+                         'prefetches': 0, 'prefetch_hits': 0, 'prefetch_wasted': 0}
+        if persistent_path:
+            with self._connection() as conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS suggestion_cache ('
+                    'key TEXT PRIMARY KEY, decision_id INTEGER, step INTEGER, '
+                    'value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)'
+                )
+                conn.execute('CREATE INDEX IF NOT EXISTS ix_suggestion_cache_decision '
+                             'ON suggestion_cache (decision_id, step)')
+
+    @staticmethod
+    def key_for(prompt, model):
+        return hashlib.sha256(f"{model}\0{prompt}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.counters['hits'] += 1
+                    self.counters['memory_hits'] += 1
+                    self._consume_prefetch(key)
+                    return entry[1]
+                del self._entries[key]
+                self._discard_prefetch(key)
+
+        if self.persistent_path:
+            with self._connection() as conn:
+                row = conn.execute('SELECT value, expires_at, decision_id, step FROM suggestion_cache '
+                                   'WHERE key = ? AND expires_at > ?', (key, now)).fetchone()
+                if row is not None:
+                    conn.execute('UPDATE suggestion_cache SET last_access = ? WHERE key = ?', (now, key))
+            if row is not None:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._store(key, value, row[1], row[2], row[3])
+                    self.counters['hits'] += 1
+                    self.counters['persistent_hits'] += 1
+                    self._consume_prefetch(key)
+                return value
+
+        with self._lock:
+            self.counters['misses'] += 1
+        return None
+
+    def contains(self, key):
+        """Whether ``key`` is cached, without touching the hit/miss counters."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return True
+        if self.persistent_path:
+            with self._connection() as conn:
+                return conn.execute('SELECT 1 FROM suggestion_cache WHERE key = ? AND expires_at > ?',
+                                    (key, now)).fetchone() is not None
+        return False
+
+    def set(self, key, value, decision_id=None, step=None, prefetched=False):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at, decision_id, step)
+            if prefetched:
+                self._prefetched.add(key)
+                self.counters['prefetches'] += 1
+            else:
+                self._prefetched.discard(key)
+        if self.persistent_path:
+            with self._connection() as conn:
+                conn.execute('INSERT OR REPLACE INTO suggestion_cache VALUES (?, ?, ?, ?, ?, ?)',
+                             (key, decision_id, step, json.dumps(value), expires_at, time.time()))
+                overflow = conn.execute('SELECT COUNT(*) FROM suggestion_cache').fetchone()[0] - self.max_persistent_entries
+                if overflow > 0:
+                    conn.execute('DELETE FROM suggestion_cache WHERE key IN ('
+                                 'SELECT key FROM suggestion_cache ORDER BY expires_at < ? DESC, last_access LIMIT ?)',
+                                 (time.time(), overflow))
+
+    def invalidate(self, decision_id, from_step=0):
+        """Drop cached suggestions for ``decision_id`` at step ``from_step`` or later."""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if entry[2] == decision_id and entry[3] is not None and entry[3] >= from_step]
+            for key in stale:
+                del self._entries[key]
+                self._discard_prefetch(key)
+            self.counters['invalidations'] += len(stale)
+        if self.persistent_path:
+            with self._connection() as conn:
+                conn.execute('DELETE FROM suggestion_cache WHERE decision_id = ? AND step >= ?',
+                             (decision_id, from_step))
+
+    def record_wasted_prefetch(self):
+        """Count a speculative model call whose result was never stored."""
+        with self._lock:
+            self.counters['prefetch_wasted'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters, size=len(self._entries), max_entries=self.max_entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['prefetch_hit_rate'] = stats['prefetch_hits'] / stats['prefetches'] if stats['prefetches'] else 0.0
+        return stats
+
+    def _store(self, key, value, expires_at, decision_id, step):
+        self._entries[key] = (expires_at, value, decision_id, step)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self.counters['evictions'] += 1
+            if not self.persistent_path:
+                # With a persistent tier the entry can still be read back from disk
+                self._discard_prefetch(evicted)
+
+    def _consume_prefetch(self, key):
+        if key in self._prefetched:
+            self._prefetched.remove(key)
+            self.counters['prefetch_hits'] += 1
+
+    def _discard_prefetch(self, key):
+        if key in self._prefetched:
+            self._prefetched.remove(key)
+            self.counters['prefetch_wasted'] += 1
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.persistent_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return _Transaction(conn)
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+        return False
@@ -0,0 +1,26 @@
+from json_repair import JsonRepairParser
+
+
+class SuggestionStreamParser(JsonRepairParser):
+    """Incrementally picks ``suggestion`` and ``pre_filled_data`` out of a streamed reply.
+
+    ``feed`` takes raw text chunks as they arrive from the model and returns a list
+    of ``(event, payload)`` tuples: ``('suggestion', text_delta)`` while the
+    suggestion string is being written and ``('pre_filled_data', dict)`` once the
+    object has been closed. ``finish`` returns the whole (repaired) reply.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.suggestion = ''
+        self.pre_filled_data = None
+
+    def on_string(self, path, text):
+        if path == ('suggestion',):
+            self.suggestion += text
+            self.events.append(('suggestion', text))
+
+    def on_value(self, path, value):
+        if path == ('pre_filled_data',) and isinstance(value, dict):
+            self.pre_filled_data = value
+            self.events.append(('pre_filled_data', value))
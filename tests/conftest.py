@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+import pytest
+
+# The app reads its configuration at import time
+_instance = tempfile.mkdtemp(prefix='decision-maker-tests-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(_instance, 'test.db')}",
+    'ADMISSION_DB_PATH': os.path.join(_instance, 'admission.db'),
+    'SINGLE_FLIGHT_LOCK_DIR': os.path.join(_instance, 'single_flight'),
+    'USE_FAKE_ANTHROPIC': '1',
+    'PREFETCH_SUGGESTIONS': '0',
+})
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app as app_module
+    with app_module.app.app_context():
+        app_module.db.create_all()
+    return app_module
+
+
+@pytest.fixture
+def login(app_module):
+    """``login(username)`` returns a test client signed in as a new user."""
+    def login(username):
+        client = app_module.app.test_client()
+        assert client.post('/register', json={'username': username, 'password': 'secret'}).status_code == 200
+        assert client.post('/login', json={'username': username, 'password': 'secret'}).status_code == 200
+        return client
+    return login
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionTimeout
+
+
+def controller(tmp_path, **limits):
+    options = {'max_concurrency': 0, 'requests_per_minute': 0, 'tokens_per_minute': 0, 'poll_interval': 0.01}
+    options.update(limits)
+    return AdmissionController(str(tmp_path / 'admission.db'), **options)
+
+
+def backdate_refill(admission, seconds):
+    with admission._transaction() as conn:
+        conn.execute('UPDATE admission_state SET refilled_at = refilled_at - ? WHERE id = 1', (seconds,))
+
+
+def test_request_bucket_refuses_when_empty_and_refills(tmp_path):
+    admission = controller(tmp_path, requests_per_minute=2)
+    for _ in range(2):
+        with admission.slot(1, 100, wait=0.1):
+            pass
+    with pytest.raises(AdmissionTimeout):
+        with admission.slot(1, 100, wait=0.1):
+            pass
+    assert admission.stats()['timeouts'] == 1
+
+    # Half a minute refills one of the two requests a minute
+    backdate_refill(admission, 30)
+    with admission.slot(1, 100, wait=0.1):
+        pass
+    with pytest.raises(AdmissionTimeout):
+        with admission.slot(1, 100, wait=0.1):
+            pass
+
+
+def test_token_bucket_and_settle(tmp_path):
+    admission = controller(tmp_path, tokens_per_minute=1000)
+    with admission.slot(1, 800, wait=0.1) as slot:
+        slot.settle(300)
+    # 500 of the 800 estimated tokens came back
+    with admission.slot(1, 700, wait=0.1):
+        pass
+    with pytest.raises(AdmissionTimeout):
+        with admission.slot(1, 100, wait=0.1):
+            pass
+
+
+def test_queue_is_fair_between_users(tmp_path):
+    admission = controller(tmp_path, max_concurrency=1)
+    admitted = []
+
+    def call(user_id, name):
+        with admission.slot(user_id, 1, wait=5):
+            admitted.append(name)
+            time.sleep(0.02)
+
+    threads = []
+    with admission.slot(1, 1, wait=1):
+        # User 1 (a) queues two more calls before user 2 (b) queues one
+        for user_id, name in ((1, 'a2'), (1, 'a3'), (2, 'b1')):
+            thread = threading.Thread(target=call, args=(user_id, name))
+            thread.start()
+            threads.append(thread)
+            deadline = time.monotonic() + 5
+            while admission.stats()['queue_depth'] < len(threads) and time.monotonic() < deadline:
+                time.sleep(0.005)
+    for thread in threads:
+        thread.join()
+    # b has not been served yet, so it goes ahead of a's backlog
+    assert admitted == ['b1', 'a2', 'a3']
@@ -0,0 +1,48 @@
+import random
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import compression
+from compression import ZLIB_HEADER, ZSTD_HEADER, compress, decompress, recompress_column
+
+TEXT = ('Weigh the long-term career growth against the cost of the bootcamp. ' * 40).encode('utf-8')
+
+
+@pytest.mark.parametrize('codec, header', [
+    ('zlib', ZLIB_HEADER),
+    pytest.param('zstd', ZSTD_HEADER, marks=pytest.mark.skipif(compression.zstandard is None,
+                                                               reason='zstandard is not installed')),
+])
+def test_round_trip(codec, header):
+    packed = compress(TEXT, codec)
+    assert packed[:1] == header and len(packed) < len(TEXT)
+    assert decompress(packed) == TEXT
+
+
+def test_short_and_incompressible_values_are_stored_plain():
+    assert compress(b'short', 'zlib') == b'short'
+    noise = random.Random(0).randbytes(2048)
+    assert compress(noise, 'zlib') == noise
+
+
+def test_decompress_accepts_legacy_values():
+    assert decompress('plain text') == b'plain text'
+    assert decompress(memoryview(b'{"a": 1}')) == b'{"a": 1}'
+
+
+def test_recompress_column_round_trip():
+    engine = create_engine('sqlite://')
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE note (id INTEGER PRIMARY KEY, body BLOB)"))
+        connection.execute(text("INSERT INTO note (id, body) VALUES (:id, :body)"),
+                           [{'id': 1, 'body': TEXT.decode('utf-8')}, {'id': 2, 'body': 'short'}, {'id': 3, 'body': None}])
+        rows, before, after = recompress_column(connection, 'note', 'body', 'zlib', batch_size=1)
+        assert rows == 2 and after < before
+        stored = dict(connection.execute(text("SELECT id, body FROM note")).fetchall())
+        assert stored[1][:1] == ZLIB_HEADER and decompress(stored[1]) == TEXT
+        assert stored[3] is None
+
+        recompress_column(connection, 'note', 'body', min_bytes=float('inf'))
+        stored = dict(connection.execute(text("SELECT id, body FROM note")).fetchall())
+        assert decompress(stored[1]) == TEXT and bytes(stored[2]) == b'short'
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import JSON
+
+from jobs import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    # A database of its own, so the app's job queue cannot claim these jobs
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'jobs.db'}"
+    db = SQLAlchemy(app)
+
+    class Job(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        kind = db.Column(db.String(50), nullable=False)
+        payload = db.Column(JSON, nullable=False, default={})
+        user_id = db.Column(db.Integer)
+        status = db.Column(db.String(20), nullable=False, default='pending')
+        attempts = db.Column(db.Integer, nullable=False, default=0)
+        run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+        locked_by = db.Column(db.String(100))
+        locked_until = db.Column(db.DateTime)
+        result = db.Column(JSON)
+        error = db.Column(db.Text)
+        created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+        finished_at = db.Column(db.DateTime)
+
+    with app.app_context():
+        db.create_all()
+        yield JobQueue(app, db, Job, max_attempts=2, backoff_base=0.01, lease_seconds=60, poll_interval=0.05)
+
+
+def add_job(queue, **columns):
+    job = queue.job_model(**dict({'kind': 'echo', 'payload': {}, 'status': 'pending', 'attempts': 0,
+                                  'run_at': datetime.utcnow()}, **columns))
+    queue.db.session.add(job)
+    queue.db.session.commit()
+    return job.id
+
+
+def test_expired_lease_is_claimed_again(queue):
+    past, future = datetime.utcnow() - timedelta(seconds=1), datetime.utcnow() + timedelta(seconds=60)
+    expired = add_job(queue, status='running', attempts=1, locked_by='elsewhere:1', locked_until=past)
+    held = add_job(queue, status='running', attempts=1, locked_by='elsewhere:1', locked_until=future)
+    assert queue._claim_jobs() == [expired]
+    queue.db.session.expire_all()
+    job = queue.db.session.get(queue.job_model, expired)
+    assert (job.status, job.attempts, job.locked_by) == ('running', 2, queue.worker_id)
+    assert job.locked_until > future - timedelta(seconds=5)
+    assert queue.db.session.get(queue.job_model, held).locked_by == 'elsewhere:1'
+
+
+def test_failed_job_is_retried_then_completed(queue):
+    failures = []
+
+    @queue.handler('flaky')
+    def flaky(payload):
+        if not failures:
+            failures.append(1)
+            raise RuntimeError('model unavailable')
+        return {'echo': payload['value']}
+
+    job = queue.wait(queue.enqueue('flaky', {'value': 3}).id, 5)
+    assert (job.status, job.attempts, job.result) == ('completed', 2, {'echo': 3})
+
+
+def test_job_without_handler_fails(queue):
+    job = queue.wait(queue.enqueue('unknown', {}).id, 5)
+    assert (job.status, job.attempts) == ('failed', 1)
+    assert 'No handler' in job.error
+
+
+def test_finished_jobs_are_pruned(queue):
+    old = add_job(queue, status='completed', finished_at=datetime.utcnow() - timedelta(days=30))
+    recent = add_job(queue, status='completed', finished_at=datetime.utcnow())
+    pending = add_job(queue)
+    queue._prune_finished_jobs()
+    remaining = {job.id for job in queue.job_model.query.all()}
+    assert old not in remaining and {recent, pending} <= remaining
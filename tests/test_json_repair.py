@@ -0,0 +1,37 @@
+import json
+import os
+
+import pytest
+
+from json_repair import JsonRepairParser, is_valid_json, load_json, repair_json
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'benchmarks', 'json_repair_corpus.json')
+
+with open(CORPUS_PATH) as f:
+    CORPUS = json.load(f)
+
+
+@pytest.mark.parametrize('case', CORPUS, ids=[case['name'] for case in CORPUS])
+def test_corpus(case):
+    assert repair_json(case['input']) == case['expected']
+
+
+@pytest.mark.parametrize('case', CORPUS, ids=[case['name'] for case in CORPUS])
+def test_chunked_parsing_matches_one_shot(case):
+    parser = JsonRepairParser()
+    text = case['input']
+    for start in range(0, len(text), 7):
+        parser.feed(text[start:start + 7])
+    assert parser.finish() == repair_json(text)
+
+
+def test_truncated_reply_is_closed():
+    assert load_json('{"suggestion": "Weigh the') == ({'suggestion': 'Weigh the'}, True)
+
+
+def test_valid_json_is_not_changed():
+    data = {'suggestion': 'a "quoted" word', 'pre_filled_data': {'options': [{'name': 'Stay', 'weight': 1.5}]}}
+    assert load_json(json.dumps(data)) == (data, False)
+    assert is_valid_json(json.dumps(data))
+    assert not is_valid_json('{"suggestion": ')
@@ -0,0 +1,41 @@
+from scoring import DecisionMatrix, competition_ranks, score_decision
+
+CRITERIA = [{'name': 'Cost', 'weight': 60}, {'name': 'Joy', 'weight': 40}]
+
+
+def options(evaluations, **kwargs):
+    matrix = DecisionMatrix.from_step_data(CRITERIA, evaluations)
+    return {option['name']: option for option in score_decision(matrix, 2000, **kwargs)['options']}
+
+
+def test_identical_options_share_wins_and_ranks():
+    result = options({'A': {'Cost': 4, 'Joy': 3}, 'B': {'Cost': 4, 'Joy': 3}, 'C': {'Cost': 1, 'Joy': 1}})
+    assert result['A']['win_rate'] == result['B']['win_rate'] == 0.5
+    assert result['A']['mean_rank'] == result['B']['mean_rank'] == 1.5
+    assert result['A']['rank'] == result['B']['rank'] == 1
+    assert (result['C']['win_rate'], result['C']['mean_rank'], result['C']['rank']) == (0.0, 3.0, 3)
+
+
+def test_unrated_options_tie():
+    matrix = DecisionMatrix.from_step_data(CRITERIA, {'A': {}, 'B': {}, 'C': {}, 'D': {}})
+    scores = score_decision(matrix, 1000)
+    assert [option['win_rate'] for option in scores['options']] == [0.25] * 4
+    assert [option['mean_rank'] for option in scores['options']] == [2.5] * 4
+    assert scores['stability'] == 0.25
+
+
+def test_ties_without_weight_variation():
+    # Equal scores only when the weights are not varied
+    result = options({'A': {'Cost': 3, 'Joy': 5}, 'B': {'Cost': 5, 'Joy': 2}}, spread=0)
+    assert result['A']['score'] == result['B']['score']
+    assert result['A']['win_rate'] == result['B']['win_rate'] == 0.5
+
+
+def test_clear_winner():
+    result = options({'A': {'Cost': 5, 'Joy': 5}, 'B': {'Cost': 2, 'Joy': 3}})
+    assert (result['A']['win_rate'], result['A']['mean_rank']) == (1.0, 1.0)
+    assert (result['B']['win_rate'], result['B']['mean_rank']) == (0.0, 2.0)
+
+
+def test_competition_ranks():
+    assert list(competition_ranks([50, 70, 50, 10])) == [2, 1, 2, 4]
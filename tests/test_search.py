@@ -0,0 +1,26 @@
+from sqlalchemy import create_engine, text
+
+from search import (SEARCH_TABLE, STEP_SEPARATOR, create_search_table, document_text, index_decision,
+                    steps_text, update_step_text)
+
+
+def indexed_steps(connection, decision_id):
+    return connection.execute(text(f"SELECT steps FROM {SEARCH_TABLE} WHERE rowid = :id"),
+                              {'id': decision_id}).scalar()
+
+
+def test_separator_in_user_text_does_not_shift_steps():
+    engine = create_engine('sqlite://')
+    with engine.begin() as connection:
+        create_search_table(connection)
+        steps = {0: {'context': f"first{STEP_SEPARATOR}sneaky"}, 1: {'key_areas': ['second']}}
+        index_decision(connection, 1, 7, 'Should I move?', steps=steps_text(steps))
+        assert indexed_steps(connection, 1).split(STEP_SEPARATOR) == ['first sneaky', 'second']
+
+        update_step_text(connection, 1, 1, {'key_areas': [f"replaced{STEP_SEPARATOR}again"]})
+        update_step_text(connection, 1, 3, {'notes': 'fourth'})
+        assert indexed_steps(connection, 1).split(STEP_SEPARATOR) == ['first sneaky', 'replaced again', '', 'fourth']
+
+
+def test_document_text_skips_numbers_and_keys():
+    assert document_text({'criteria': [{'name': 'Cost', 'weight': 60}], 'notes': ' '}) == 'Cost'
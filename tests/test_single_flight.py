@@ -0,0 +1,59 @@
+import threading
+import time
+
+from single_flight import SingleFlight
+
+
+def run_callers(single_flights, key='suggestion'):
+    """Call through ``single_flights`` (one caller each) at once; returns (calls made, results)."""
+    calls, results = [], []
+    barrier = threading.Barrier(len(single_flights))
+
+    def caller(single_flight):
+        barrier.wait()
+        with single_flight.flight(key) as flight:
+            if flight.shared:
+                results.append(flight.result)
+                return
+            calls.append(1)
+            time.sleep(0.2)
+            result = {'suggestion': f"call {len(calls)}"}
+            flight.publish(result)
+            results.append(result)
+
+    threads = [threading.Thread(target=caller, args=(single_flight,)) for single_flight in single_flights]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(calls), results
+
+
+def test_concurrent_callers_make_one_call():
+    single_flight = SingleFlight()
+    calls, results = run_callers([single_flight] * 8)
+    assert calls == 1
+    assert results == [{'suggestion': 'call 1'}] * 8
+    assert single_flight.stats()['coalesced'] == 7
+
+
+def test_callers_in_other_processes_share_the_result(tmp_path):
+    # Separate instances lock the same files as separate processes would
+    calls, results = run_callers([SingleFlight(str(tmp_path)) for _ in range(3)])
+    assert calls == 1
+    assert results == [{'suggestion': 'call 1'}] * 3
+
+
+def test_later_calls_are_not_coalesced():
+    single_flight = SingleFlight()
+    assert run_callers([single_flight])[0] == 1
+    assert run_callers([single_flight])[0] == 1
+
+
+def test_unpublished_call_is_made_again():
+    single_flight = SingleFlight()
+    with single_flight.flight('suggestion') as flight:
+        assert flight.leading
+    # Left without publishing: the next caller leads again
+    with single_flight.flight('suggestion') as flight:
+        assert flight.leading and not flight.shared
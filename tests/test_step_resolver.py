@@ -0,0 +1,41 @@
+from decision_framework import PERSONAL_DECISION_FRAMEWORK
+
+OPTIONS, EVALUATIONS = 2, 4
+
+
+def start_decision(client, options):
+    decision_id = client.post('/api/start_decision', json={'question': 'Which job?'}).json['decision_id']
+    response = client.post('/api/submit_step', json={
+        'decision_id': decision_id, 'step_index': OPTIONS, 'ai_suggestion': '',
+        'step_data': {'options': [{'name': name, 'description': ''} for name in options]},
+    })
+    assert response.status_code == 200, response.data
+    return decision_id
+
+
+def row_options(client, decision_id):
+    step = client.get(f'/api/get_step?decision_id={decision_id}&step={EVALUATIONS}').json['step']
+    return step['fields'][0]['row_options']
+
+
+def test_reused_decision_id_does_not_see_deleted_decision(login):
+    alice, bob = login('alice'), login('bob')
+    alice_decision = start_decision(alice, ['Alice secret job offer', 'Alice other'])
+    assert row_options(alice, alice_decision) == ['Alice secret job offer', 'Alice other']
+    assert alice.delete(f'/api/delete_decision/{alice_decision}').status_code == 200
+
+    bob_decision = start_decision(bob, ['Stay', 'Move'])
+    assert bob_decision == alice_decision  # SQLite reuses the deleted id
+    assert row_options(bob, bob_decision) == ['Stay', 'Move']
+
+
+def test_memo_is_keyed_on_creation_time(app_module):
+    from step_resolver import StepResolver
+    resolver = StepResolver(PERSONAL_DECISION_FRAMEWORK)
+    old = resolver.resolve(1, EVALUATIONS, ((OPTIONS, 1),), lambda: {'Identify Options': {'options': [{'name': 'A'}]}},
+                           created_at='2024-01-01')
+    new = resolver.resolve(1, EVALUATIONS, ((OPTIONS, 1),), lambda: {'Identify Options': {'options': [{'name': 'B'}]}},
+                           created_at='2024-01-02')
+    assert old['fields'][0]['row_options'] == ['A'] and new['fields'][0]['row_options'] == ['B']
+    resolver.invalidate(1)
+    assert resolver.stats()['size'] == 0
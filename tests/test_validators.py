@@ -0,0 +1,88 @@
+import pytest
+
+from decision_framework import PERSONAL_DECISION_FRAMEWORK
+from validators import MAX_ITEMS, MAX_TEXT_LENGTH, StepValidator
+
+KEY_AREAS, CRITERIA, EVALUATIONS = 1, 3, 4
+
+
+@pytest.fixture(scope='module')
+def validator():
+    return StepValidator(PERSONAL_DECISION_FRAMEWORK)
+
+
+def fields(errors):
+    return [error['field'] for error in errors]
+
+
+def test_valid_and_missing_fields(validator):
+    assert validator.validate(CRITERIA, {'criteria': [{'name': 'Cost', 'description': 'd', 'weight': 60}]}) == []
+    assert validator.validate(CRITERIA, {'criteria': None}) == []
+    assert validator.validate(CRITERIA, {}) == []
+
+
+def test_unknown_field_and_wrong_shape(validator):
+    assert fields(validator.validate(CRITERIA, {'colour': 'red'})) == ['colour']
+    assert fields(validator.validate(CRITERIA, [])) == ['']
+    assert fields(validator.validate(KEY_AREAS, {'key_areas': 'money'})) == ['key_areas']
+
+
+@pytest.mark.parametrize('weight, message', [
+    (-1, 'must be at least 0'),
+    (101, 'must be at most 100'),
+    (2.5, 'must be in steps of 1'),
+    ('60', 'must be a number'),
+    (True, 'must be a number'),
+    (float('nan'), 'must be a number'),
+])
+def test_number_limits(validator, weight, message):
+    errors = validator.validate(CRITERIA, {'criteria': [{'name': 'Cost', 'weight': weight}]})
+    assert errors == [{'field': 'criteria[0].weight', 'message': message}]
+
+
+def test_emptied_number_input_is_allowed(validator):
+    assert validator.validate(CRITERIA, {'criteria': [{'name': 'Cost', 'weight': ''}]}) == []
+
+
+def test_matrix_cells(validator):
+    assert validator.validate(EVALUATIONS, {'evaluations': {'Stay': {'Cost': 5, 'Joy': 1}}}) == []
+    errors = validator.validate(EVALUATIONS, {'evaluations': {'Stay': {'Cost': 0}, 'Move': 3}})
+    assert fields(errors) == ['evaluations.Stay.Cost', 'evaluations.Move']
+
+
+def test_list_and_text_sizes(validator):
+    assert validator.validate(KEY_AREAS, {'key_areas': ['a'] * MAX_ITEMS}) == []
+    assert fields(validator.validate(KEY_AREAS, {'key_areas': ['a'] * (MAX_ITEMS + 1)})) == ['key_areas']
+    assert fields(validator.validate(KEY_AREAS, {'key_areas': ['a' * (MAX_TEXT_LENGTH + 1)]})) == ['key_areas[0]']
+
+
+def test_total_weight(validator):
+    assert validator.validate(CRITERIA, {'criteria': [{'name': 'a', 'weight': 60}, {'name': 'b', 'weight': 40}]}) == []
+    errors = validator.validate(CRITERIA, {'criteria': [{'name': 'a', 'weight': 60}, {'name': 'b', 'weight': 41}]})
+    assert errors == [{'field': 'criteria', 'message': 'The sum of all weights must not exceed 100.'}]
+
+
+def test_clean_converts_numeric_strings(validator):
+    cleaned, errors = validator.clean(CRITERIA, {'criteria': [{'name': 'a', 'weight': 40}, {'name': 'b', 'weight': '60'}]})
+    assert cleaned == {'criteria': [{'name': 'a', 'weight': 40}, {'name': 'b', 'weight': 60}]}
+    assert errors == []
+
+
+def test_clean_drops_only_the_invalid_parts(validator):
+    cleaned, errors = validator.clean(CRITERIA, {'criteria': [
+        {'name': 'a', 'weight': 'heavy', 'colour': 'red'},
+        {'name': 'b', 'weight': 30},
+        42,
+    ]})
+    assert cleaned == {'criteria': [{'name': 'a'}, {'name': 'b', 'weight': 30}]}
+    assert sorted(fields(errors)) == ['criteria[0].colour', 'criteria[0].weight', 'criteria[2]']
+
+    cleaned, errors = validator.clean(EVALUATIONS, {'evaluations': {'A': {'Cost': '4', 'Joy': 9}, 'B': 3}})
+    assert cleaned == {'evaluations': {'A': {'Cost': 4}}}
+    assert sorted(fields(errors)) == ['evaluations.A.Joy', 'evaluations.B']
+
+
+def test_clean_drops_a_field_that_breaks_a_rule(validator):
+    cleaned, errors = validator.clean(CRITERIA, {'criteria': [{'name': 'a', 'weight': 70}, {'name': 'b', 'weight': 70}]})
+    assert cleaned == {}
+    assert fields(errors) == ['criteria']
@@ -0,0 +1,344 @@
+import math
+
+# Limits for fields the framework leaves unbounded
+MAX_TEXT_LENGTH = 20000
+MAX_ITEMS = 200
+
+# Returned by cleaners for a value that has nothing worth keeping
+_DROP = object()
+
+
+def error(path, message):
+    return {'field': path, 'message': message}
+
+
+class StepValidator:
+    """Checks step data against the field specs of the framework.
+
+    Every step's fields are compiled once into closures that check a value in
+    place and append ``{'field': path, 'message': ...}`` errors, so validating
+    never reads the framework. Fields that are missing or ``null`` count as not
+    filled in yet; fields the step does not have are errors. ``validate``
+    reports every error in the data; ``clean`` keeps what passes, for AI
+    ``pre_filled_data`` that is partly usable.
+
+    The framework's ``dependencies`` are not checked: which options exist
+    depends on other steps and may legitimately change after this one is saved.
+    """
+
+    def __init__(self, framework):
+        compiled = [{field['name']: _compile_field(field) for field in step['fields']}
+                    for step in framework['steps']]
+        self._steps = [{name: check for name, (check, _) in fields.items()} for fields in compiled]
+        self._cleaners = [{name: clean for name, (_, clean) in fields.items()} for fields in compiled]
+
+    def validate(self, step_index, data):
+        """Return the list of errors in ``data`` for step ``step_index`` (empty if it is valid)."""
+        if not isinstance(data, dict):
+            return [error('', 'must be an object')]
+        fields = self._steps[step_index]
+        errors = []
+        for name, value in data.items():
+            check = fields.get(name)
+            if check is None:
+                errors.append(error(name, 'is not a field of this step'))
+            elif value is not None:
+                check(value, name, errors)
+        return errors
+
+    def clean(self, step_index, data):
+        """Return ``(data with the invalid parts left out, errors)``.
+
+        Numbers given as numeric strings (``"40"``) are converted. Invalid list
+        items, object attributes and matrix cells are left out one by one, so
+        one bad value does not cost the rest of the field; a field is only left
+        out whole if it has the wrong shape or breaks a rule such as
+        ``total_weight``.
+        """
+        if not isinstance(data, dict):
+            return {}, [error('', 'must be an object')]
+        fields = self._cleaners[step_index]
+        cleaned, errors = {}, []
+        for name, value in data.items():
+            clean = fields.get(name)
+            if clean is None:
+                errors.append(error(name, 'is not a field of this step'))
+                continue
+            if value is not None:
+                value = clean(value, name, errors)
+            if value is not _DROP:
+                cleaned[name] = value
+        return cleaned, errors
+
+
+def _compile_field(field):
+    compile_type = FIELD_TYPES.get(field['type'])
+    if compile_type is None:
+        raise ValueError(f"Field {field['name']!r} has unknown type {field['type']!r}")
+    check, clean = compile_type(field)
+    rules = [_compile_rule(name, rule, field) for name, rule in field.get('validation', {}).items()]
+    if not rules:
+        return check, clean
+
+    def check_with_rules(value, path, errors):
+        count = len(errors)
+        check(value, path, errors)
+        # Rules assume the value has the right shape
+        if len(errors) == count:
+            for rule in rules:
+                rule(value, path, errors)
+
+    def clean_with_rules(value, path, errors):
+        value = clean(value, path, errors)
+        if value is _DROP:
+            return value
+        count = len(errors)
+        for rule in rules:
+            rule(value, path, errors)
+        return value if len(errors) == count else _DROP
+    return check_with_rules, clean_with_rules
+
+
+def _compile_rule(name, rule, field):
+    compile_rule = VALIDATION_RULES.get(name)
+    if compile_rule is None:
+        raise ValueError(f"Field {field['name']!r} has unknown validation rule {name!r}")
+    return compile_rule(rule, field)
+
+
+def _text_message(value):
+    if not isinstance(value, str):
+        return 'must be a string'
+    if len(value) > MAX_TEXT_LENGTH:
+        return f"must be at most {MAX_TEXT_LENGTH} characters"
+    return None
+
+
+def _number_message(spec):
+    # Leaf checks return a message (or None) so valid values never build a path
+    low, high, step = spec.get('min'), spec.get('max'), spec.get('step')
+    base = low or 0
+    whole_steps = isinstance(step, int) and isinstance(base, int)
+
+    def message(value):
+        if value == '' or value is None:
+            return None  # an emptied number input
+        kind = type(value)
+        if kind is not int and (kind is not float or not math.isfinite(value)):
+            return 'must be a number'
+        if low is not None and value < low:
+            return f"must be at least {low}"
+        if high is not None and value > high:
+            return f"must be at most {high}"
+        if step:
+            if kind is int and whole_steps:
+                off_step = (value - base) % step
+            else:
+                steps = (value - base) / step
+                off_step = not math.isclose(steps, round(steps), abs_tol=1e-9)
+            if off_step:
+                return f"must be in steps of {step}"
+        return None
+    return message
+
+
+def _as_number(value):
+    """``value`` as a number if it is a numeric string, else unchanged."""
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        if math.isfinite(number):
+            return int(number) if number.is_integer() else number
+    return value
+
+
+def _number_cleaner(spec):
+    message = _number_message(spec)
+
+    def clean(value):
+        value = _as_number(value)
+        return value, message(value)
+    return clean
+
+
+def _text_cleaner(value):
+    return value, _text_message(value)
+
+
+def _leaf(message):
+    def check(value, path, errors):
+        problem = message(value)
+        if problem:
+            errors.append(error(path, problem))
+
+    def clean(value, path, errors):
+        problem = message(value)
+        if problem:
+            errors.append(error(path, problem))
+            return _DROP
+        return value
+    return check, clean
+
+
+def _too_many(value, path, errors, what='items'):
+    """Report a list or object over MAX_ITEMS; cleaners keep the first MAX_ITEMS."""
+    if len(value) > MAX_ITEMS:
+        errors.append(error(path, f"must have at most {MAX_ITEMS} {what}"))
+
+
+def _text(field):
+    return _leaf(_text_message)
+
+
+def _list(field):
+    def check(value, path, errors):
+        if not isinstance(value, list):
+            errors.append(error(path, 'must be a list of strings'))
+        elif len(value) > MAX_ITEMS:
+            errors.append(error(path, f"must have at most {MAX_ITEMS} items"))
+        else:
+            for i, item in enumerate(value):
+                problem = _text_message(item)
+                if problem:
+                    errors.append(error(f"{path}[{i}]", problem))
+
+    def clean(value, path, errors):
+        if not isinstance(value, list):
+            errors.append(error(path, 'must be a list of strings'))
+            return _DROP
+        _too_many(value, path, errors)
+        items = []
+        for i, item in enumerate(value[:MAX_ITEMS]):
+            problem = _text_message(item)
+            if problem:
+                errors.append(error(f"{path}[{i}]", problem))
+            else:
+                items.append(item)
+        return items
+    return check, clean
+
+
+def _list_of_objects(field):
+    structure = field['object_structure']
+    attributes = {name: _text_message if isinstance(spec, str) else _number_message(spec)
+                  for name, spec in structure.items()}
+    cleaners = {name: _text_cleaner if isinstance(spec, str) else _number_cleaner(spec)
+                for name, spec in structure.items()}
+
+    def check(value, path, errors):
+        if not isinstance(value, list):
+            errors.append(error(path, 'must be a list of objects'))
+        elif len(value) > MAX_ITEMS:
+            errors.append(error(path, f"must have at most {MAX_ITEMS} items"))
+        else:
+            for i, item in enumerate(value):
+                if not isinstance(item, dict):
+                    errors.append(error(f"{path}[{i}]", 'must be an object'))
+                    continue
+                for name, attribute in item.items():
+                    message = attributes.get(name)
+                    if message is None:
+                        errors.append(error(f"{path}[{i}].{name}", 'is not an attribute of this field'))
+                    elif attribute is not None:
+                        problem = message(attribute)
+                        if problem:
+                            errors.append(error(f"{path}[{i}].{name}", problem))
+
+    def clean(value, path, errors):
+        if not isinstance(value, list):
+            errors.append(error(path, 'must be a list of objects'))
+            return _DROP
+        _too_many(value, path, errors)
+        items = []
+        for i, item in enumerate(value[:MAX_ITEMS]):
+            if not isinstance(item, dict):
+                errors.append(error(f"{path}[{i}]", 'must be an object'))
+                continue
+            kept = {}
+            for name, attribute in item.items():
+                clean_attribute = cleaners.get(name)
+                if clean_attribute is None:
+                    errors.append(error(f"{path}[{i}].{name}", 'is not an attribute of this field'))
+                    continue
+                if attribute is not None:
+                    attribute, problem = clean_attribute(attribute)
+                    if problem:
+                        errors.append(error(f"{path}[{i}].{name}", problem))
+                        continue
+                kept[name] = attribute
+            if kept:
+                items.append(kept)
+        return items
+    return check, clean
+
+
+def _matrix(field):
+    cell_message = _number_message(field['cell_format'])
+    clean_cell = _number_cleaner(field['cell_format'])
+
+    def check(value, path, errors):
+        if not isinstance(value, dict):
+            errors.append(error(path, 'must be an object of rows'))
+            return
+        if len(value) > MAX_ITEMS:
+            errors.append(error(path, f"must have at most {MAX_ITEMS} rows"))
+            return
+        for row_name, row in value.items():
+            if not isinstance(row, dict):
+                errors.append(error(f"{path}.{row_name}", 'must be an object'))
+            elif len(row) > MAX_ITEMS:
+                errors.append(error(f"{path}.{row_name}", f"must have at most {MAX_ITEMS} columns"))
+            else:
+                for column, cell in row.items():
+                    problem = cell_message(cell)
+                    if problem:
+                        errors.append(error(f"{path}.{row_name}.{column}", problem))
+
+    def clean(value, path, errors):
+        if not isinstance(value, dict):
+            errors.append(error(path, 'must be an object of rows'))
+            return _DROP
+        _too_many(value, path, errors, 'rows')
+        rows = {}
+        for row_name, row in list(value.items())[:MAX_ITEMS]:
+            if not isinstance(row, dict):
+                errors.append(error(f"{path}.{row_name}", 'must be an object'))
+                continue
+            _too_many(row, f"{path}.{row_name}", errors, 'columns')
+            cells = {}
+            for column, cell in list(row.items())[:MAX_ITEMS]:
+                cell, problem = clean_cell(cell)
+                if problem:
+                    errors.append(error(f"{path}.{row_name}.{column}", problem))
+                else:
+                    cells[column] = cell
+            rows[row_name] = cells
+        return rows
+    return check, clean
+
+
+def _total_weight(rule, field):
+    maximum = rule['max']
+    message = rule.get('message') or f"The sum of all weights must not exceed {maximum}."
+
+    def check(items, path, errors):
+        total = sum(item.get('weight') or 0 for item in items)
+        if total > maximum:
+            errors.append(error(path, message))
+    return check
+
+
+FIELD_TYPES = {
+    'text': _text,
+    'textarea': _text,
+    'select': _text,
+    'list': _list,
+    'list_of_objects': _list_of_objects,
+    'matrix': _matrix,
+}
+
+VALIDATION_RULES = {
+    'total_weight': _total_weight,
+}